@@ -1,30 +1,42 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
+from pydantic import BaseModel
+from typing import List, Optional
 import cv2
 import datetime
 import os
 import sys
-import pandas as pd
 import json
-from io import BytesIO
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
 
 # Add paths for imports
 backend_dir = os.path.dirname(os.path.dirname(__file__))
 sys.path.insert(0, os.path.join(backend_dir, 'services'))
 sys.path.insert(0, os.path.join(backend_dir, 'models'))
 sys.path.insert(0, os.path.join(backend_dir, 'auth'))
+if backend_dir not in sys.path:
+    sys.path.append(backend_dir)   # routes/ and the auth package
 
-import camera_feed
-import tracking
 import zones
+import frame_cache
+import response_cache
+import alerts
+import rolling_stats
+import live_state
+import metrics
+import profiler
+import reanalysis
+import trajectory_store
+from pacing import FramePacer
+from history_buffer import HistoryBuffer
 import database as db
-import auth_service as auth
+try:
+    # Same module instance as the routes package, so they share the token cache
+    from auth import auth_service as auth
+except ImportError:
+    import auth_service as auth
 
 app = FastAPI(title="CrowdCount - Infosys API", version="1.0")
 
@@ -52,6 +64,11 @@ if os.path.exists(frontend_path):
 else:
     print(f"❌ Frontend directory not found at: {frontend_path}")
 
+# History pages, archive queries, report jobs and storage administration live in the routes package
+from routes import admin_router, analytics_routes
+app.include_router(analytics_routes.router)
+app.include_router(admin_router)
+
 # Global state
 live_count = {
     "total_people": 0,
@@ -60,7 +77,30 @@ live_count = {
     "heat_timestamps": []
 }
 
-history_log = []  # For CSV export
+# Set when this is one of several API workers (run.py --workers N): live data
+# is then read from the pipeline process through shared memory
+live_store = live_state.from_env()
+if live_store is not None and live_store.writable:
+    live_store = None
+
+# Per-frame history for CSV export: bounded in memory, older entries spill to shared/history/
+if live_store is not None:
+    history_log = HistoryBuffer.attach(live_store.history_buffer)
+    frame_cache.use_store(live_store)
+    response_cache.cache = response_cache.ResponseCache(version=live_state.shared_version(live_store))
+    live_state.start_worker_sync(live_store)
+    # A logout handled by this worker must reach the other workers' token caches
+    auth.share_revocations(lambda: live_store.counter("revocation_version"),
+                           lambda: live_store.bump("revocation_version"))
+else:
+    history_log = HistoryBuffer()
+    metrics.watch_database()
+
+def current_count():
+    """Counts of the newest frame, from this process or the pipeline process"""
+    if live_store is not None:
+        return live_store.read_json("counts") or live_count
+    return live_count
 
 # ==================== PUBLIC ENDPOINTS ====================
 
@@ -71,9 +111,11 @@ def home():
         "version": "1.0",
         "endpoints": {
             "auth": ["/login"],
-            "public": ["/get_count", "/video_feed"],
-            "protected": ["/export_csv", "/export_pdf", "/thresholds", "/analytics"],
-            "admin": ["/set_threshold", "/zones"]
+            "public": ["/get_count", "/video_feed", "/snapshot/{camera_id}", "/metrics"],
+            "protected": ["/export_csv", "/export_pdf", "/thresholds", "/analytics", "/analytics/history",
+                          "/alerts"],
+            "admin": ["/set_threshold", "/zones", "/profiling", "/reanalysis", "/trajectories",
+                      "/admin/storage", "/admin/retention/run"]
         }
     }
 
@@ -99,13 +141,20 @@ def login(login_data: auth.LoginRequest):
         "username": user["username"]
     }
 
+@app.post("/logout")
+def logout(credentials: HTTPAuthorizationCredentials = Depends(auth.security),
+           current_user: auth.User = Depends(auth.get_current_user)):
+    """Revoke the current token"""
+    auth.revoke_token(credentials.credentials)
+    return {"message": f"User {current_user.username} logged out successfully"}
+
 @app.get("/get_count")
 def get_count():
     """Get current crowd count (public endpoint)"""
-    return live_count
+    return current_count()
 
-# Shared frame buffer for video feed (updated by main.py)
-latest_frame = None
+# Video pipeline runtime when one runs in this process (set by run.py)
+pipeline = None
 
 @app.get("/video_feed")
 def video_feed():
@@ -117,44 +166,49 @@ def video_feed():
     def generate():
         print("=== GENERATOR STARTED ===")
         frame_count = 0
-        while True:
-            try:
-                # Use the latest processed frame from main.py
-                global latest_frame
-                
-                if latest_frame is not None:
-                    frame_count += 1
-                    if frame_count % 30 == 0:  # Log every 30 frames
-                        print(f"Streaming frame {frame_count}, shape: {latest_frame.shape}")
+        # Deadline pacing: encoding time is not added on top of the frame interval
+        pacer = FramePacer(30)
+        with metrics.STREAM_CLIENTS.track(stream="video_feed"):
+            while True:
+                pacer.wait()
+                try:
+                    # Latest annotated frame from the pipeline's render stage
+                    latest_frame = frame_cache.get_frame()
+
+                    if latest_frame is not None:
+                        frame_count += 1
+                        if frame_count % 30 == 0:  # Log every 30 frames
+                            print(f"Streaming frame {frame_count}, shape: {latest_frame.shape}")
                     
-                    # Resize for web streaming
-                    frame_to_send = cv2.resize(latest_frame, (854, 480))
-                    ret, buffer = cv2.imencode('.jpg', frame_to_send, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                    if ret:
-                        frame_bytes = buffer.tobytes()
-                        yield (b'--frame\r\n'
-                               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+                        # Resize for web streaming
+                        frame_to_send = cv2.resize(latest_frame, (854, 480))
+                        with metrics.JPEG_ENCODE_SECONDS.time(endpoint="video_feed"):
+                            ret, buffer = cv2.imencode('.jpg', frame_to_send, [cv2.IMWRITE_JPEG_QUALITY, 85])
+                        if ret:
+                            frame_bytes = buffer.tobytes()
+                            yield (b'--frame\r\n'
+                                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+                        else:
+                            print("ERROR: Failed to encode frame")
                     else:
-                        print("ERROR: Failed to encode frame")
-                else:
-                    # Send a placeholder frame if no data yet
-                    if frame_count == 0:
-                        print("No frame available yet, sending placeholder")
-                    placeholder = np.zeros((480, 854, 3), dtype=np.uint8)
-                    cv2.putText(placeholder, "Waiting for video feed...", (200, 240),
-                               cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
-                    ret, buffer = cv2.imencode('.jpg', placeholder)
-                    if ret:
-                        frame_bytes = buffer.tobytes()
-                        yield (b'--frame\r\n'
-                               b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
+                        # Send a placeholder frame if no data yet
+                        if frame_count == 0:
+                            print("No frame available yet, sending placeholder")
+                        placeholder = np.zeros((480, 854, 3), dtype=np.uint8)
+                        cv2.putText(placeholder, "Waiting for video feed...", (200, 240),
+                                   cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+                        ret, buffer = cv2.imencode('.jpg', placeholder)
+                        if ret:
+                            frame_bytes = buffer.tobytes()
+                            yield (b'--frame\r\n'
+                                   b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
                 
-                time.sleep(0.033)  # ~30 FPS
-            except Exception as e:
-                print(f"=== VIDEO FEED ERROR: {e} ===")
-                import traceback
-                traceback.print_exc()
-                time.sleep(0.1)
+                    pacer.tick()
+                except Exception as e:
+                    print(f"=== VIDEO FEED ERROR: {e} ===")
+                    import traceback
+                    traceback.print_exc()
+                    time.sleep(0.1)
 
     try:
         return StreamingResponse(generate(), media_type="multipart/x-mixed-replace; boundary=frame")
@@ -164,105 +218,113 @@ def video_feed():
         traceback.print_exc()
         raise
 
+@app.get("/snapshot/{camera_id}")
+def snapshot(camera_id: int, request: Request, variant: str = "annotated"):
+    """Latest still image of a camera (raw or annotated), with conditional GET support"""
+    if variant not in frame_cache.VARIANTS:
+        raise HTTPException(status_code=400, detail=f"variant must be one of {list(frame_cache.VARIANTS)}")
+
+    snap = frame_cache.get_snapshot(camera_id, variant)
+    if snap is None:
+        raise HTTPException(status_code=404, detail="No frame available yet")
+
+    headers = frame_cache.snapshot_headers(snap)
+    if frame_cache.is_not_modified(snap, request.headers.get("if-none-match"),
+                                   request.headers.get("if-modified-since")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snap["jpeg"], media_type="image/jpeg", headers=headers)
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Prometheus metrics: per-stage latency histograms, queues, drops, stream clients, DB batches"""
+    if live_store is None:
+        return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+    # Pipeline and database metrics come from the pipeline process; this
+    # worker adds only what it records itself, labelled with its pid
+    shared = live_store.read_json("metrics") or ""
+    local = metrics.render({"worker": os.getpid()}, only=metrics.WORKER_METRICS)
+    return Response(content=shared + local, media_type=metrics.CONTENT_TYPE)
+
 
 # ==================== PROTECTED ENDPOINTS (Require Login) ====================
 
 @app.get("/export_csv")
-def export_csv(current_user: auth.User = Depends(auth.require_admin)):
-    """Export historical data as CSV (Admin only)"""
-    if not history_log:
-        df = pd.DataFrame(columns=["timestamp", "total_people"] + list(live_count["zones"].keys()))
-    else:
-        df = pd.DataFrame(history_log)
-
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"crowd_report_{timestamp}.csv"
-    file_path = os.path.join(os.path.dirname(__file__), filename)
-    df.to_csv(file_path, index=False)
+def export_csv(start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None,
+               camera_id: Optional[int] = None, gzip: bool = False,
+               current_user: auth.User = Depends(auth.require_admin)):
+    """
+    Export historical data as CSV, streamed from a database cursor (Admin only)
+    Optional time range / camera filter; gzip=true downloads a .csv.gz
+    """
+    return analytics_routes.export_csv(start, end, camera_id, gzip, current_user)
 
-    return FileResponse(file_path, media_type="text/csv", filename=filename)
+EXPORT_PDF_WAIT = 30.0   # seconds /export_pdf waits for a report that is not cached yet
 
 @app.get("/export_pdf")
-def export_pdf(current_user: auth.User = Depends(auth.require_admin)):
-    """Export professional PDF report with statistics (Admin only)"""
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"crowd_report_{timestamp}.pdf"
-    file_path = os.path.join(os.path.dirname(__file__), filename)
-    
-    # Create PDF
-    doc = SimpleDocTemplate(file_path, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-    
-    # Title
-    title = Paragraph("<b>CrowdCount - Infosys</b><br/>Crowd Analytics Report", styles['Title'])
-    elements.append(title)
-    elements.append(Spacer(1, 20))
-    
-    # Report Info
-    info = Paragraph(f"<b>Generated:</b> {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}<br/>"
-                     f"<b>Generated By:</b> {current_user.username} ({current_user.role})<br/>"
-                     f"<b>Total People (Current):</b> {live_count['total_people']}", 
-                     styles['Normal'])
-    elements.append(info)
-    elements.append(Spacer(1, 20))
-    
-    # Zone Summary Table
-    zone_data = [["Zone Name", "Current Count", "Threshold"]]
-    thresholds = db.get_all_thresholds()
-    for zone_name, count in live_count["zones"].items():
-        threshold = thresholds.get(zone_name, {}).get("max_capacity", 30)
-        zone_data.append([zone_name, str(count), str(threshold)])
-    
-    table = Table(zone_data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    elements.append(table)
-    elements.append(Spacer(1, 20))
-    
-    # Historical Summary
-    if history_log:
-        recent = history_log[-10:]
-        hist_data = [["Timestamp", "Total People"]]
-        for entry in recent:
-            hist_data.append([entry["timestamp"], str(entry["total_people"])])
-        
-        hist_table = Table(hist_data)
-        hist_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        elements.append(Paragraph("<b>Recent Activity (Last 10 Entries)</b>", styles['Heading2']))
-        elements.append(Spacer(1, 10))
-        elements.append(hist_table)
-    
-    doc.build(elements)
-    return FileResponse(file_path, media_type="application/pdf", filename=filename)
+def export_pdf(start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None,
+               current_user: auth.User = Depends(auth.require_admin)):
+    """
+    PDF report for a time range (default: the last 24 hours) (Admin only)
+    Rendered on the report job queue and cached on disk; a report still
+    rendering after EXPORT_PDF_WAIT seconds is returned as a 202 with its job ID
+    """
+    return analytics_routes.export_pdf(start, end, EXPORT_PDF_WAIT, current_user)
 
 @app.get("/thresholds")
 def get_thresholds(current_user: auth.User = Depends(auth.get_current_user)):
     """Get all zone thresholds"""
-    return db.get_all_thresholds()
+    return response_cache.cached("thresholds", (), db.get_all_thresholds)
+
+@app.get("/pipeline/stats")
+def get_pipeline_stats(current_user: auth.User = Depends(auth.require_admin)):
+    """Per-stage timings, queue depths and dropped frames of the video pipeline (Admin only)"""
+    stats = live_store.read_json("pipeline") if live_store is not None else (pipeline and pipeline.get_stats())
+    if stats is None:
+        raise HTTPException(status_code=404, detail="No video pipeline running")
+    return stats
+
+@app.get("/stats/live")
+def get_live_stats(zone: str = None, current_user: auth.User = Depends(auth.get_current_user)):
+    """Rolling 1m/15m/1h occupancy statistics, computed in memory from the live feed"""
+    if live_store is None:
+        return {"windows": list(rolling_stats.WINDOWS), **rolling_stats.snapshot(zone)}
+    snap = live_store.read_json("stats") or {"total": None, "zones": {}}
+    if zone is not None:
+        snap = {"zones": {zone: snap["zones"].get(zone)}}
+    return {"windows": list(rolling_stats.WINDOWS), **snap}
+
+@app.get("/alerts")
+def get_alerts(zone: str = None, limit: int = 100,
+               current_user: auth.User = Depends(auth.get_current_user)):
+    """Stored capacity alert events, newest first"""
+    return {"events": db.get_alert_events(zone_name=zone, limit=min(limit, 1000))}
+
+@app.get("/alerts/active")
+def get_active_alerts(current_user: auth.User = Depends(auth.get_current_user)):
+    """Zones currently over capacity, per camera"""
+    if live_store is not None:
+        state = live_store.read_json("alerts") or {"active": {}, "recent": []}
+        return {"active": state["active"], "recent": state["recent"][-20:]}
+    return {"active": alerts.active_alerts(), "recent": alerts.recent_events(20)}
+
+@app.get("/alerts/stream")
+def stream_alerts(current_user: auth.User = Depends(auth.get_current_user)):
+    """Server-Sent Events stream of alerts as they are raised and cleared"""
+    events = live_state.stream_alert_events(live_store) if live_store is not None else alerts.stream_events()
+    return StreamingResponse(metrics.track_stream(events, "alerts"), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
 
 @app.get("/analytics")
 def get_analytics(current_user: auth.User = Depends(auth.get_current_user)):
     """Get analytics data from database"""
-    recent_logs = db.get_recent_logs(limit=50)
-    return {
-        "recent_logs": recent_logs,
-        "total_entries": len(recent_logs)
-    }
+    def compute():
+        recent_logs = db.get_recent_logs(limit=50)
+        return {
+            "recent_logs": recent_logs,
+            "total_entries": len(recent_logs)
+        }
+    return response_cache.cached("analytics/data", (), compute)
 
 # ==================== ADMIN ONLY ENDPOINTS ====================
 
@@ -273,23 +335,127 @@ def set_threshold(zone_name: str, max_capacity: int,
     db.set_threshold(zone_name, max_capacity)
     return {"message": f"Threshold for {zone_name} set to {max_capacity}"}
 
+@app.post("/profiling/start")
+def start_profiling(duration: float = profiler.DEFAULT_DURATION, sample: bool = False,
+                    interval_ms: float = profiler.SAMPLE_INTERVAL * 1000,
+                    current_user: auth.User = Depends(auth.require_admin)):
+    """Record per-frame stage spans (and optionally stack samples) for `duration` seconds (Admin only)"""
+    if live_store is not None:
+        raise HTTPException(status_code=409,
+                            detail="The pipeline runs in another process; profile without --workers")
+    prefix = f"{pipeline.name}-" if pipeline is not None else None
+    try:
+        return profiler.start(duration, sample, interval_ms / 1000.0, thread_prefix=prefix)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/profiling/stop")
+def stop_profiling(current_user: auth.User = Depends(auth.require_admin)):
+    """End the running session early and return its summary (Admin only)"""
+    summary = profiler.stop()
+    if summary is None:
+        raise HTTPException(status_code=404, detail="No profiling session has run")
+    return summary
+
+@app.get("/profiling")
+def get_profiling(current_user: auth.User = Depends(auth.require_admin)):
+    """Current session and downloadable artifacts of past ones (Admin only)"""
+    return {"status": profiler.status(), "sessions": profiler.list_sessions()}
+
+@app.get("/profiling/{session_id}/{artifact}")
+def download_profile(session_id: str, artifact: str, current_user: auth.User = Depends(auth.require_admin)):
+    """trace.json (chrome://tracing, Perfetto), stacks.folded (flame graphs) or summary.json (Admin only)"""
+    path = profiler.artifact_path(session_id, artifact)
+    if path is None:
+        raise HTTPException(status_code=404, detail="No such profiling artifact")
+    media_type = "text/plain" if artifact.endswith(".folded") else "application/json"
+    return FileResponse(path, media_type=media_type, filename=f"crowdcount-{session_id}-{artifact}")
+
 @app.get("/zones")
 def get_zones(current_user: auth.User = Depends(auth.require_admin)):
     """Get all zones configuration (Admin only)"""
-    from zones import zones
-    return {"zones": zones}
+    if live_store is not None:
+        # Zones are edited in the pipeline process; its saved file is the source of truth
+        zones.load_zones()
+    return {"zones": zones.zones}
+
+TRAJECTORY_TRACK_LIMIT = 1000
+
+@app.get("/trajectories")
+def get_trajectories(start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None,
+                     track_id: Optional[List[int]] = Query(None), camera_id: int = db.DEFAULT_CAMERA_ID,
+                     limit: int = 200, current_user: auth.User = Depends(auth.require_admin)):
+    """
+    Paths of tracked people in [start, end) (UTC, default: the last 5 minutes)
+    as [t, cx, cy, w, h] points, t in unix seconds (Admin only)
+    """
+    end = db.naive_utc(end) or datetime.datetime.utcnow()
+    start = db.naive_utc(start) or end - datetime.timedelta(minutes=5)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    limit = max(1, min(limit, TRAJECTORY_TRACK_LIMIT))
+    # In worker mode only written segments are visible here; the newest minute is in the pipeline process
+    store = trajectory_store.get_store(camera_id)
+    paths = store.paths(start.replace(tzinfo=datetime.timezone.utc).timestamp(),
+                        end.replace(tzinfo=datetime.timezone.utc).timestamp(), track_id, limit)
+    return {
+        "camera_id": camera_id,
+        "tracks": [{"id": tid, "points": points} for tid, points in paths.items()],
+        "store": store.stats(),
+    }
+
+class ReanalysisRequest(BaseModel):
+    start: datetime.datetime
+    end: datetime.datetime
+    camera_id: int = db.DEFAULT_CAMERA_ID
+    bucket_seconds: int = reanalysis.DEFAULT_BUCKET
+    zones: Optional[List[dict]] = None   # [{"name", "points"}]; default: the current zones
+
+@app.post("/reanalysis")
+def start_reanalysis(request: ReanalysisRequest, current_user: auth.User = Depends(auth.require_admin)):
+    """
+    Recompute past zone counts from recorded trajectories under a zone set
+    (Admin only). Runs in the background; poll /reanalysis/{run_id}
+    """
+    if request.zones is None:
+        zones.load_zones()
+    zone_list = request.zones if request.zones is not None else zones.zones
+    try:
+        run_id = reanalysis.submit(db.naive_utc(request.start), db.naive_utc(request.end), zone_list,
+                                   request.camera_id, request.bucket_seconds)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return reanalysis.get_run(run_id)
+
+@app.get("/reanalysis")
+def list_reanalysis(current_user: auth.User = Depends(auth.require_admin)):
+    """Past and running reanalysis runs, newest first (Admin only)"""
+    return {"runs": db.get_reanalysis_runs()}
+
+@app.get("/reanalysis/{run_id}")
+def get_reanalysis(run_id: int, zone_name: Optional[str] = None,
+                   current_user: auth.User = Depends(auth.require_admin)):
+    """A run's series for one zone (default: the total) next to the logged counts (Admin only)"""
+    result = reanalysis.compare(run_id, zone_name)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Reanalysis run not found")
+    result["zones"] = db.get_reanalysis_zone_names(run_id)
+    return result
+
+@app.delete("/reanalysis/{run_id}")
+def delete_reanalysis(run_id: int, current_user: auth.User = Depends(auth.require_admin)):
+    """Remove a run and its series (Admin only)"""
+    if not db.delete_reanalysis_run(run_id):
+        raise HTTPException(status_code=404, detail="Reanalysis run not found")
+    return {"message": f"Reanalysis run {run_id} deleted"}
 
 # ==================== HELPER FUNCTIONS ====================
 
 def log_current_data(total, zones_data):
-    """Log data to history (called from main.py)"""
-    global history_log
-    entry = {
-        "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "total_people": total
-    }
-    entry.update(zones_data)
-    history_log.append(entry)
+    """Log data to history"""
+    history_log.record(total, zones_data)
     
     # Also log to database
     try:
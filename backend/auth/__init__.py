@@ -9,6 +9,8 @@ from .auth_service import (
     authenticate_user,
     create_access_token,
     decode_token,
+    verify_token,
+    revoke_token,
     get_current_user,
     require_admin,
     Token,
@@ -24,6 +26,8 @@ __all__ = [
     'authenticate_user',
     'create_access_token',
     'decode_token',
+    'verify_token',
+    'revoke_token',
     'get_current_user',
     'require_admin',
     'Token',
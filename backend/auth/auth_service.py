@@ -1,7 +1,10 @@
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 import hashlib
+import threading
+import time
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
@@ -10,6 +13,7 @@ from pydantic import BaseModel
 SECRET_KEY = "crowdcount-infosys-secret-key-2025-secure-jwt-token"
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+TOKEN_CACHE_SIZE = 1024  # verified tokens kept in memory
 
 security = HTTPBearer()
 
@@ -101,21 +105,120 @@ def decode_token(token: str) -> TokenData:
             detail="Invalid or expired token"
         )
 
+# ==================== VERIFIED TOKEN CACHE ====================
+# Dashboards poll several protected endpoints per second with the same token,
+# so each verified token's User is kept (keyed by a digest of the token) until
+# the token expires, instead of decoding the JWT on every request.
+
+_token_cache = OrderedDict()   # {digest: (exp_timestamp, User)}
+_revoked_tokens = {}           # {digest: exp_timestamp} of logged-out tokens
+_token_lock = threading.Lock()
+_token_stats = {"hits": 0, "misses": 0}
+# With several API workers (run.py --workers N) revocations are stored in the
+# database and a shared counter tells the other workers to reload them
+_shared_revocations = None     # {"version": fn, "announce": fn, "seen": version loaded}
+
+def _token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail)
+
+def share_revocations(version, announce):
+    """
+    Share logouts between worker processes: version() reads the shared
+    revocation counter, announce() bumps it after a revocation is stored
+    """
+    global _shared_revocations
+    _shared_revocations = {"version": version, "announce": announce, "seen": None}
+    _sync_revocations()
+
+def _sync_revocations():
+    """Reload revoked tokens from the database when another worker revoked one"""
+    shared = _shared_revocations
+    if shared is None:
+        return
+    version = shared["version"]()
+    if version == shared["seen"]:
+        return
+    import database as db
+    try:
+        revoked = db.get_revoked_tokens()
+    except Exception as e:
+        print(f"Revoked token sync error: {e}")
+        return
+    with _token_lock:
+        for hex_digest, exp in revoked.items():
+            digest = bytes.fromhex(hex_digest)
+            _revoked_tokens[digest] = exp
+            _token_cache.pop(digest, None)
+        shared["seen"] = version
+
+def verify_token(token: str) -> User:
+    """Resolve a bearer token to its User, from the cache when it has been verified before"""
+    digest = _token_digest(token)
+    now = time.time()
+    _sync_revocations()
+    with _token_lock:
+        if digest in _revoked_tokens:
+            raise _unauthorized("Token has been revoked")
+        cached = _token_cache.get(digest)
+        if cached is not None:
+            if cached[0] > now:
+                _token_cache.move_to_end(digest)
+                _token_stats["hits"] += 1
+                return cached[1]
+            del _token_cache[digest]
+        _token_stats["misses"] += 1
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        raise _unauthorized("Invalid or expired token")
+    username = payload.get("sub")
+    if username is None:
+        raise _unauthorized("Invalid authentication credentials")
+    user = USERS_DB.get(username)
+    if user is None:
+        raise _unauthorized("User not found")
+    current = User(username=user["username"], role=user["role"], full_name=user["full_name"])
+
+    exp = payload.get("exp")
+    if exp is not None:
+        with _token_lock:
+            if digest not in _revoked_tokens:
+                _token_cache[digest] = (float(exp), current)
+                while len(_token_cache) > TOKEN_CACHE_SIZE:
+                    _token_cache.popitem(last=False)
+    return current
+
+def revoke_token(token: str):
+    """Log a token out: drop it from the cache and reject it until it expires"""
+    digest = _token_digest(token)
+    now = time.time()
+    try:
+        exp = float(jwt.get_unverified_claims(token).get("exp", now + ACCESS_TOKEN_EXPIRE_MINUTES * 60))
+    except JWTError:
+        return
+    with _token_lock:
+        _token_cache.pop(digest, None)
+        for old in [d for d, expires in _revoked_tokens.items() if expires <= now]:
+            del _revoked_tokens[old]
+        if exp > now:
+            _revoked_tokens[digest] = exp
+    shared = _shared_revocations
+    if shared is not None and exp > now:
+        import database as db
+        db.save_revoked_token(digest.hex(), exp)
+        shared["announce"]()
+
+def get_token_cache_stats():
+    with _token_lock:
+        return {"cached": len(_token_cache), "revoked": len(_revoked_tokens), **_token_stats}
+
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> User:
     """Get current authenticated user from token"""
-    token = credentials.credentials
-    token_data = decode_token(token)
-    user = USERS_DB.get(token_data.username)
-    if user is None:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found"
-        )
-    return User(
-        username=user["username"],
-        role=user["role"],
-        full_name=user["full_name"]
-    )
+    return verify_token(credentials.credentials)
 
 def require_admin(current_user: User = Depends(get_current_user)) -> User:
     """Require admin role for endpoint access"""
@@ -0,0 +1,110 @@
+"""
+Authentication Overhead Benchmark
+Measures what get_current_user costs per request: verifying a bearer token
+directly, and a protected no-op endpoint through FastAPI, each with the
+verified-token cache enabled and disabled.
+
+    python benchmarks/bench_auth.py
+    python benchmarks/bench_auth.py --iterations 50000 --json auth.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+def print_section(title):
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def summarize(name, latencies_us):
+    return {
+        "phase": name,
+        "requests": len(latencies_us),
+        "mean_us": round(statistics.mean(latencies_us), 2),
+        "p50_us": round(percentile(latencies_us, 50), 2),
+        "p95_us": round(percentile(latencies_us, 95), 2),
+        "p99_us": round(percentile(latencies_us, 99), 2),
+    }
+
+def time_calls(fn, iterations):
+    latencies = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - t0) * 1e6)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=20000, help="direct verify_token calls per phase")
+    parser.add_argument("--requests", type=int, default=2000, help="HTTP requests per phase")
+    parser.add_argument("--json", dest="json_path", help="also write results to this JSON file")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from auth import auth_service as auth
+    from fastapi import Depends, FastAPI
+    from fastapi.testclient import TestClient
+
+    app = FastAPI()
+
+    @app.get("/protected")
+    def protected(current_user: auth.User = Depends(auth.get_current_user)):
+        return {}
+
+    @app.get("/open")
+    def open_endpoint():
+        return {}
+
+    client = TestClient(app)
+    token = auth.create_access_token({"sub": "admin", "role": "admin"})
+    headers = {"Authorization": f"Bearer {token}"}
+    cache_size = auth.TOKEN_CACHE_SIZE
+    results = []
+
+    for enabled in (False, True):
+        label = "cached" if enabled else "uncached"
+        auth.TOKEN_CACHE_SIZE = cache_size if enabled else 0
+        auth._token_cache.clear()
+
+        print_section(f"verify_token ({label})")
+        direct = summarize(f"verify_{label}", time_calls(lambda: auth.verify_token(token), args.iterations))
+        print(json.dumps(direct, indent=2))
+        results.append(direct)
+
+        print_section(f"GET /protected vs /open ({label})")
+        http = summarize(f"http_{label}", time_calls(lambda: client.get("/protected", headers=headers), args.requests))
+        baseline = summarize("http_open", time_calls(lambda: client.get("/open", headers=headers), args.requests))
+        http["auth_overhead_us"] = round(http["p50_us"] - baseline["p50_us"], 2)
+        print(json.dumps(http, indent=2))
+        results.append(http)
+
+    auth.TOKEN_CACHE_SIZE = cache_size
+
+    print_section("Summary")
+    by_phase = {r["phase"]: r for r in results}
+    speedup = by_phase["verify_uncached"]["p50_us"] / max(by_phase["verify_cached"]["p50_us"], 1e-9)
+    print(f"verify_token p50: {by_phase['verify_uncached']['p50_us']} us -> "
+          f"{by_phase['verify_cached']['p50_us']} us cached ({speedup:.1f}x)")
+    print(f"per-request auth overhead: {by_phase['http_uncached']['auth_overhead_us']} us -> "
+          f"{by_phase['http_cached']['auth_overhead_us']} us cached")
+    print(f"Token cache: {auth.get_token_cache_stats()}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"results": results}, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+if __name__ == "__main__":
+    main()
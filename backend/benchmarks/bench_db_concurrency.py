@@ -0,0 +1,132 @@
+"""
+Database Read/Write Concurrency Benchmark
+Measures API-style read latency on crowd_history.db with and without the
+frame loop logging in the background.
+
+Runs against a throw-away database file, never the shared one:
+    python benchmarks/bench_db_concurrency.py
+    python benchmarks/bench_db_concurrency.py --journal DELETE   # compare with the old rollback journal
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+def print_section(title):
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def run_readers(db, readers, duration):
+    """Hammer the read helpers from several threads, return latencies in ms"""
+    latencies = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def reader():
+        local = []
+        while time.perf_counter() < stop_at:
+            t0 = time.perf_counter()
+            db.get_recent_logs(limit=50)
+            db.get_all_thresholds()
+            local.append((time.perf_counter() - t0) * 1000)
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies
+
+def run_logger(db, rate, stop_event):
+    """Simulate camera loops logging `rate` samples per second"""
+    interval = 1.0 / rate
+    next_at = time.perf_counter()
+    zones = json.dumps({f"Zone {i}": i for i in range(8)})
+    while not stop_event.is_set():
+        db.log_entry(12, zones)
+        next_at += interval
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+def summarize(name, latencies, duration):
+    return {
+        "phase": name,
+        "requests": len(latencies),
+        "throughput_rps": round(len(latencies) / duration, 1),
+        "mean_ms": round(statistics.mean(latencies), 3) if latencies else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(max(latencies), 3) if latencies else 0.0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type=int, default=4, help="concurrent API reader threads")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per phase")
+    parser.add_argument("--write-rate", type=float, default=200.0, help="log_entry calls per second while logging")
+    parser.add_argument("--seed-rows", type=int, default=20000, help="rows inserted before measuring")
+    parser.add_argument("--journal", default="WAL", help="journal_mode to benchmark (WAL or DELETE)")
+    parser.add_argument("--json", dest="json_path", help="also write results to this JSON file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="crowdcount_bench_")
+    os.environ["CROWDCOUNT_DB_PATH"] = os.path.join(workdir, "bench.db")
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "models"))
+    import database as db
+
+    db.SQLITE_PRAGMAS["journal_mode"] = args.journal
+    db.ENGINE.dispose()
+
+    print_section(f"Seeding {args.seed_rows} rows ({args.journal} journal)")
+    zones = json.dumps({f"Zone {i}": i for i in range(8)})
+    for i in range(args.seed_rows):
+        db.log_entry(10, zones)
+        if i % 5000 == 4999:
+            db.flush_logs(timeout=60)   # stay below LOG_QUEUE_SIZE
+    db.flush_logs(timeout=60)
+    for i in range(8):
+        db.set_threshold(f"Zone {i}", 30 + i)
+
+    print_section("Phase 1: readers only")
+    idle = summarize("read_only", run_readers(db, args.readers, args.duration), args.duration)
+    print(json.dumps(idle, indent=2))
+
+    print_section(f"Phase 2: readers + logging at {args.write_rate:.0f} rows/s")
+    stop_event = threading.Event()
+    logger = threading.Thread(target=run_logger, args=(db, args.write_rate, stop_event), daemon=True)
+    logger.start()
+    busy = summarize("read_while_logging", run_readers(db, args.readers, args.duration), args.duration)
+    stop_event.set()
+    logger.join()
+    db.flush_logs(timeout=60)
+    print(json.dumps(busy, indent=2))
+
+    print_section("Summary")
+    slowdown = busy["p95_ms"] / idle["p95_ms"] if idle["p95_ms"] else 0.0
+    print(f"p95 read latency: {idle['p95_ms']} ms idle -> {busy['p95_ms']} ms while logging ({slowdown:.2f}x)")
+    print(f"Writer queue: {db.get_log_queue_stats()}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"journal_mode": args.journal, "readers": args.readers, "results": [idle, busy]}, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+if __name__ == "__main__":
+    main()
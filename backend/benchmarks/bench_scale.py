@@ -0,0 +1,230 @@
+"""
+Crowd Scale Benchmark
+Drives the real analytics stages (zone counting, heatmap, alerts, database
+logging, rendering and snapshot streaming) headless with a simulated crowd
+(services/crowd_sim.py) instead of video and YOLO, to size hardware for
+crowd sizes, zone counts and camera counts the sample videos can't produce.
+
+Every combination of --people, --zones, --cameras and --models runs for
+--duration seconds with each camera paced at --fps like a real one; frames
+the stages can't keep up with are skipped, so a configuration that does not
+fit shows as achieved fps below the target. --fps 0 runs flat out instead.
+
+    python benchmarks/bench_scale.py
+    python benchmarks/bench_scale.py --people 1000 --zones 300 --cameras 16
+    python benchmarks/bench_scale.py --fps 0 --models random_walk,flow
+    python benchmarks/bench_scale.py --processes --json scale.json   # one process per camera
+
+In one process the cameras share the zones module (zone list, heatmap) as
+they would in this app today; --processes gives each camera its own.
+Database logging goes to a throw-away file, never the shared one.
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+WARMUP = 1.0   # seconds run before measuring
+
+def print_section(title):
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def parse_ints(text):
+    return [int(v) for v in text.split(",") if v.strip()]
+
+# ==================== ONE RUN ====================
+
+def run_viewer(frame_cache, camera_id, fps, stop_event, latencies):
+    """A stream client: fetches the camera's snapshot (JPEG encoded on demand) at `fps`"""
+    interval = 1.0 / fps
+    while not stop_event.is_set():
+        t0 = time.perf_counter()
+        if frame_cache.get_snapshot(camera_id) is not None:
+            latencies.append((time.perf_counter() - t0) * 1000)
+        stop_event.wait(max(0.0, interval - (time.perf_counter() - t0)))
+
+def run_cameras(camera_ids, config):
+    """
+    One pipeline per camera in this process, measured for config["duration"]
+    seconds after a warmup. Returns raw numbers, merged by summarize().
+    """
+    import crowd_sim
+    import database as db
+    import frame_cache
+    import pipeline as pl
+    import zones as zn
+
+    zn.zones = crowd_sim.grid_zones(config["zones"])
+    zn.zone_current_inside = {}
+    zn.heatmap_accumulator = None
+    pipelines = [pl.build_sim_pipeline(config["people"], camera_id, config["model"], config["fps"],
+                                       seed=config["seed"] + camera_id, db_log_interval=config["db_interval"])
+                 for camera_id in camera_ids]
+    stop_viewers = threading.Event()
+    snapshot_ms = []
+    viewers = [threading.Thread(target=run_viewer, daemon=True,
+                                args=(frame_cache, camera_id, config["viewer_fps"], stop_viewers, snapshot_ms))
+               for camera_id in camera_ids for _ in range(config["viewers"])]
+
+    for pipeline in pipelines:
+        pipeline.start()
+    for viewer in viewers:
+        viewer.start()
+    time.sleep(WARMUP)
+    completed = [p.frames_completed for p in pipelines]
+    skipped = [p.frames_skipped for p in pipelines]
+    dropped = [sum(stage.queue.dropped for stage in p.stages) for p in pipelines]
+    snapshots_before = len(snapshot_ms)
+    cpu = time.process_time()
+    started = time.perf_counter()
+    time.sleep(config["duration"])
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu
+    stop_viewers.set()
+    for pipeline in pipelines:
+        pipeline.stop()
+    for viewer in viewers:
+        viewer.join(1.0)
+    t0 = time.perf_counter()
+    db.flush_logs(timeout=60)
+    flush_s = time.perf_counter() - t0
+
+    stages = {}
+    for pipeline in pipelines:
+        for stage in pipeline.stages:
+            stages.setdefault(stage.name, []).extend(stage.stats.recent)
+    return {
+        "seconds": elapsed,
+        "cpu_seconds": cpu,
+        "fps": [(p.frames_completed - c) / elapsed for p, c in zip(pipelines, completed)],
+        "frames_skipped": sum(p.frames_skipped - s for p, s in zip(pipelines, skipped)),
+        "frames_dropped": sum(sum(stage.queue.dropped for stage in p.stages) - d
+                              for p, d in zip(pipelines, dropped)),
+        "people_per_frame": [p.simulation.people_emitted / max(1, p.simulation.frames_captured) for p in pipelines],
+        "latency_ms": [s * 1000 for p in pipelines for s in p.latency_stats.recent],
+        "stage_ms": {name: [s * 1000 for s in samples] for name, samples in stages.items()},
+        "snapshot_ms": snapshot_ms[snapshots_before:],
+        "db_flush_s": flush_s,
+    }
+
+def summarize(config, parts):
+    """One result row from the raw numbers of every process of a configuration"""
+    fps = [f for part in parts for f in part["fps"]]
+    latency = [v for part in parts for v in part["latency_ms"]]
+    snapshot = [v for part in parts for v in part["snapshot_ms"]]
+    seconds = max(part["seconds"] for part in parts)
+    cpu = sum(part["cpu_seconds"] for part in parts)
+    stage_ms = {}
+    for part in parts:
+        for name, samples in part["stage_ms"].items():
+            stage_ms.setdefault(name, []).extend(samples)
+    people = statistics.mean(v for part in parts for v in part["people_per_frame"])
+    return {
+        "config": config,
+        "fps_per_camera_mean": round(statistics.mean(fps), 2),
+        "fps_per_camera_min": round(min(fps), 2),
+        "fps_total": round(sum(fps), 1),
+        "people_per_second": round(sum(fps) * people),
+        "realtime": bool(config["fps"]) and min(fps) >= 0.95 * config["fps"],
+        "frames_skipped": sum(part["frames_skipped"] for part in parts),
+        "frames_dropped": sum(part["frames_dropped"] for part in parts),
+        "latency_p50_ms": round(percentile(latency, 50), 2),
+        "latency_p95_ms": round(percentile(latency, 95), 2),
+        "latency_max_ms": round(max(latency), 2) if latency else 0.0,
+        "stages_p50_ms": {name: round(percentile(v, 50), 3) for name, v in stage_ms.items()},
+        "stages_p95_ms": {name: round(percentile(v, 95), 3) for name, v in stage_ms.items()},
+        "snapshot_p50_ms": round(percentile(snapshot, 50), 2),
+        "snapshot_p95_ms": round(percentile(snapshot, 95), 2),
+        "cpu_percent": round(cpu / seconds * 100, 1),
+        "db_flush_s": round(max(part["db_flush_s"] for part in parts), 3),
+    }
+
+def report(result):
+    c = result["config"]
+    target = f"{c['fps']:g} fps" if c["fps"] else "flat out"
+    print(f"\n{c['cameras']} camera(s) x {c['people']} people, {c['zones']} zones, {c['model']}, {target}")
+    print(f"  throughput  {result['fps_per_camera_mean']:.1f} fps/camera (min {result['fps_per_camera_min']:.1f}), "
+          f"{result['fps_total']:.0f} fps total, {result['people_per_second']} people/s"
+          + ("" if not c["fps"] else "  [realtime]" if result["realtime"] else "  [FALLING BEHIND]"))
+    print(f"  latency     p50 {result['latency_p50_ms']:.1f} ms, p95 {result['latency_p95_ms']:.1f} ms, "
+          f"max {result['latency_max_ms']:.1f} ms  (capture -> render)")
+    stages = ", ".join(f"{name} {ms:.2f}" for name, ms in result["stages_p50_ms"].items())
+    print(f"  stages p50  {stages} ms")
+    print(f"  streaming   snapshot p50 {result['snapshot_p50_ms']:.1f} ms, p95 {result['snapshot_p95_ms']:.1f} ms")
+    print(f"  load        {result['cpu_percent']:.0f}% CPU, {result['frames_skipped']} frames skipped, "
+          f"{result['frames_dropped']} dropped, DB flush {result['db_flush_s']:.2f} s")
+
+def run_config(config, processes):
+    camera_ids = list(range(1, config["cameras"] + 1))
+    if not processes:
+        return summarize(config, [run_cameras(camera_ids, config)])
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=len(camera_ids), mp_context=context) as pool:
+        parts = list(pool.map(run_cameras, [[camera_id] for camera_id in camera_ids], [config] * len(camera_ids)))
+    return summarize(config, parts)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--people", default="100,1000", help="people per camera, comma separated")
+    parser.add_argument("--zones", default="16,300", help="zones, comma separated")
+    parser.add_argument("--cameras", default="1,16", help="cameras, comma separated")
+    parser.add_argument("--models", default="random_walk", help="crowd models (random_walk, flow), comma separated")
+    parser.add_argument("--fps", type=float, default=15.0, help="target fps per camera (0: as fast as possible)")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per configuration")
+    parser.add_argument("--viewers", type=int, default=1, help="stream clients per camera")
+    parser.add_argument("--viewer-fps", type=float, default=10.0, help="snapshots per second per stream client")
+    parser.add_argument("--db-interval", type=float, default=5.0, help="seconds between database samples per camera")
+    parser.add_argument("--processes", action="store_true", help="run every camera in its own process")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="also write results to this JSON file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="crowdcount_bench_")
+    os.environ["CROWDCOUNT_DB_PATH"] = os.path.join(workdir, "bench.db")
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for sub in ("models", "services"):
+        sys.path.insert(0, os.path.join(backend_dir, sub))
+    import database   # creates the schema once, before camera processes would race to
+
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+    configs = [{"people": people, "zones": zones, "cameras": cameras, "model": model, "fps": args.fps,
+                "duration": args.duration, "viewers": args.viewers, "viewer_fps": args.viewer_fps,
+                "db_interval": args.db_interval, "seed": args.seed}
+               for model, cameras, people, zones in itertools.product(
+                   models, parse_ints(args.cameras), parse_ints(args.people), parse_ints(args.zones))]
+
+    print_section(f"{len(configs)} configuration(s), {args.duration:g} s each"
+                  f" ({'one process per camera' if args.processes else 'one process'}, {os.cpu_count()} CPUs)")
+    results = []
+    for config in configs:
+        result = run_config(config, args.processes)
+        report(result)
+        results.append(result)
+
+    if args.json_path:
+        output = {"python": platform.python_version(), "platform": platform.platform(),
+                  "cpu_count": os.cpu_count(), "processes": args.processes, "results": results}
+        with open(args.json_path, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""
+Pipeline Stage Benchmark
+Times each per-frame step on its own: track_people, count_people_in_zones,
+update_heatmap, draw_all_zones, JPEG encoding and log_entry, across crowd
+sizes and zone counts, and the batched writer behind log_entry (one batch
+commit, flush_logs() end to end) across batch sizes. Inputs are
+reproducible: synthetic frames and detections come from a fixed seed, real
+frames from backend/images.
+
+    python benchmarks/bench_stages.py
+    python benchmarks/bench_stages.py --json stages.json
+    python benchmarks/bench_stages.py --json new.json --compare stages.json   # flag regressions
+    python benchmarks/bench_stages.py --replay det.log   # also replay a recorded detection log
+
+log_entry and the writer run against a throw-away database file, never the shared one.
+track_people needs the YOLO dependencies and is skipped without them.
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+FRAME_SIZE = (1280, 720)   # what the pipeline resizes every frame to
+
+def print_section(title):
+    print("\n" + "="*60)
+    print(f"  {title}")
+    print("="*60)
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def parse_ints(text):
+    return [int(v) for v in text.split(",") if v.strip()]
+
+def time_calls(fn, iterations, warmup=5, setup=None):
+    """Latencies in microseconds; setup() runs before every call, outside the timing"""
+    for _ in range(warmup):
+        if setup is not None:
+            setup()
+        fn()
+    latencies = []
+    for _ in range(iterations):
+        if setup is not None:
+            setup()
+        t0 = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - t0) * 1e6)
+    return latencies
+
+def summarize(bench, params, latencies_us):
+    return {
+        "bench": bench,
+        "params": params,
+        "iterations": len(latencies_us),
+        "mean_us": round(statistics.mean(latencies_us), 2),
+        "p50_us": round(percentile(latencies_us, 50), 2),
+        "p95_us": round(percentile(latencies_us, 95), 2),
+        "p99_us": round(percentile(latencies_us, 99), 2),
+    }
+
+def report(results, result):
+    params = ", ".join(f"{k}={v}" for k, v in result["params"].items())
+    print(f"{result['bench']:<24} {params:<36} p50 {result['p50_us']:>10.1f} us   p95 {result['p95_us']:>10.1f} us")
+    results.append(result)
+
+# ==================== INPUTS ====================
+
+def synthetic_frame(rng, np):
+    """Smooth gradient plus noise: compresses like camera footage, unlike pure noise"""
+    w, h = FRAME_SIZE
+    x = np.linspace(0, 255, w, dtype=np.float32)
+    y = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+    base = np.stack([(x + y) / 2, np.broadcast_to(x, (h, w)), np.broadcast_to(y, (h, w))], axis=-1)
+    noise = rng.normal(0, 12, size=(h, w, 3))
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+def image_frames(cv2):
+    """{name: frame} from backend/images, resized like the pipeline does"""
+    images_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "images")
+    frames = {}
+    for path in sorted(glob.glob(os.path.join(images_dir, "*"))):
+        frame = cv2.imread(path)
+        if frame is not None:
+            frames[os.path.basename(path)] = cv2.resize(frame, FRAME_SIZE)
+    return frames
+
+def synthetic_people(rng, count):
+    """Tracked people as update_tracks() returns them"""
+    w, h = FRAME_SIZE
+    people = []
+    for pid in range(1, count + 1):
+        bw, bh = int(rng.integers(30, 80)), int(rng.integers(80, 200))
+        x1, y1 = int(rng.integers(0, w - bw)), int(rng.integers(0, h - bh))
+        x2, y2 = x1 + bw, y1 + bh
+        people.append({"id": pid, "bbox": (x1, y1, x2, y2), "centroid": ((x1 + x2) // 2, (y1 + y2) // 2)})
+    return people
+
+def grid_zones(count):
+    """count rectangular zones tiling the frame (near-square grid)"""
+    w, h = FRAME_SIZE
+    cols = max(1, int(round(count ** 0.5)))
+    rows = (count + cols - 1) // cols
+    zones = []
+    for i in range(count):
+        r, c = divmod(i, cols)
+        x1, y1 = c * w // cols, r * h // rows
+        x2, y2 = (c + 1) * w // cols - 1, (r + 1) * h // rows - 1
+        zones.append({"id": i + 1, "name": f"Zone {i + 1}", "points": [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]})
+    return zones
+
+# ==================== BENCHMARKS ====================
+
+def bench_zones(zn, np, rng, crowd_sizes, zone_counts, iterations, results):
+    print_section("count_people_in_zones / update_heatmap / draw_all_zones")
+    frame = synthetic_frame(rng, np)
+    for zone_count in zone_counts:
+        zn.zones = grid_zones(zone_count)
+        for crowd in crowd_sizes:
+            people = synthetic_people(rng, crowd)
+            params = {"people": crowd, "zones": zone_count}
+            report(results, summarize("count_people_in_zones", params,
+                                      time_calls(lambda: zn.count_people_in_zones(people), iterations)))
+
+    for crowd in crowd_sizes:
+        people = synthetic_people(rng, crowd)
+        zn.heatmap_accumulator = None
+        report(results, summarize("update_heatmap", {"people": crowd},
+                                  time_calls(lambda: zn.update_heatmap(people, frame.shape), iterations)))
+
+    canvas = frame.copy()
+
+    def reset_canvas():
+        canvas[:] = frame
+
+    for zone_count in zone_counts:
+        zn.zones = grid_zones(zone_count)
+        report(results, summarize("draw_all_zones", {"zones": zone_count},
+                                  time_calls(lambda: zn.draw_all_zones(canvas), iterations, setup=reset_canvas)))
+
+def bench_jpeg(cv2, frames, iterations, results):
+    import frame_cache
+    print_section(f"JPEG encode (quality {frame_cache.JPEG_QUALITY})")
+    params = [cv2.IMWRITE_JPEG_QUALITY, frame_cache.JPEG_QUALITY]
+    for name, frame in frames.items():
+        size = len(cv2.imencode('.jpg', frame, params)[1])
+        result = summarize("jpeg_encode", {"image": name},
+                           time_calls(lambda: cv2.imencode('.jpg', frame, params), iterations))
+        result["bytes"] = size
+        report(results, result)
+
+def bench_log_entry(zone_counts, iterations, results):
+    import database as db
+    print_section("log_entry (enqueue cost; the batched writer commits in the background)")
+    for zone_count in zone_counts:
+        zones = {f"Zone {i + 1}": i for i in range(zone_count)}
+        report(results, summarize("log_entry", {"zones": zone_count},
+                                  time_calls(lambda: db.log_entry(12, zones), iterations)))
+        db.flush_logs(timeout=60)   # stay below LOG_QUEUE_SIZE between cases
+
+def bench_log_write(zone_counts, batch_sizes, iterations, results):
+    """
+    What log_entry defers: one batch commit (logs, zone_counts and rollup
+    upserts in a transaction), and flush_logs() of a full queue end to end
+    """
+    import database as db
+    print_section("batched log writer (_write_batch / flush_logs)")
+    clock = [datetime.datetime(2026, 1, 1)]
+
+    def rows(count, zones):
+        # Samples 5 s apart like the pipeline writes them, so rollups span several buckets
+        batch = []
+        for _ in range(count):
+            clock[0] += datetime.timedelta(seconds=5)
+            batch.append((clock[0], 12, zones, db.DEFAULT_CAMERA_ID))
+        return batch
+
+    def enqueue(count, zones):
+        for ts, total, zone_data, camera_id in rows(count, zones):
+            db.log_entry(total, zone_data, timestamp=ts, camera_id=camera_id)
+
+    db.flush_logs(timeout=60)
+    for zone_count in zone_counts:
+        zones = {f"Zone {i + 1}": i for i in range(zone_count)}
+        for size in batch_sizes:
+            params = {"rows": size, "zones": zone_count}
+            pending = []
+            result = summarize("write_batch", params, time_calls(
+                lambda: db._write_batch(pending.pop()), iterations, warmup=2,
+                setup=lambda: pending.append(rows(size, zones))))
+            result["rows_per_s"] = round(size / (result["p50_us"] / 1e6))
+            report(results, result)
+
+            result = summarize("flush_logs", params, time_calls(
+                lambda: db.flush_logs(timeout=60), iterations, warmup=2,
+                setup=lambda: enqueue(size, zones)))
+            result["rows_per_s"] = round(size / (result["p50_us"] / 1e6))
+            report(results, result)
+
+def bench_tracking(frames, iterations, results):
+    print_section("track_people (YOLO + ByteTrack)")
+    try:
+        import tracking
+        tracking.get_model()
+    except ImportError as e:
+        print(f"Skipped: {e}")
+        results.append({"bench": "track_people", "params": {}, "skipped": str(e)})
+        return
+    for name, frame in frames.items():
+        report(results, summarize("track_people", {"image": name},
+                                  time_calls(lambda: tracking.track_people(frame), iterations, warmup=3)))
+
+def bench_replay(path, iterations, results):
+    """Whole zones + persist (+ render) steps over recorded detections (run.py --record)"""
+    import detection_log
+    import pipeline as pl
+    print_section(f"Replay of {os.path.basename(path)}")
+    info = detection_log.DetectionLog(path).info()
+    print(f"{info['frames']} frames, {info['people']} tracked people, {info['duration_s']} s recorded")
+    for render in (False, True):
+        crowd = pl.CrowdStages(camera_id=info["camera_id"])
+        run = detection_log.replay(path, crowd, limit=iterations * 10, render=render)
+        stages = ", ".join(f"{name} {us:.1f} us" for name, us in run["stage_mean_us"].items())
+        print(f"replay (render={render}): {run['frames']} frames in {run['seconds']} s = {run['fps']} fps  [{stages}]")
+        results.append({"bench": "replay", "params": {"log": os.path.basename(path), "render": render}, **run})
+
+# ==================== REGRESSIONS ====================
+
+def result_key(result):
+    return result["bench"], json.dumps(result["params"], sort_keys=True)
+
+def compare(results, baseline_path, tolerance):
+    """Print p50 changes against an earlier run; returns the regressions"""
+    with open(baseline_path) as f:
+        baseline = {result_key(r): r for r in json.load(f)["results"] if "p50_us" in r}
+    print_section(f"Compared with {baseline_path} (regression: p50 more than {tolerance:.0f}% slower)")
+    regressions = []
+    for result in results:
+        old = baseline.get(result_key(result))
+        if old is None or "p50_us" not in result or not old["p50_us"]:
+            continue
+        change = (result["p50_us"] - old["p50_us"]) / old["p50_us"] * 100
+        flag = "REGRESSION" if change > tolerance else ""
+        params = ", ".join(f"{k}={v}" for k, v in result["params"].items())
+        print(f"{result['bench']:<24} {params:<36} {old['p50_us']:>10.1f} -> {result['p50_us']:>10.1f} us "
+              f"({change:+.1f}%) {flag}")
+        if flag:
+            regressions.append({"bench": result["bench"], "params": result["params"], "change_pct": round(change, 1)})
+    return regressions
+
+def environment():
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=backend_dir,
+                                capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    import cv2
+    import numpy as np
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--crowd-sizes", default="0,10,50,200", help="people per frame, comma separated")
+    parser.add_argument("--zone-counts", default="1,4,16", help="zones, comma separated")
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per case")
+    parser.add_argument("--batch-rows", default="1,100,1000", help="rows per database batch, comma separated")
+    parser.add_argument("--write-iterations", type=int, default=20, help="timed batch commits per case")
+    parser.add_argument("--tracking-iterations", type=int, default=20, help="timed track_people calls per image")
+    parser.add_argument("--skip-tracking", action="store_true", help="do not load YOLO")
+    parser.add_argument("--replay", metavar="LOG", help="detection log to replay through the analytics stages")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", dest="json_path", help="also write results to this JSON file")
+    parser.add_argument("--compare", help="earlier --json output to compare p50 latencies with")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="percent slowdown reported as a regression")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="crowdcount_bench_")
+    os.environ["CROWDCOUNT_DB_PATH"] = os.path.join(workdir, "bench.db")
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for sub in ("models", "services"):
+        sys.path.insert(0, os.path.join(backend_dir, sub))
+
+    import cv2
+    import numpy as np
+    import zones as zn
+
+    rng = np.random.default_rng(args.seed)
+    crowd_sizes = parse_ints(args.crowd_sizes)
+    zone_counts = parse_ints(args.zone_counts)
+    frames = {"synthetic": synthetic_frame(rng, np)}
+    frames.update(image_frames(cv2))
+
+    results = []
+    bench_zones(zn, np, rng, crowd_sizes, zone_counts, args.iterations, results)
+    bench_jpeg(cv2, frames, args.iterations, results)
+    bench_log_entry(zone_counts, args.iterations, results)
+    bench_log_write(zone_counts, parse_ints(args.batch_rows), args.write_iterations, results)
+    if not args.skip_tracking:
+        bench_tracking(frames, args.tracking_iterations, results)
+    if args.replay:
+        bench_replay(args.replay, args.iterations, results)
+
+    output = {"environment": environment(), "seed": args.seed, "frame_size": list(FRAME_SIZE), "results": results}
+    if args.compare:
+        output["regressions"] = compare(results, args.compare, args.tolerance)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"Results written to {args.json_path}")
+
+    if output.get("regressions"):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
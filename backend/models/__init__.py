@@ -6,21 +6,54 @@ Database models and data schemas
 from .database import (
     SessionLocal,
     LogEntry,
+    ZoneCount,
+    ZoneRollup,
     Threshold,
+    AlertEvent,
     log_entry,
+    flush_logs,
     get_threshold,
     set_threshold,
     get_all_thresholds,
-    get_recent_logs
+    get_alert_events,
+    get_recent_logs,
+    get_zone_series,
+    get_zone_aggregates,
+    get_rollup_series,
+    get_rollup_stats,
+    get_history_page,
+    iter_logs,
+    migrate_schema
 )
+from .retention import apply_retention, convert_to_incremental_vacuum, get_storage_stats, start_retention_worker
+from .archive import archive_pending, query_archive, start_archive_worker
 
 __all__ = [
     'SessionLocal',
     'LogEntry',
+    'ZoneCount',
+    'ZoneRollup',
     'Threshold',
+    'AlertEvent',
     'log_entry',
+    'flush_logs',
     'get_threshold',
     'set_threshold',
     'get_all_thresholds',
-    'get_recent_logs'
+    'get_alert_events',
+    'get_recent_logs',
+    'get_zone_series',
+    'get_zone_aggregates',
+    'get_rollup_series',
+    'get_rollup_stats',
+    'get_history_page',
+    'iter_logs',
+    'migrate_schema',
+    'apply_retention',
+    'convert_to_incremental_vacuum',
+    'get_storage_stats',
+    'start_retention_worker',
+    'archive_pending',
+    'query_archive',
+    'start_archive_worker'
 ]
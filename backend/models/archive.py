@@ -0,0 +1,214 @@
+"""
+Columnar History Archive
+Writes one compressed Parquet partition per day of zone counts into the
+shared folder and runs aggregate queries over them without touching SQLite.
+
+Requires pyarrow (optional): pip install pyarrow
+"""
+
+import functools
+import operator
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+try:
+    import database as db
+except ImportError:
+    # Imported as part of the models package without models/ on sys.path
+    from . import database as db
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+ARCHIVE_DIR = os.path.join(os.path.dirname(db.DB_PATH), "archive", "counts")
+ARCHIVE_INTERVAL = 3600          # seconds between archive passes
+COMPRESSION = "zstd"
+EMPTY_MARKER = "_EMPTY"          # left in the partition directory of a day without data
+GROUP_BY_OPTIONS = ("zone", "camera", "day", "hour")
+
+_run_lock = threading.Lock()
+_worker_thread = None
+
+def is_available():
+    return pa is not None
+
+def _require_pyarrow():
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed (pip install pyarrow)")
+
+def _schema():
+    return pa.schema([
+        ("timestamp", pa.timestamp("ms")),
+        ("camera_id", pa.int16()),
+        ("zone", pa.string()),   # dictionary-encoded by Parquet on disk
+        ("count", pa.int32()),
+    ])
+
+def partition_path(day):
+    return os.path.join(ARCHIVE_DIR, f"date={day.strftime('%Y-%m-%d')}", "part-0.parquet")
+
+def _days_with(*file_names):
+    if not os.path.isdir(ARCHIVE_DIR):
+        return []
+    days = []
+    for name in sorted(os.listdir(ARCHIVE_DIR)):
+        if name.startswith("date=") and any(os.path.exists(os.path.join(ARCHIVE_DIR, name, f)) for f in file_names):
+            days.append(name[len("date="):])
+    return days
+
+def archived_days():
+    """Days that already have a partition on disk"""
+    return _days_with("part-0.parquet")
+
+def archive_day(day):
+    """
+    Write the partition of one UTC day (zone rows plus the total under db.TOTAL_ZONE).
+    The file is written next to its final name and renamed, so readers never see half a file.
+    A day without rows gets an empty marker instead, so later passes skip it.
+    Returns the number of rows written.
+    """
+    _require_pyarrow()
+    day = datetime(day.year, day.month, day.day)
+    start, end = day, day + timedelta(days=1)
+
+    zones = db.ZoneCount.__table__
+    logs = db.LogEntry.__table__
+    zone_stmt = (
+        select(zones.c.timestamp, zones.c.camera_id, zones.c.zone_name, zones.c.count)
+        .where(zones.c.timestamp >= start, zones.c.timestamp < end)
+        .order_by(zones.c.timestamp)
+    )
+    total_stmt = (
+        select(logs.c.timestamp, logs.c.camera_id, logs.c.total_people)
+        .where(logs.c.timestamp >= start, logs.c.timestamp < end, logs.c.total_people.isnot(None))
+        .order_by(logs.c.timestamp)
+    )
+    with db.ENGINE.connect() as conn:
+        rows = conn.execute(zone_stmt).all()
+        rows += [(ts, camera_id, db.TOTAL_ZONE, total) for ts, camera_id, total in conn.execute(total_stmt)]
+    path = partition_path(day)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if not rows:
+        # Dataset reads skip files starting with "_", so the marker never shows in queries
+        open(os.path.join(os.path.dirname(path), EMPTY_MARKER), "w").close()
+        return 0
+
+    timestamps, cameras, zone_names, counts = zip(*rows)
+    table = pa.Table.from_arrays([
+        pa.array(timestamps, type=pa.timestamp("ms")),
+        pa.array([c or db.DEFAULT_CAMERA_ID for c in cameras], type=pa.int16()),
+        pa.array(zone_names, type=pa.string()),
+        pa.array(counts, type=pa.int32()),
+    ], schema=_schema())
+    table = table.sort_by([("timestamp", "ascending")])
+
+    tmp_path = path + ".tmp"
+    pq.write_table(table, tmp_path, compression=COMPRESSION)
+    os.replace(tmp_path, path)
+    return table.num_rows
+
+def archive_pending(now=None):
+    """Archive every complete day (before today, UTC) that has no partition or empty marker yet"""
+    _require_pyarrow()
+    now = now or datetime.utcnow()
+    today = datetime(now.year, now.month, now.day)
+    with db.ENGINE.connect() as conn:
+        first = conn.execute(select(db.LogEntry.timestamp).order_by(db.LogEntry.timestamp).limit(1)).scalar()
+    if first is None:
+        return {}
+
+    done = set(_days_with("part-0.parquet", EMPTY_MARKER))
+    written = {}
+    with _run_lock:
+        day = datetime(first.year, first.month, first.day)
+        while day < today:
+            label = day.strftime("%Y-%m-%d")
+            if label not in done:
+                written[label] = archive_day(day)
+            day += timedelta(days=1)
+    return written
+
+def query_archive(start=None, end=None, zone=None, camera_id=None, group_by=("zone",)):
+    """
+    Aggregate archived counts: samples / mean / min / max per group.
+    Only the partitions overlapping [start, end) are opened.
+    """
+    _require_pyarrow()
+    for key in group_by:
+        if key not in GROUP_BY_OPTIONS:
+            raise ValueError(f"group_by must be made of {list(GROUP_BY_OPTIONS)}")
+    if not archived_days():
+        return []
+
+    partitioning = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+    dataset = ds.dataset(ARCHIVE_DIR, format="parquet", partitioning=partitioning)
+    # Partition pruning on the date directory, then an exact timestamp filter
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field("date") >= start.strftime("%Y-%m-%d"))
+        conditions.append(ds.field("timestamp") >= pa.scalar(start, type=pa.timestamp("ms")))
+    if end is not None:
+        conditions.append(ds.field("date") <= end.strftime("%Y-%m-%d"))
+        conditions.append(ds.field("timestamp") < pa.scalar(end, type=pa.timestamp("ms")))
+    if zone is not None:
+        conditions.append(ds.field("zone") == zone)
+    if camera_id is not None:
+        conditions.append(ds.field("camera_id") == camera_id)
+    expr = functools.reduce(operator.and_, conditions) if conditions else None
+
+    table = dataset.to_table(columns=["timestamp", "camera_id", "zone", "count"], filter=expr)
+    if table.num_rows == 0:
+        return []
+
+    keys = []
+    for key in group_by:
+        if key == "zone":
+            keys.append("zone")
+        elif key == "camera":
+            keys.append("camera_id")
+        else:
+            fmt = "%Y-%m-%d" if key == "day" else "%Y-%m-%d %H:00"
+            table = table.append_column(key, pc.strftime(table["timestamp"], format=fmt))
+            keys.append(key)
+
+    result = table.group_by(keys).aggregate([
+        ("count", "count"), ("count", "mean"), ("count", "min"), ("count", "max"),
+    ])
+    rows = result.to_pylist()
+    for row in rows:
+        row["samples"] = row.pop("count_count")
+        row["average_count"] = round(row.pop("count_mean"), 2)
+        row["min_count"] = row.pop("count_min")
+        row["max_count"] = row.pop("count_max")
+    return sorted(rows, key=lambda r: tuple(str(r[k]) for k in keys))
+
+def _archive_loop(interval):
+    while True:
+        try:
+            written = archive_pending()
+            if written:
+                print(f"🗄️ Archived {len(written)} day(s) to {ARCHIVE_DIR}")
+        except Exception as e:
+            print(f"Archive error: {e}")
+        time.sleep(interval)
+
+def start_archive_worker(interval=ARCHIVE_INTERVAL):
+    """Archive finished days in a background thread (no-op without pyarrow)"""
+    global _worker_thread
+    if pa is None:
+        print("pyarrow not installed, history archive disabled")
+        return None
+    if _worker_thread is not None and _worker_thread.is_alive():
+        return _worker_thread
+    _worker_thread = threading.Thread(target=_archive_loop, args=(interval,), name="history-archive", daemon=True)
+    _worker_thread.start()
+    return _worker_thread
@@ -1,9 +1,17 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, text
+from sqlalchemy import create_engine, event, select, insert, update, bindparam, func, case, literal, tuple_, Column, Integer, String, Float, DateTime, Index, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from datetime import datetime
+from sqlalchemy.pool import QueuePool
+from datetime import datetime, timedelta, timezone
+import atexit
+import base64
 import os
 import json
+import queue
+import sqlite3
+import threading
+import time
 
 # Use shared folder for database (go up two levels from models/ to backend/, then to shared/)
 backend_dir = os.path.dirname(os.path.dirname(__file__))
@@ -12,17 +20,96 @@ shared_dir = os.path.join(os.path.dirname(backend_dir), "shared")
 # Create shared directory if it doesn't exist
 os.makedirs(shared_dir, exist_ok=True)
 
-DB_PATH = os.path.join(shared_dir, "crowd_history.db")
-ENGINE = create_engine(f'sqlite:///{DB_PATH}', echo=False)
+DB_PATH = os.environ.get("CROWDCOUNT_DB_PATH", os.path.join(shared_dir, "crowd_history.db"))
+
+# One writer (the batched log writer) and many API readers: WAL lets readers
+# run while a batch commits, and the pool keeps connections (and their
+# prepared statement caches) alive between helper calls.
+SQLITE_PRAGMAS = {
+    "auto_vacuum": "INCREMENTAL",   # only takes effect on a new file (see retention.py)
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",        # safe with WAL, fsync only at checkpoints
+    "busy_timeout": 5000,           # ms to wait for the write lock
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -16000,           # ~16 MB page cache per connection
+    "temp_store": "MEMORY",
+}
+
+ENGINE = create_engine(
+    f'sqlite:///{DB_PATH}',
+    echo=False,
+    future=True,
+    poolclass=QueuePool,
+    pool_size=8,
+    max_overflow=8,
+    connect_args={
+        "check_same_thread": False,   # pooled connections move between threads
+        "cached_statements": 256,     # sqlite3 prepared statement cache
+    },
+)
+
+@event.listens_for(ENGINE, "connect")
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=ENGINE)
 Base = declarative_base()
 
+DEFAULT_CAMERA_ID = 1
+
+def naive_utc(ts):
+    """Timestamps are stored as naive UTC: convert an aware datetime, keep a naive one as is"""
+    if ts is None or ts.tzinfo is None:
+        return ts
+    return ts.astimezone(timezone.utc).replace(tzinfo=None)
+
 class LogEntry(Base):
     __tablename__ = 'logs'
     id = Column(Integer, primary_key=True)
-    timestamp = Column(DateTime, default=datetime.utcnow)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
     total_people = Column(Integer)
     zone_data = Column(String)  # JSON string of zones
+    camera_id = Column(Integer, default=DEFAULT_CAMERA_ID)
+
+class ZoneCount(Base):
+    """One row per (sample, zone): the queryable form of LogEntry.zone_data"""
+    __tablename__ = 'zone_counts'
+    id = Column(Integer, primary_key=True)
+    log_id = Column(Integer, index=True)  # source row in logs
+    timestamp = Column(DateTime, nullable=False)
+    camera_id = Column(Integer, nullable=False, default=DEFAULT_CAMERA_ID)
+    zone_name = Column(String, nullable=False)
+    count = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index('ix_zone_counts_zone_time', 'zone_name', 'timestamp'),
+        Index('ix_zone_counts_camera_time', 'camera_id', 'timestamp'),
+        Index('ix_zone_counts_time', 'timestamp'),
+    )
+
+# Pseudo-zone under which total_people is rolled up
+TOTAL_ZONE = "__total__"
+
+class ZoneRollup(Base):
+    """Per-bucket aggregates of zone counts, maintained incrementally by the log writer"""
+    __tablename__ = 'zone_rollups'
+    resolution = Column(String, primary_key=True)   # minute / hour / day
+    camera_id = Column(Integer, primary_key=True)
+    zone_name = Column(String, primary_key=True)    # TOTAL_ZONE for total_people
+    bucket_start = Column(DateTime, primary_key=True)
+    samples = Column(Integer, nullable=False)
+    sum_count = Column(Integer, nullable=False)
+    min_count = Column(Integer, nullable=False)
+    max_count = Column(Integer, nullable=False)
+    last_count = Column(Integer, nullable=False)
+    last_timestamp = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('ix_zone_rollups_bucket', 'resolution', 'bucket_start'),
+    )
 
 class Threshold(Base):
     __tablename__ = 'thresholds'
@@ -31,8 +118,137 @@ class Threshold(Base):
     max_capacity = Column(Integer, default=30)
     alert_enabled = Column(Integer, default=1)  # 1=true, 0=false
 
+class AlertEvent(Base):
+    """A zone crossing its capacity ("raised") or falling back below it ("cleared")"""
+    __tablename__ = 'alert_events'
+    id = Column(Integer, primary_key=True)
+    timestamp = Column(DateTime, nullable=False, default=datetime.utcnow)
+    camera_id = Column(Integer, nullable=False, default=DEFAULT_CAMERA_ID)
+    zone_name = Column(String, nullable=False)
+    event = Column(String, nullable=False)
+    count = Column(Integer, nullable=False)
+    max_capacity = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index('ix_alert_events_time', 'timestamp'),
+    )
+
+class ReanalysisRun(Base):
+    """One recomputation of past zone counts under a different zone set (see services/reanalysis.py)"""
+    __tablename__ = 'reanalysis_runs'
+    id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    camera_id = Column(Integer, nullable=False, default=DEFAULT_CAMERA_ID)
+    start = Column(DateTime, nullable=False)
+    end = Column(DateTime, nullable=False)
+    bucket_seconds = Column(Integer, nullable=False)
+    zones = Column(String, nullable=False)      # JSON zone set the counts were computed with
+    status = Column(String, nullable=False)     # running / done / failed
+    frames = Column(Integer, nullable=False, default=0)
+    detections = Column(Integer, nullable=False, default=0)
+    error = Column(String)
+
+class ReanalysisCount(Base):
+    """Per-bucket occupancy, entries and dwell of one zone in a reanalysis run"""
+    __tablename__ = 'reanalysis_counts'
+    id = Column(Integer, primary_key=True)
+    run_id = Column(Integer, nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    zone_name = Column(String, nullable=False)   # TOTAL_ZONE for all zones together
+    samples = Column(Integer, nullable=False)    # frames in the bucket
+    sum_count = Column(Integer, nullable=False)
+    max_count = Column(Integer, nullable=False)
+    entries = Column(Integer, nullable=False)
+    dwell_seconds = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index('ix_reanalysis_counts_run_zone', 'run_id', 'zone_name', 'bucket_start'),
+    )
+
+class RevokedToken(Base):
+    """A logged-out JWT (sha256 of the token), rejected by every API worker until it expires"""
+    __tablename__ = 'revoked_tokens'
+    digest = Column(String, primary_key=True)
+    expires_at = Column(Float, nullable=False)   # unix time
+
 Base.metadata.create_all(bind=ENGINE)
 
+# ==================== SCHEMA MIGRATION ====================
+# create_all() only creates missing tables; columns and indexes added to
+# existing tables (and the zone_counts backfill) are handled here.
+
+MIGRATION_CHUNK = 5000  # logs rows backfilled per transaction
+
+def _backfill_zone_counts(conn):
+    """Explode logs.zone_data into zone_counts for rows that were never split"""
+    # The writer inserts a log and its zone rows in one transaction, so every
+    # log above the highest migrated log_id is still unmigrated
+    after = conn.execute(text("SELECT COALESCE(MAX(log_id), 0) FROM zone_counts")).scalar()
+    last_id = conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM logs")).scalar()
+    migrated = 0
+    while after < last_id:
+        upto = after + MIGRATION_CHUNK
+        result = conn.execute(text("""
+            INSERT INTO zone_counts (log_id, timestamp, camera_id, zone_name, count)
+            SELECT l.id, l.timestamp, COALESCE(l.camera_id, :camera_id), j.key, CAST(j.value AS INTEGER)
+            FROM logs AS l, json_each(l.zone_data) AS j
+            WHERE l.id > :after AND l.id <= :upto
+              AND json_valid(l.zone_data) AND j.type IN ('integer', 'real')
+        """), {"after": after, "upto": upto, "camera_id": DEFAULT_CAMERA_ID})
+        conn.commit()
+        migrated += max(result.rowcount, 0)
+        after = upto
+    return migrated
+
+def _backfill_rollups(conn):
+    """Seed zone_rollups from logs the first time the table is created"""
+    if conn.execute(text("SELECT 1 FROM zone_rollups LIMIT 1")).first() is not None:
+        return 0
+    stmt = (
+        select(LogEntry.id, LogEntry.timestamp, LogEntry.camera_id, LogEntry.total_people, LogEntry.zone_data)
+        .where(LogEntry.id > bindparam("after"))
+        .order_by(LogEntry.id)
+        .limit(MIGRATION_CHUNK)
+    )
+    after = 0
+    rolled = 0
+    while True:
+        rows = conn.execute(stmt, {"after": after}).all()
+        if not rows:
+            break
+        buckets = {}
+        for log_id, ts, camera_id, total, zone_data in rows:
+            if ts is None:
+                continue
+            camera_id = camera_id or DEFAULT_CAMERA_ID
+            if total is not None:
+                _accumulate_rollup(buckets, ts, camera_id, TOTAL_ZONE, total)
+            for name, count in _zone_counts_of(zone_data).items():
+                if isinstance(count, (int, float)):
+                    _accumulate_rollup(buckets, ts, camera_id, name, int(count))
+        _upsert_rollups(conn, buckets)
+        conn.commit()
+        rolled += len(rows)
+        after = rows[-1][0]
+    return rolled
+
+def migrate_schema():
+    """Bring an existing crowd_history.db up to the current schema (idempotent)"""
+    with ENGINE.connect() as conn:
+        columns = {row[1] for row in conn.execute(text("PRAGMA table_info(logs)"))}
+        if "camera_id" not in columns:
+            conn.execute(text(f"ALTER TABLE logs ADD COLUMN camera_id INTEGER DEFAULT {DEFAULT_CAMERA_ID}"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_logs_timestamp ON logs (timestamp)"))
+        conn.commit()
+
+        migrated = _backfill_zone_counts(conn)
+        if migrated:
+            print(f"Backfilled {migrated} zone_counts rows from logs")
+
+        rolled = _backfill_rollups(conn)
+        if rolled:
+            print(f"Rolled up {rolled} historical log rows")
+
 def get_db():
     db = SessionLocal()
     try:
@@ -40,66 +256,826 @@ def get_db():
     finally:
         db.close()
 
-def log_entry(total_people, zone_data):
+# ==================== PREPARED STATEMENTS ====================
+# Statements are built once so both SQLAlchemy's compiled cache and the
+# sqlite3 statement cache of each pooled connection are hit on every call.
+
+_INSERT_LOG = insert(LogEntry.__table__)
+_INSERT_ZONE_COUNT = insert(ZoneCount.__table__)
+_SELECT_ALL_THRESHOLDS = select(Threshold.zone_name, Threshold.max_capacity, Threshold.alert_enabled)
+_UPDATE_THRESHOLD = (
+    update(Threshold.__table__)
+    .where(Threshold.zone_name == bindparam("b_zone_name"))
+    .values(max_capacity=bindparam("b_max_capacity"))
+)
+_INSERT_THRESHOLD = insert(Threshold.__table__)
+_SELECT_RECENT_LOGS = (
+    select(LogEntry.timestamp, LogEntry.total_people, LogEntry.zone_data)
+    .order_by(LogEntry.timestamp.desc())
+    .limit(bindparam("limit"))
+)
+
+# ==================== ROLLUPS ====================
+# Every written sample is folded into minute/hour/day buckets in the same
+# transaction, so range statistics never have to scan raw rows.
+
+_BUCKET_FLOOR = {
+    "minute": lambda ts: ts.replace(second=0, microsecond=0),
+    "hour": lambda ts: ts.replace(minute=0, second=0, microsecond=0),
+    "day": lambda ts: ts.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+ROLLUP_RESOLUTIONS = tuple(_BUCKET_FLOOR)
+_BUCKET_LENGTH = {"minute": timedelta(minutes=1), "hour": timedelta(hours=1), "day": timedelta(days=1)}
+_FINER = {"day": "hour", "hour": "minute", "minute": None}   # None: the raw rows
+
+_rollups = ZoneRollup.__table__
+_rollup_insert = sqlite_insert(_rollups)
+_UPSERT_ROLLUP = _rollup_insert.on_conflict_do_update(
+    index_elements=["resolution", "camera_id", "zone_name", "bucket_start"],
+    set_={
+        "samples": _rollups.c.samples + _rollup_insert.excluded.samples,
+        "sum_count": _rollups.c.sum_count + _rollup_insert.excluded.sum_count,
+        "min_count": func.min(_rollups.c.min_count, _rollup_insert.excluded.min_count),
+        "max_count": func.max(_rollups.c.max_count, _rollup_insert.excluded.max_count),
+        "last_count": case(
+            (_rollup_insert.excluded.last_timestamp >= _rollups.c.last_timestamp, _rollup_insert.excluded.last_count),
+            else_=_rollups.c.last_count
+        ),
+        "last_timestamp": func.max(_rollups.c.last_timestamp, _rollup_insert.excluded.last_timestamp),
+    }
+)
+
+def _accumulate_rollup(buckets, ts, camera_id, zone_name, value):
+    """Fold one sample into the in-memory bucket aggregates of a batch"""
+    for resolution, floor in _BUCKET_FLOOR.items():
+        key = (resolution, camera_id, zone_name, floor(ts))
+        agg = buckets.get(key)
+        if agg is None:
+            buckets[key] = [1, value, value, value, value, ts]
+            continue
+        agg[0] += 1
+        agg[1] += value
+        agg[2] = min(agg[2], value)
+        agg[3] = max(agg[3], value)
+        if ts >= agg[5]:
+            agg[4], agg[5] = value, ts
+
+def _upsert_rollups(conn, buckets):
+    """Merge batch aggregates into zone_rollups (one executemany)"""
+    if not buckets:
+        return
+    conn.execute(_UPSERT_ROLLUP, [
+        {
+            "resolution": resolution, "camera_id": camera_id, "zone_name": zone_name,
+            "bucket_start": bucket_start, "samples": agg[0], "sum_count": agg[1],
+            "min_count": agg[2], "max_count": agg[3], "last_count": agg[4], "last_timestamp": agg[5]
+        }
+        for (resolution, camera_id, zone_name, bucket_start), agg in buckets.items()
+    ])
+
+# ==================== BATCHED LOG WRITER ====================
+# log_entry() is called from the video loop, so it only enqueues the row.
+# A single writer thread commits everything queued during one flush interval
+# in one transaction, keeping disk I/O off the frame path. A batch whose
+# commit fails (database locked, disk error) is kept and written again with
+# the next one after a backoff; rows are only given up past LOG_QUEUE_SIZE.
+
+LOG_FLUSH_INTERVAL = 2.0   # seconds between batch commits
+LOG_QUEUE_SIZE = 10000     # rows buffered before new entries are dropped
+LOG_RETRY_BACKOFF = (0.5, 1.0, 2.0, 5.0, 10.0)   # seconds before retrying a failed commit
+
+_log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+_writer_thread = None
+_writer_lock = threading.Lock()
+_dropped_entries = 0
+_failed_commits = 0
+_lost_entries = 0   # rows of failed commits given up because too many were waiting
+_retry_rows = 0     # rows of failed commits waiting for the next attempt
+_data_version = 0   # bumped after every commit that changes logged data
+_batch_listeners = []   # called with (rows, seconds) after every batch commit
+
+def add_batch_listener(callback):
+    """Call callback(rows, seconds) after each committed log batch (e.g. for metrics)"""
+    _batch_listeners.append(callback)
+
+def get_data_version():
+    """Changes whenever logged data may have changed (used to invalidate cached responses)"""
+    return _data_version
+
+def has_log_writer():
+    """True once this process writes logged data (the batched writer thread is running)"""
+    return bool(_writer_thread and _writer_thread.is_alive())
+
+_file_version_conn = None
+_file_version_lock = threading.Lock()
+
+def get_file_version():
+    """
+    PRAGMA data_version on a connection of its own: changes whenever any other
+    connection, in this process or another, commits to the database file.
+    For processes that read data another process writes (api-only mode).
+    """
+    global _file_version_conn
+    with _file_version_lock:
+        if _file_version_conn is None:
+            _file_version_conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        return _file_version_conn.execute("PRAGMA data_version").fetchone()[0]
+
+def bump_data_version():
+    """Mark logged data as changed (called by the writer, retention and other bulk edits)"""
+    global _data_version
+    with _writer_lock:
+        _data_version += 1
+
+def _zone_counts_of(zone_data):
+    """{zone_name: count} from a queued zone_data value ({} if unparsable)"""
+    if isinstance(zone_data, dict):
+        return zone_data
     try:
-        db = SessionLocal()
-        entry = LogEntry(total_people=total_people, zone_data=str(zone_data))
-        db.add(entry)
-        db.commit()
-        db.close()
+        parsed = json.loads(zone_data)
+    except (TypeError, ValueError):
+        return {}
+    return parsed if isinstance(parsed, dict) else {}
+
+def _write_batch(batch):
+    """
+    Insert a batch of queued rows (and their per-zone rows) in a single
+    transaction; returns False when the commit failed and nothing was written
+    """
+    global _failed_commits
+    if not batch:
+        return True
+    started = time.perf_counter()
+    try:
+        with ENGINE.begin() as conn:
+            zone_rows = []
+            buckets = {}
+            for ts, total, zones, camera_id in batch:
+                zone_json = zones if isinstance(zones, str) else json.dumps(zones)
+                result = conn.execute(_INSERT_LOG, {
+                    "timestamp": ts, "total_people": total,
+                    "zone_data": zone_json, "camera_id": camera_id
+                })
+                log_id = result.inserted_primary_key[0]
+                if total is not None:
+                    _accumulate_rollup(buckets, ts, camera_id, TOTAL_ZONE, total)
+                for name, count in _zone_counts_of(zones).items():
+                    if not isinstance(count, (int, float)):
+                        continue
+                    zone_rows.append({"log_id": log_id, "timestamp": ts, "camera_id": camera_id,
+                                      "zone_name": name, "count": int(count)})
+                    _accumulate_rollup(buckets, ts, camera_id, name, int(count))
+            if zone_rows:
+                conn.execute(_INSERT_ZONE_COUNT, zone_rows)
+            _upsert_rollups(conn, buckets)
+        bump_data_version()
+    except Exception as e:
+        _failed_commits += 1
+        print(f"Database log error ({len(batch)} rows kept for retry): {e}")
+        return False
+    elapsed = time.perf_counter() - started
+    for callback in _batch_listeners:
+        callback(len(batch), elapsed)
+    return True
+
+def _writer_loop():
+    global _lost_entries, _retry_rows
+    retry = []     # rows of the last failed commit, written again with the next batch
+    waiters = []   # flush_logs() requests, answered once their rows are committed
+    failures = 0
+    while True:
+        try:
+            # With rows waiting for a retry, don't sleep until the next log_entry()
+            item = _log_queue.get(timeout=LOG_FLUSH_INTERVAL if retry else None)
+        except queue.Empty:
+            item = None
+        batch, retry = retry, []
+        deadline = time.monotonic() + LOG_FLUSH_INTERVAL
+        while item is not None:
+            if isinstance(item, threading.Event):
+                # flush_logs() request: commit what we have right away
+                waiters.append(item)
+                break
+            batch.append(item)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = _log_queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+
+        if _write_batch(batch):
+            failures = 0
+            for event in waiters:
+                event.set()
+            waiters = []
+        else:
+            overflow = len(batch) - LOG_QUEUE_SIZE
+            if overflow > 0:
+                # Oldest first: the newest samples matter most once the database recovers
+                _lost_entries += overflow
+                print(f"Database log: gave up {overflow} rows after failed commits ({_lost_entries} so far)")
+                batch = batch[overflow:]
+            retry = batch
+            time.sleep(LOG_RETRY_BACKOFF[min(failures, len(LOG_RETRY_BACKOFF) - 1)])
+            failures += 1
+        _retry_rows = len(retry)
+
+def _ensure_writer():
+    global _writer_thread
+    if _writer_thread is not None and _writer_thread.is_alive():
+        return
+    with _writer_lock:
+        if _writer_thread is None or not _writer_thread.is_alive():
+            _writer_thread = threading.Thread(target=_writer_loop, name="db-log-writer", daemon=True)
+            _writer_thread.start()
+
+def log_entry(total_people, zone_data, timestamp=None, camera_id=DEFAULT_CAMERA_ID):
+    """
+    Queue a log row for the background writer (never blocks on disk).
+    zone_data is a {zone_name: count} dict or its JSON string.
+    The timestamp is taken when the sample is queued, not when it is committed.
+    """
+    global _dropped_entries
+    try:
+        _ensure_writer()
+        if not isinstance(zone_data, (str, dict)):
+            zone_data = str(zone_data)
+        _log_queue.put_nowait((timestamp or datetime.utcnow(), total_people, zone_data, camera_id))
+    except queue.Full:
+        _dropped_entries += 1
+        if _dropped_entries % 100 == 1:
+            print(f"Database log queue full, dropped {_dropped_entries} entries so far")
     except Exception as e:
         print(f"Database log error: {e}")
 
+def flush_logs(timeout=5.0):
+    """Block until every queued row has been committed; returns False on timeout (or while commits fail)"""
+    if _writer_thread is None or not _writer_thread.is_alive():
+        return _log_queue.empty()
+    done = threading.Event()
+    try:
+        _log_queue.put(done, timeout=timeout)
+    except queue.Full:
+        return False
+    return done.wait(timeout)
+
+def get_log_queue_stats():
+    """Writer health for monitoring"""
+    return {
+        "queued": _log_queue.qsize(),
+        "dropped": _dropped_entries,
+        "retrying": _retry_rows,
+        "failed_commits": _failed_commits,
+        "lost": _lost_entries,
+        "writer_alive": bool(_writer_thread and _writer_thread.is_alive())
+    }
+
+atexit.register(flush_logs)
+
+# ==================== THRESHOLD CACHE ====================
+# Thresholds only change through set_threshold(), so they are read from the
+# database once and served from memory; every write drops the cached copy.
+
+DEFAULT_MAX_CAPACITY = 30
+
+_threshold_cache = None     # {zone_name: {"max_capacity", "alert_enabled"}}
+_threshold_version = 0      # bumped on every set_threshold()
+_threshold_lock = threading.Lock()
+_threshold_listeners = []   # called after every set_threshold()
+
+def _cached_thresholds():
+    global _threshold_cache
+    with _threshold_lock:
+        if _threshold_cache is None:
+            with ENGINE.connect() as conn:
+                rows = conn.execute(_SELECT_ALL_THRESHOLDS).all()
+            _threshold_cache = {name: {"max_capacity": capacity, "alert_enabled": bool(enabled)}
+                                for name, capacity, enabled in rows}
+        return _threshold_cache
+
+def invalidate_thresholds():
+    """Drop the cached thresholds (call after editing the table outside set_threshold)"""
+    global _threshold_cache, _threshold_version
+    with _threshold_lock:
+        _threshold_cache = None
+        _threshold_version += 1
+
+def add_threshold_listener(callback):
+    """Call callback() after every set_threshold() in this process (e.g. to tell other processes)"""
+    _threshold_listeners.append(callback)
+
+def get_threshold_version():
+    """Changes whenever thresholds may have changed; cheap enough to poll every frame"""
+    return _threshold_version
+
 def get_threshold(zone_name):
     try:
-        db = SessionLocal()
-        threshold = db.query(Threshold).filter(Threshold.zone_name == zone_name).first()
-        db.close()
-        return threshold.max_capacity if threshold else 30
+        threshold = _cached_thresholds().get(zone_name)
+        return threshold["max_capacity"] if threshold else DEFAULT_MAX_CAPACITY
     except Exception as e:
         print(f"Get threshold error: {e}")
-        return 30
+        return DEFAULT_MAX_CAPACITY
 
 def set_threshold(zone_name, max_capacity):
     try:
-        db = SessionLocal()
-        threshold = db.query(Threshold).filter(Threshold.zone_name == zone_name).first()
-        if threshold:
-            threshold.max_capacity = max_capacity
-        else:
-            threshold = Threshold(zone_name=zone_name, max_capacity=max_capacity)
-            db.add(threshold)
-        db.commit()
-        db.close()
+        with ENGINE.begin() as conn:
+            result = conn.execute(_UPDATE_THRESHOLD, {"b_zone_name": zone_name, "b_max_capacity": max_capacity})
+            if result.rowcount == 0:
+                conn.execute(_INSERT_THRESHOLD, {"zone_name": zone_name, "max_capacity": max_capacity})
     except Exception as e:
         print(f"Set threshold error: {e}")
+    finally:
+        invalidate_thresholds()
+        for callback in _threshold_listeners:
+            callback()
 
-def get_all_thresholds():
-    """Get all zone thresholds"""
+def get_all_thresholds(raise_errors=False):
+    """Get all zone thresholds ({} on a database error unless raise_errors)"""
     try:
-        db = SessionLocal()
-        thresholds = db.query(Threshold).all()
-        result = {t.zone_name: {"max_capacity": t.max_capacity, "alert_enabled": bool(t.alert_enabled)} for t in thresholds}
-        db.close()
-        return result
+        return {name: dict(threshold) for name, threshold in _cached_thresholds().items()}
     except Exception as e:
+        if raise_errors:
+            raise
         print(f"Get all thresholds error: {e}")
         return {}
 
+# ==================== ALERT EVENTS ====================
+
+_INSERT_ALERT_EVENT = insert(AlertEvent.__table__)
+
+def log_alert_events(events):
+    """Insert alert events ({"timestamp", "camera_id", "zone", "event", "count", "max_capacity"} dicts)"""
+    if not events:
+        return
+    rows = [{
+        "timestamp": e["timestamp"], "camera_id": e["camera_id"], "zone_name": e["zone"],
+        "event": e["event"], "count": e["count"], "max_capacity": e["max_capacity"]
+    } for e in events]
+    try:
+        with ENGINE.begin() as conn:
+            conn.execute(_INSERT_ALERT_EVENT, rows)
+    except Exception as e:
+        print(f"Alert event log error: {e}")
+
+def get_alert_events(start=None, end=None, zone_name=None, camera_id=None, limit=100):
+    """Alert events in [start, end), newest first"""
+    alerts = AlertEvent.__table__
+    stmt = select(alerts.c.id, alerts.c.timestamp, alerts.c.camera_id, alerts.c.zone_name,
+                  alerts.c.event, alerts.c.count, alerts.c.max_capacity)
+    if start is not None:
+        stmt = stmt.where(alerts.c.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(alerts.c.timestamp < end)
+    if zone_name is not None:
+        stmt = stmt.where(alerts.c.zone_name == zone_name)
+    if camera_id is not None:
+        stmt = stmt.where(alerts.c.camera_id == camera_id)
+    stmt = stmt.order_by(alerts.c.timestamp.desc(), alerts.c.id.desc()).limit(limit)
+    try:
+        with ENGINE.connect() as conn:
+            rows = conn.execute(stmt).all()
+        return [{
+            "id": row_id, "timestamp": ts.strftime("%Y-%m-%d %H:%M:%S"), "camera_id": cam,
+            "zone": zone, "event": event, "count": count, "max_capacity": capacity
+        } for row_id, ts, cam, zone, event, count, capacity in rows]
+    except Exception as e:
+        print(f"Get alert events error: {e}")
+        return []
+
+# ==================== REVOKED TOKENS ====================
+# Only used with several API worker processes, where a logout handled by one
+# worker must reach the others (see auth_service.share_revocations).
+
+_revoked_tokens = RevokedToken.__table__
+
+def save_revoked_token(digest, expires_at):
+    """Store a revoked token's hex digest and drop the ones that have expired"""
+    stmt = sqlite_insert(_revoked_tokens).values(digest=digest, expires_at=expires_at)
+    with ENGINE.begin() as conn:
+        conn.execute(stmt.on_conflict_do_nothing(index_elements=["digest"]))
+        conn.execute(_revoked_tokens.delete().where(_revoked_tokens.c.expires_at <= time.time()))
+
+def get_revoked_tokens():
+    """{hex digest: expires_at} of revoked tokens that have not expired yet"""
+    stmt = select(_revoked_tokens.c.digest, _revoked_tokens.c.expires_at).where(
+        _revoked_tokens.c.expires_at > time.time())
+    with ENGINE.connect() as conn:
+        return dict(conn.execute(stmt).all())
+
+# ==================== REANALYSIS SERIES ====================
+# Counts recomputed from stored trajectories live next to the logged ones,
+# never in place of them, so both can be compared.
+
+_reanalysis_runs = ReanalysisRun.__table__
+_reanalysis_counts = ReanalysisCount.__table__
+_INSERT_REANALYSIS_COUNT = insert(_reanalysis_counts)
+
+def create_reanalysis_run(start, end, bucket_seconds, zones, camera_id=DEFAULT_CAMERA_ID):
+    """Register a running reanalysis and return its id"""
+    with ENGINE.begin() as conn:
+        result = conn.execute(insert(_reanalysis_runs).values(
+            created_at=datetime.utcnow(), camera_id=camera_id, start=start, end=end,
+            bucket_seconds=bucket_seconds, zones=json.dumps(zones), status="running"))
+        return result.inserted_primary_key[0]
+
+def save_reanalysis_counts(run_id, rows):
+    """Insert (bucket_start, zone_name, samples, sum_count, max_count, entries, dwell_seconds) rows"""
+    if not rows:
+        return
+    with ENGINE.begin() as conn:
+        conn.execute(_INSERT_REANALYSIS_COUNT, [{
+            "run_id": run_id, "bucket_start": bucket, "zone_name": zone, "samples": samples,
+            "sum_count": total, "max_count": peak, "entries": entries, "dwell_seconds": dwell
+        } for bucket, zone, samples, total, peak, entries, dwell in rows])
+
+def finish_reanalysis_run(run_id, status, frames=0, detections=0, error=None):
+    with ENGINE.begin() as conn:
+        conn.execute(update(_reanalysis_runs).where(_reanalysis_runs.c.id == run_id).values(
+            status=status, frames=frames, detections=detections, error=error))
+
+def _reanalysis_run_info(row):
+    return {
+        "id": row.id,
+        "created_at": row.created_at.strftime("%Y-%m-%d %H:%M:%S"),
+        "camera_id": row.camera_id,
+        "start": row.start.strftime("%Y-%m-%d %H:%M:%S"),
+        "end": row.end.strftime("%Y-%m-%d %H:%M:%S"),
+        "bucket_seconds": row.bucket_seconds,
+        "zones": json.loads(row.zones),
+        "status": row.status,
+        "frames": row.frames,
+        "detections": row.detections,
+        "error": row.error,
+    }
+
+def get_reanalysis_runs(limit=50):
+    """Reanalysis runs, newest first"""
+    stmt = select(_reanalysis_runs).order_by(_reanalysis_runs.c.id.desc()).limit(limit)
+    with ENGINE.connect() as conn:
+        return [_reanalysis_run_info(row) for row in conn.execute(stmt)]
+
+def get_reanalysis_run(run_id):
+    stmt = select(_reanalysis_runs).where(_reanalysis_runs.c.id == run_id)
+    with ENGINE.connect() as conn:
+        row = conn.execute(stmt).first()
+    return _reanalysis_run_info(row) if row is not None else None
+
+def get_reanalysis_series(run_id, zone_name=TOTAL_ZONE):
+    """Chart points of one zone in a run, oldest first, shaped like get_rollup_series() points"""
+    c = _reanalysis_counts.c
+    stmt = (
+        select(c.bucket_start, c.samples, c.sum_count, c.max_count, c.entries, c.dwell_seconds)
+        .where(c.run_id == run_id, c.zone_name == zone_name)
+        .order_by(c.bucket_start)
+    )
+    with ENGINE.connect() as conn:
+        rows = conn.execute(stmt).all()
+    return [
+        {
+            "timestamp": bucket.strftime("%Y-%m-%d %H:%M:%S"),
+            "samples": samples,
+            "average_count": round(total / samples, 2) if samples else 0,
+            "max_count": peak,
+            "entries": entries,
+            "dwell_seconds": round(dwell, 1)
+        }
+        for bucket, samples, total, peak, entries, dwell in rows
+    ]
+
+def get_reanalysis_zone_names(run_id):
+    stmt = select(_reanalysis_counts.c.zone_name).distinct().where(_reanalysis_counts.c.run_id == run_id)
+    with ENGINE.connect() as conn:
+        return sorted(conn.execute(stmt).scalars())
+
+def delete_reanalysis_run(run_id):
+    """Remove a run and its counts; returns False if there was no such run"""
+    with ENGINE.begin() as conn:
+        conn.execute(_reanalysis_counts.delete().where(_reanalysis_counts.c.run_id == run_id))
+        return conn.execute(_reanalysis_runs.delete().where(_reanalysis_runs.c.id == run_id)).rowcount > 0
+
 def get_recent_logs(limit=100):
     """Get recent log entries for analytics"""
     try:
-        db = SessionLocal()
-        logs = db.query(LogEntry).order_by(LogEntry.timestamp.desc()).limit(limit).all()
-        result = []
-        for log in logs:
-            result.append({
-                "timestamp": log.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                "total_people": log.total_people,
-                "zone_data": json.loads(log.zone_data) if log.zone_data else {}
-            })
-        db.close()
-        return result
+        with ENGINE.connect() as conn:
+            rows = conn.execute(_SELECT_RECENT_LOGS, {"limit": limit}).all()
+        return [
+            {
+                "timestamp": ts.strftime("%Y-%m-%d %H:%M:%S"),
+                "total_people": total,
+                "zone_data": json.loads(zone_data) if zone_data else {}
+            }
+            for ts, total, zone_data in rows
+        ]
     except Exception as e:
         print(f"Get recent logs error: {e}")
-        return []
\ No newline at end of file
+        return []
+
+# ==================== PER-ZONE TIME SERIES ====================
+
+def _zone_filters(stmt, start=None, end=None, zone_name=None, camera_id=None):
+    if start is not None:
+        stmt = stmt.where(ZoneCount.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(ZoneCount.timestamp < end)
+    if zone_name is not None:
+        stmt = stmt.where(ZoneCount.zone_name == zone_name)
+    if camera_id is not None:
+        stmt = stmt.where(ZoneCount.camera_id == camera_id)
+    return stmt
+
+def get_zone_series(zone_name, start=None, end=None, camera_id=None):
+    """(timestamp, count) tuples for one zone, oldest first"""
+    try:
+        stmt = select(ZoneCount.timestamp, ZoneCount.count).order_by(ZoneCount.timestamp)
+        stmt = _zone_filters(stmt, start, end, zone_name, camera_id)
+        with ENGINE.connect() as conn:
+            return [tuple(row) for row in conn.execute(stmt)]
+    except Exception as e:
+        print(f"Get zone series error: {e}")
+        return []
+
+def get_zone_aggregates(start=None, end=None, camera_id=None):
+    """Per-zone samples/avg/min/max over a time range, computed inside SQLite"""
+    try:
+        stmt = select(
+            ZoneCount.zone_name,
+            func.count(ZoneCount.id),
+            func.avg(ZoneCount.count),
+            func.min(ZoneCount.count),
+            func.max(ZoneCount.count),
+        ).group_by(ZoneCount.zone_name)
+        stmt = _zone_filters(stmt, start, end, None, camera_id)
+        with ENGINE.connect() as conn:
+            rows = conn.execute(stmt).all()
+        return {
+            name: {
+                "samples": samples,
+                "average_count": round(avg or 0, 2),
+                "min_count": min_count,
+                "max_count": max_count
+            }
+            for name, samples, avg, min_count, max_count in rows
+        }
+    except Exception as e:
+        print(f"Get zone aggregates error: {e}")
+        return {}
+
+# ==================== ROLLUP QUERIES ====================
+
+def pick_resolution(start, end=None):
+    """Coarsest rollup that still gives a useful number of points for the range"""
+    span = (end or datetime.utcnow()) - start
+    if span <= timedelta(hours=6):
+        return "minute"
+    if span <= timedelta(days=14):
+        return "hour"
+    return "day"
+
+def _rollup_range(stmt, resolution, start, end, camera_id):
+    # Buckets are selected by start time, so the first (partial) bucket is included
+    stmt = stmt.where(_rollups.c.resolution == resolution)
+    stmt = stmt.where(_rollups.c.bucket_start >= _BUCKET_FLOOR[resolution](start))
+    if end is not None:
+        stmt = stmt.where(_rollups.c.bucket_start < end)
+    if camera_id is not None:
+        stmt = stmt.where(_rollups.c.camera_id == camera_id)
+    return stmt
+
+def bucket_range(resolution, start, end=None):
+    """[first bucket start, last bucket end) that the buckets overlapping [start, end) cover"""
+    floor = _BUCKET_FLOOR[resolution]
+    if end is None:
+        return floor(start), None
+    last = floor(end)
+    return floor(start), (last if last == end else last + _BUCKET_LENGTH[resolution])
+
+def _range_pieces(start, end, resolution):
+    """
+    [start, end) as (resolution, piece_start, piece_end): whole buckets of
+    `resolution` in the middle, whole buckets of finer resolutions towards the
+    edges, and resolution None for the sub-minute ends read from raw rows
+    """
+    if end is not None and start >= end:
+        return []
+    if resolution is None:
+        return [(None, start, end)]
+    floor, length, finer = _BUCKET_FLOOR[resolution], _BUCKET_LENGTH[resolution], _FINER[resolution]
+    first = floor(start)
+    if first < start:
+        first += length
+    last = None if end is None else floor(end)
+    if last is not None and first >= last:
+        return _range_pieces(start, end, finer)
+    return _range_pieces(start, first, finer) + [(resolution, first, last)] + \
+        ([] if last is None else _range_pieces(last, end, finer))
+
+def _raw_stats(conn, start, end, camera_id):
+    """{zone: [samples, sum, min, max, latest]} of the raw rows in [start, end), TOTAL_ZONE from logs"""
+    zone_stmt = select(ZoneCount.zone_name, func.count(ZoneCount.id), func.sum(ZoneCount.count),
+                       func.min(ZoneCount.count), func.max(ZoneCount.count),
+                       func.max(ZoneCount.timestamp)).group_by(ZoneCount.zone_name)
+    zone_stmt = _zone_filters(zone_stmt, start, end, None, camera_id)
+    total_stmt = select(literal(TOTAL_ZONE), func.count(LogEntry.id), func.sum(LogEntry.total_people),
+                        func.min(LogEntry.total_people), func.max(LogEntry.total_people),
+                        func.max(LogEntry.timestamp)).where(
+        LogEntry.timestamp >= start, LogEntry.total_people.isnot(None))
+    if end is not None:
+        total_stmt = total_stmt.where(LogEntry.timestamp < end)
+    if camera_id is not None:
+        total_stmt = total_stmt.where(LogEntry.camera_id == camera_id)
+    rows = conn.execute(zone_stmt).all() + conn.execute(total_stmt).all()
+    return {name: list(agg) for name, *agg in rows if agg[0]}
+
+def get_rollup_series(start, end=None, zone_name=TOTAL_ZONE, resolution=None, camera_id=None):
+    """
+    Chart points for a zone (or TOTAL_ZONE) from the rollup tables, oldest first.
+    With camera_id=None the cameras are combined per bucket.
+    """
+    resolution = resolution or pick_resolution(start, end)
+    try:
+        stmt = select(
+            _rollups.c.bucket_start,
+            func.sum(_rollups.c.samples),
+            func.sum(_rollups.c.sum_count),
+            func.min(_rollups.c.min_count),
+            func.max(_rollups.c.max_count),
+            func.sum(_rollups.c.last_count),
+        ).where(_rollups.c.zone_name == zone_name).group_by(_rollups.c.bucket_start).order_by(_rollups.c.bucket_start)
+        stmt = _rollup_range(stmt, resolution, start, end, camera_id)
+        with ENGINE.connect() as conn:
+            rows = conn.execute(stmt).all()
+        covered_start, covered_end = bucket_range(resolution, start, end)
+        return {
+            "resolution": resolution,
+            # The first and last buckets can reach past the requested range
+            "start": covered_start.strftime("%Y-%m-%d %H:%M:%S"),
+            "end": covered_end.strftime("%Y-%m-%d %H:%M:%S") if covered_end else None,
+            "points": [
+                {
+                    "timestamp": bucket.strftime("%Y-%m-%d %H:%M:%S"),
+                    "samples": samples,
+                    "average_count": round(total / samples, 2) if samples else 0,
+                    "min_count": min_count,
+                    "max_count": max_count,
+                    "last_count": last_count
+                }
+                for bucket, samples, total, min_count, max_count, last_count in rows
+            ]
+        }
+    except Exception as e:
+        print(f"Get rollup series error: {e}")
+        return {"resolution": resolution, "points": []}
+
+def get_rollup_stats(start, end=None, resolution=None, camera_id=None):
+    """
+    samples/avg/min/max per zone (TOTAL_ZONE included) over exactly [start, end):
+    whole buckets of `resolution` where they fit, finer buckets and then raw
+    rows for the partial buckets at the edges
+    """
+    resolution = resolution or pick_resolution(start, end)
+    try:
+        merged = {}
+        with ENGINE.connect() as conn:
+            for piece_resolution, piece_start, piece_end in _range_pieces(start, end, resolution):
+                if piece_resolution is None:
+                    part = _raw_stats(conn, piece_start, piece_end, camera_id)
+                else:
+                    stmt = select(
+                        _rollups.c.zone_name,
+                        func.sum(_rollups.c.samples),
+                        func.sum(_rollups.c.sum_count),
+                        func.min(_rollups.c.min_count),
+                        func.max(_rollups.c.max_count),
+                        func.max(_rollups.c.last_timestamp),
+                    ).group_by(_rollups.c.zone_name)
+                    stmt = _rollup_range(stmt, piece_resolution, piece_start, piece_end, camera_id)
+                    part = {name: list(agg) for name, *agg in conn.execute(stmt).all()}
+                for name, (samples, total, min_count, max_count, latest) in part.items():
+                    agg = merged.get(name)
+                    if agg is None:
+                        merged[name] = [samples, total, min_count, max_count, latest]
+                        continue
+                    agg[0] += samples
+                    agg[1] += total
+                    agg[2] = min(agg[2], min_count)
+                    agg[3] = max(agg[3], max_count)
+                    if latest is not None and (agg[4] is None or latest > agg[4]):
+                        agg[4] = latest
+        return {
+            name: {
+                "samples": samples,
+                "average_count": round(total / samples, 2) if samples else 0,
+                "min_count": min_count,
+                "max_count": max_count,
+                "latest_timestamp": latest.strftime("%Y-%m-%d %H:%M:%S") if latest else None
+            }
+            for name, (samples, total, min_count, max_count, latest) in merged.items()
+        }
+    except Exception as e:
+        print(f"Get rollup stats error: {e}")
+        return {}
+
+# ==================== PAGINATED HISTORY ====================
+# Keyset pagination on (timestamp, id): every page is an index range scan,
+# no matter how deep into the history the client has paged.
+
+HISTORY_PAGE_MAX = 5000
+
+def encode_cursor(timestamp, row_id):
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """(timestamp, id) from an opaque cursor; raises ValueError if malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ts, row_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(ts), int(row_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def get_history_page(start=None, end=None, zone_name=None, camera_id=None,
+                     cursor=None, limit=500, descending=True):
+    """
+    One page of history as (columns, rows, next_cursor).
+    Without zone_name rows are (timestamp, camera_id, total_people) from logs,
+    with it (timestamp, camera_id, zone, count) from zone_counts.
+    """
+    limit = max(1, min(limit, HISTORY_PAGE_MAX))
+    if zone_name is None:
+        table = LogEntry.__table__
+        columns = ["timestamp", "camera_id", "total_people"]
+        stmt = select(table.c.id, table.c.timestamp, table.c.camera_id, table.c.total_people)
+    else:
+        table = ZoneCount.__table__
+        columns = ["timestamp", "camera_id", "zone", "count"]
+        stmt = select(table.c.id, table.c.timestamp, table.c.camera_id, table.c.zone_name, table.c.count)
+        stmt = stmt.where(table.c.zone_name == zone_name)
+
+    if start is not None:
+        stmt = stmt.where(table.c.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(table.c.timestamp < end)
+    if camera_id is not None:
+        stmt = stmt.where(table.c.camera_id == camera_id)
+
+    key = tuple_(table.c.timestamp, table.c.id)
+    if cursor is not None:
+        after_ts, after_id = decode_cursor(cursor)
+        stmt = stmt.where(key < tuple_(after_ts, after_id) if descending else key > tuple_(after_ts, after_id))
+    if descending:
+        stmt = stmt.order_by(table.c.timestamp.desc(), table.c.id.desc())
+    else:
+        stmt = stmt.order_by(table.c.timestamp, table.c.id)
+    stmt = stmt.limit(limit + 1)
+
+    with ENGINE.connect() as conn:
+        rows = conn.execute(stmt).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+
+    return columns, [
+        (row[1].strftime("%Y-%m-%d %H:%M:%S"),) + tuple(row[2:])
+        for row in rows
+    ], next_cursor
+
+# ==================== STREAMING EXPORT ====================
+
+EXPORT_FETCH_SIZE = 1000
+
+def get_zone_names(start=None, end=None, camera_id=None):
+    """Distinct zone names seen in a time range (for export column headers)"""
+    stmt = _zone_filters(select(ZoneCount.zone_name).distinct(), start, end, None, camera_id)
+    with ENGINE.connect() as conn:
+        return sorted(conn.execute(stmt).scalars())
+
+def iter_logs(start=None, end=None, camera_id=None):
+    """
+    Yield (timestamp, camera_id, total_people, zone_data_json) oldest first,
+    fetched EXPORT_FETCH_SIZE rows at a time so memory stays flat for any range.
+    The connection is held until the generator is exhausted or closed.
+    """
+    logs = LogEntry.__table__
+    stmt = select(logs.c.timestamp, logs.c.camera_id, logs.c.total_people, logs.c.zone_data)
+    if start is not None:
+        stmt = stmt.where(logs.c.timestamp >= start)
+    if end is not None:
+        stmt = stmt.where(logs.c.timestamp < end)
+    if camera_id is not None:
+        stmt = stmt.where(logs.c.camera_id == camera_id)
+    stmt = stmt.order_by(logs.c.timestamp, logs.c.id)
+
+    with ENGINE.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_FETCH_SIZE).execute(stmt)
+        for partition in result.partitions():
+            yield from partition
+
+try:
+    migrate_schema()
+except Exception as e:
+    print(f"Schema migration error: {e}")
@@ -0,0 +1,188 @@
+"""
+Retention Policy Engine
+Expires old samples from crowd_history.db in small batches and gives the
+freed pages back to the filesystem with incremental vacuum.
+
+Databases created before auto_vacuum=INCREMENTAL was configured need a
+one-time full VACUUM to switch over. VACUUM rewrites the whole file under
+the write lock, so it is an offline step (python run.py --vacuum-db with
+the server stopped); until then retention only deletes rows.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, literal_column, select, text
+
+try:
+    import database as db
+except ImportError:
+    # Imported as part of the models package without models/ on sys.path
+    from . import database as db
+
+# Days to keep each kind of data (None = keep forever)
+RETENTION_POLICY = {
+    "raw_days": 30,      # logs + zone_counts
+    "minute_days": 90,   # zone_rollups, resolution=minute
+    "hour_days": 400,    # zone_rollups, resolution=hour
+    "day_days": None,    # zone_rollups, resolution=day
+}
+
+DELETE_BATCH = 2000      # rows per delete transaction
+BATCH_PAUSE = 0.05       # seconds between batches so the log writer gets the lock
+VACUUM_STEP_PAGES = 1000
+RETENTION_INTERVAL = 6 * 3600
+
+_run_lock = threading.Lock()
+_worker_thread = None
+last_report = None
+
+def _storage_stats(conn):
+    page_size = conn.execute(text("PRAGMA page_size")).scalar()
+    page_count = conn.execute(text("PRAGMA page_count")).scalar()
+    freelist = conn.execute(text("PRAGMA freelist_count")).scalar()
+    files = [db.DB_PATH, db.DB_PATH + "-wal"]
+    return {
+        "page_size": page_size,
+        "page_count": page_count,
+        "freelist_pages": freelist,
+        "auto_vacuum": conn.execute(text("PRAGMA auto_vacuum")).scalar(),
+        "file_bytes": sum(os.path.getsize(f) for f in files if os.path.exists(f)),
+    }
+
+def get_storage_stats():
+    """Page/file statistics and row counts of the history database"""
+    with db.ENGINE.connect() as conn:
+        stats = _storage_stats(conn)
+        for table in ("logs", "zone_counts", "zone_rollups"):
+            stats[f"{table}_rows"] = conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+    return stats
+
+def _delete_in_batches(table, key_column, where):
+    """Delete matching rows DELETE_BATCH at a time, one short transaction each"""
+    subquery = select(key_column).select_from(table).where(where).limit(DELETE_BATCH)
+    stmt = delete(table).where(key_column.in_(subquery))
+    deleted = 0
+    while True:
+        with db.ENGINE.begin() as conn:
+            count = conn.execute(stmt).rowcount
+        deleted += max(count, 0)
+        if count < DELETE_BATCH:
+            return deleted
+        time.sleep(BATCH_PAUSE)
+
+INCREMENTAL = 2   # PRAGMA auto_vacuum value
+
+def convert_to_incremental_vacuum():
+    """
+    Switch an older database to auto_vacuum=INCREMENTAL with a full VACUUM.
+    Holds the write lock for the whole rewrite: only run it while nothing
+    else uses the database. Returns the storage stats before and after, or
+    None when the database is already incremental.
+    """
+    with _run_lock:
+        with db.ENGINE.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            before = _storage_stats(conn)
+            if before["auto_vacuum"] == INCREMENTAL:
+                return None
+            conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+            conn.execute(text("VACUUM"))
+            conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+            after = _storage_stats(conn)
+    return {"before": before, "after": after,
+            "bytes_reclaimed": max(before["file_bytes"] - after["file_bytes"], 0)}
+
+def _incremental_vacuum(conn):
+    """Release free pages a step at a time; returns the number of pages released"""
+    released = 0
+    while True:
+        free = conn.execute(text("PRAGMA freelist_count")).scalar()
+        if not free:
+            return released
+        # pysqlite steps a PRAGMA only once (one page); executescript runs it to completion
+        conn.connection.dbapi_connection.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES});")
+        after = conn.execute(text("PRAGMA freelist_count")).scalar()
+        if after >= free:
+            return released
+        released += free - after
+        time.sleep(BATCH_PAUSE)
+
+def apply_retention(policy=None, now=None):
+    """
+    Run the retention policy once and report what was removed and reclaimed.
+    Safe to call while the video loop keeps logging: only short delete
+    transactions and incremental vacuum steps, never a full VACUUM.
+    """
+    policy = {**RETENTION_POLICY, **(policy or {})}
+    now = now or datetime.utcnow()
+    started = time.perf_counter()
+
+    with _run_lock:
+        with db.ENGINE.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            before = _storage_stats(conn)
+
+        deleted = {}
+        if policy["raw_days"] is not None:
+            cutoff = now - timedelta(days=policy["raw_days"])
+            deleted["zone_counts"] = _delete_in_batches(
+                db.ZoneCount.__table__, db.ZoneCount.id, db.ZoneCount.timestamp < cutoff)
+            deleted["logs"] = _delete_in_batches(
+                db.LogEntry.__table__, db.LogEntry.id, db.LogEntry.timestamp < cutoff)
+
+        # zone_rollups has a composite primary key, so batches are picked by rowid
+        rollups = db.ZoneRollup.__table__
+        for resolution in db.ROLLUP_RESOLUTIONS:
+            days = policy.get(f"{resolution}_days")
+            if days is None:
+                continue
+            cutoff = now - timedelta(days=days)
+            deleted[f"rollups_{resolution}"] = _delete_in_batches(
+                rollups, literal_column("rowid"),
+                (rollups.c.resolution == resolution) & (rollups.c.bucket_start < cutoff))
+        if any(deleted.values()):
+            db.bump_data_version()
+
+        with db.ENGINE.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            incremental = before["auto_vacuum"] == INCREMENTAL
+            pages_released = _incremental_vacuum(conn) if incremental else 0
+            conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+            after = _storage_stats(conn)
+
+    report = {
+        "ran_at": now.strftime("%Y-%m-%d %H:%M:%S"),
+        "policy": policy,
+        "deleted_rows": deleted,
+        "pages_released": pages_released,
+        "incremental_vacuum": incremental,
+        "bytes_before": before["file_bytes"],
+        "bytes_after": after["file_bytes"],
+        "bytes_reclaimed": max(before["file_bytes"] - after["file_bytes"], 0),
+        "duration_seconds": round(time.perf_counter() - started, 3),
+    }
+    if not incremental:
+        report["note"] = "Freed pages are reused but not returned to the filesystem until run.py --vacuum-db"
+    global last_report
+    last_report = report
+    return report
+
+def _retention_loop(interval):
+    while True:
+        try:
+            report = apply_retention()
+            deleted = sum(report["deleted_rows"].values())
+            if deleted or report["pages_released"]:
+                print(f"🧹 Retention: deleted {deleted} rows, reclaimed {report['bytes_reclaimed']} bytes")
+        except Exception as e:
+            print(f"Retention error: {e}")
+        time.sleep(interval)
+
+def start_retention_worker(interval=RETENTION_INTERVAL):
+    """Run the retention policy in a background thread every `interval` seconds"""
+    global _worker_thread
+    if _worker_thread is not None and _worker_thread.is_alive():
+        return _worker_thread
+    _worker_thread = threading.Thread(target=_retention_loop, args=(interval,), name="db-retention", daemon=True)
+    _worker_thread.start()
+    return _worker_thread
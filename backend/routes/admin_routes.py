@@ -4,7 +4,7 @@ Admin-only endpoints for managing users, cameras, zones, and settings
 """
 
 from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List, Dict
+from typing import List, Dict, Optional
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
@@ -188,4 +188,28 @@ def set_zone_threshold(
 def get_thresholds(current_user: auth.User = Depends(auth.get_current_user)):
     """Get all thresholds"""
     import database as db
-    return db.get_all_thresholds()
+    import response_cache
+    return response_cache.cached("thresholds", (), db.get_all_thresholds)
+
+# ==================== STORAGE / RETENTION ====================
+
+@router.get("/storage")
+def get_storage(current_user: auth.User = Depends(auth.require_admin)):
+    """Database size, free pages and row counts (Admin only)"""
+    import retention
+    return {"storage": retention.get_storage_stats(), "last_retention_run": retention.last_report}
+
+@router.post("/retention/run")
+def run_retention(
+    raw_days: Optional[int] = None,
+    minute_days: Optional[int] = None,
+    hour_days: Optional[int] = None,
+    current_user: auth.User = Depends(auth.require_admin)
+):
+    """Expire old samples now and report reclaimed space (Admin only)"""
+    import retention
+    overrides = {"raw_days": raw_days, "minute_days": minute_days, "hour_days": hour_days}
+    policy = {key: value for key, value in overrides.items() if value is not None}
+    if any(value < 1 for value in policy.values()):
+        raise HTTPException(status_code=400, detail="Retention periods must be at least 1 day")
+    return retention.apply_retention(policy)
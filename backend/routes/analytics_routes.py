@@ -4,15 +4,15 @@ Endpoints for analytics, reports, and data export
 """
 
 from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import FileResponse
+from typing import Optional
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 import sys
 import os
+import csv
 import datetime
-import pandas as pd
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.lib import colors
+import io
+import json
+import zlib
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
@@ -23,9 +23,6 @@ except ImportError:
 
 router = APIRouter(prefix="/analytics", tags=["Analytics"])
 
-# Global state
-history_log = []
-
 @router.get("/data")
 def get_analytics(current_user: auth.User = Depends(auth.get_current_user)):
     """
@@ -33,134 +30,379 @@ def get_analytics(current_user: auth.User = Depends(auth.get_current_user)):
     Requires authentication
     """
     import database as db
-    recent_logs = db.get_recent_logs(limit=50)
+    import response_cache
+
+    def compute():
+        recent_logs = db.get_recent_logs(limit=50)
+        return {
+            "recent_logs": recent_logs,
+            "total_entries": len(recent_logs)
+        }
+    return response_cache.cached("analytics/data", (), compute)
+
+@router.get("/history")
+def get_history(
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    zone: Optional[str] = None,
+    camera_id: Optional[int] = None,
+    cursor: Optional[str] = None,
+    limit: int = 500,
+    order: str = "desc",
+    current_user: auth.User = Depends(auth.get_current_user)
+):
+    """
+    Page through history with time/zone/camera filters
+    Pass next_cursor back as cursor to get the following page
+    Requires authentication
+    """
+    import database as db
+    start, end = db.naive_utc(start), db.naive_utc(end)
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+    try:
+        columns, rows, next_cursor = db.get_history_page(
+            start, end, zone, camera_id, cursor, limit, descending=(order == "desc"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {
-        "recent_logs": recent_logs,
-        "total_entries": len(recent_logs)
+        "columns": columns,
+        "rows": rows,
+        "count": len(rows),
+        "next_cursor": next_cursor
     }
 
+@router.get("/archive")
+def get_archive_info(current_user: auth.User = Depends(auth.get_current_user)):
+    """
+    Days available in the columnar (Parquet) archive
+    Requires authentication
+    """
+    import archive
+    return {"available": archive.is_available(), "days": archive.archived_days()}
+
+@router.get("/archive/query")
+def query_archive(
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    zone: Optional[str] = None,
+    camera_id: Optional[int] = None,
+    group_by: str = "zone",
+    current_user: auth.User = Depends(auth.get_current_user)
+):
+    """
+    Aggregate archived counts without touching the live database
+    group_by: comma separated list of zone, camera, day, hour
+    Requires authentication
+    """
+    import archive
+    import database as db
+    if not archive.is_available():
+        raise HTTPException(status_code=503, detail="Archive queries need pyarrow installed on the server")
+    keys = tuple(key.strip() for key in group_by.split(",") if key.strip())
+    start, end = db.naive_utc(start), db.naive_utc(end)
+    try:
+        rows = archive.query_archive(start, end, zone, camera_id, keys or ("zone",))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"group_by": list(keys), "rows": rows}
+
+def _csv_chunks(rows, compress=False, rows_per_chunk=1000):
+    """Encode CSV rows into response chunks, optionally as a gzip stream"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    gzipper = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None  # wbits 31 = gzip container
+
+    def drain():
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return gzipper.compress(data) if gzipper else data
+
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % rows_per_chunk == 0:
+            chunk = drain()
+            if chunk:
+                yield chunk
+    chunk = drain()
+    if gzipper:
+        chunk += gzipper.flush()
+    if chunk:
+        yield chunk
+
 @router.get("/export/csv")
-def export_csv(current_user: auth.User = Depends(auth.require_admin)):
+def export_csv(
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    camera_id: Optional[int] = None,
+    gzip: bool = False,
+    current_user: auth.User = Depends(auth.require_admin)
+):
     """
-    Export historical data as CSV
+    Export historical data as CSV, streamed straight from the database
+    Optional time range / camera filter; gzip=true downloads a .csv.gz
     Admin only
     """
-    if not history_log:
-        # Get from database if history_log is empty
-        import database as db
-        recent_logs = db.get_recent_logs(limit=100)
-        df = pd.DataFrame(recent_logs)
-    else:
-        df = pd.DataFrame(history_log)
+    import database as db
+    start, end = db.naive_utc(start), db.naive_utc(end)
+    zone_names = db.get_zone_names(start, end, camera_id)
+
+    def rows():
+        yield ["timestamp", "camera_id", "total_people"] + zone_names
+        for ts, cam_id, total, zone_data in db.iter_logs(start, end, camera_id):
+            try:
+                zones = json.loads(zone_data) if zone_data else {}
+            except ValueError:
+                zones = {}
+            yield [ts.strftime("%Y-%m-%d %H:%M:%S"), cam_id, total] + [zones.get(name, "") for name in zone_names]
 
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"crowd_report_{timestamp}.csv"
-    file_path = os.path.join(os.path.dirname(__file__), "..", filename)
-    df.to_csv(file_path, index=False)
+    filename = f"crowd_report_{timestamp}.csv" + (".gz" if gzip else "")
+    return StreamingResponse(
+        _csv_chunks(rows(), compress=gzip),
+        media_type="application/gzip" if gzip else "text/csv",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+def _report_range(start, end):
+    """Default to the last 24 hours, aligned to whole minutes so repeated requests share a cache entry"""
+    import database as db
+    start, end = db.naive_utc(start), db.naive_utc(end)
+    if end is None:
+        end = datetime.datetime.utcnow().replace(second=0, microsecond=0)
+    if start is None:
+        start = end - datetime.timedelta(hours=24)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return start, end
+
+@router.post("/reports")
+def create_report(
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    current_user: auth.User = Depends(auth.require_admin)
+):
+    """
+    Queue a PDF report for a time range and return its job ID
+    Fetch it from /analytics/reports/{job_id}/download once status is done
+    Admin only
+    """
+    import reports
+    start, end = _report_range(start, end)
+    return reports.job_info(reports.submit_report(start, end))
+
+@router.get("/reports/{job_id}")
+def get_report_status(job_id: str, current_user: auth.User = Depends(auth.require_admin)):
+    """
+    Status of a report job (queued / running / done / failed)
+    Admin only
+    """
+    import reports
+    job = reports.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    return reports.job_info(job)
 
-    return FileResponse(file_path, media_type="text/csv", filename=filename)
+@router.get("/reports/{job_id}/download")
+def download_report(job_id: str, current_user: auth.User = Depends(auth.require_admin)):
+    """
+    Download a finished PDF report
+    Admin only
+    """
+    import reports
+    job = reports.get_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    if job["status"] == "failed":
+        raise HTTPException(status_code=500, detail=f"Report generation failed: {job['error']}")
+    if job["status"] != "done" or not os.path.exists(job["path"]):
+        raise HTTPException(status_code=409, detail=f"Report is not ready yet (status: {job['status']})")
+    filename = f"crowd_report_{job['start'].strftime('%Y%m%d_%H%M')}_{job['end'].strftime('%Y%m%d_%H%M')}.pdf"
+    return FileResponse(job["path"], media_type="application/pdf", filename=filename)
 
 @router.get("/export/pdf")
-def export_pdf(current_user: auth.User = Depends(auth.require_admin)):
+def export_pdf(
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    wait: float = 0.0,
+    current_user: auth.User = Depends(auth.require_admin)
+):
     """
-    Export professional PDF report with statistics
+    Export PDF report with statistics
+    Served instantly from the report cache; otherwise rendering is queued,
+    waited for up to `wait` seconds, and a 202 with the job ID is returned
+    if it is not finished by then
     Admin only
     """
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"crowd_report_{timestamp}.pdf"
-    file_path = os.path.join(os.path.dirname(__file__), "..", filename)
-
-    # Create PDF
-    doc = SimpleDocTemplate(file_path, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Title
-    title = Paragraph("<b>CrowdCount - Infosys</b><br/>Crowd Analytics Report", styles['Title'])
-    elements.append(title)
-    elements.append(Spacer(1, 20))
-
-    # Metadata
-    meta_text = f"<b>Generated:</b> {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}<br/>"
-    meta_text += f"<b>Generated by:</b> {current_user.full_name} ({current_user.role})"
-    meta = Paragraph(meta_text, styles['Normal'])
-    elements.append(meta)
-    elements.append(Spacer(1, 20))
-
-    # Zone summary
-    import database as db
-    thresholds = db.get_all_thresholds()
-    
-    zone_data = [["Zone Name", "Threshold", "Alert Enabled"]]
-    for zone_name, data in thresholds.items():
-        zone_data.append([
-            zone_name,
-            str(data.get("max_capacity", 30)),
-            "Yes" if data.get("alert_enabled", True) else "No"
-        ])
-
-    zone_table = Table(zone_data)
-    zone_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-    
-    elements.append(Paragraph("<b>Zone Configuration</b>", styles['Heading2']))
-    elements.append(Spacer(1, 10))
-    elements.append(zone_table)
-    elements.append(Spacer(1, 20))
-
-    # Historical data
-    recent_logs = db.get_recent_logs(limit=10)
-    if recent_logs:
-        elements.append(Paragraph("<b>Recent Activity (Last 10 Entries)</b>", styles['Heading2']))
-        elements.append(Spacer(1, 10))
-        
-        log_data = [["Timestamp", "Total People"]]
-        for log in recent_logs:
-            log_data.append([log["timestamp"], str(log["total_people"])])
-        
-        log_table = Table(log_data)
-        log_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
-        
-        elements.append(log_table)
-
-    doc.build(elements)
-    return FileResponse(file_path, media_type="application/pdf", filename=filename)
+    import reports
+    start, end = _report_range(start, end)
+    job = reports.submit_report(start, end)
+    if wait > 0:
+        reports.wait_for_job(job, wait)
+    if job["status"] in ("done", "failed"):
+        return download_report(job["job_id"], current_user)
+    return JSONResponse(status_code=202, content=reports.job_info(job))
 
 @router.get("/stats")
-def get_statistics(current_user: auth.User = Depends(auth.get_current_user)):
+def get_statistics(
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    camera_id: Optional[int] = None,
+    current_user: auth.User = Depends(auth.get_current_user)
+):
     """
-    Get statistical summary
+    Get statistical summary over a time range (default: last 24 hours)
+    Read from the minute/hour/day rollup tables, raw rows for partial minutes at the edges
     Requires authentication
     """
     import database as db
-    recent_logs = db.get_recent_logs(limit=100)
-    
-    if not recent_logs:
-        return {"message": "No data available"}
-    
-    total_counts = [log["total_people"] for log in recent_logs]
-    
+    import response_cache
+    start, end = db.naive_utc(start), db.naive_utc(end)
+
+    def compute(start=start):
+        if start is None:
+            start = datetime.datetime.utcnow() - datetime.timedelta(hours=24)
+        resolution = db.pick_resolution(start, end)
+        stats = db.get_rollup_stats(start, end, resolution, camera_id)
+        total = stats.pop(db.TOTAL_ZONE, None)
+
+        if not total:
+            return {"message": "No data available"}
+
+        return {
+            "total_entries": total["samples"],
+            "average_count": total["average_count"],
+            "max_count": total["max_count"],
+            "min_count": total["min_count"],
+            "latest_timestamp": total["latest_timestamp"],
+            "resolution": resolution,
+            "zones": stats
+        }
+    return response_cache.cached("analytics/stats", (start, end, camera_id), compute)
+
+@router.get("/chart")
+def get_chart_data(
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    zone: Optional[str] = None,
+    resolution: Optional[str] = None,
+    camera_id: Optional[int] = None,
+    current_user: auth.User = Depends(auth.get_current_user)
+):
+    """
+    Time series for dashboard charts (default: total people, last 24 hours)
+    resolution: minute / hour / day (picked from the range when omitted)
+    start/end of the response are the range the returned buckets cover
+    Requires authentication
+    """
+    import database as db
+    start, end = db.naive_utc(start), db.naive_utc(end)
+    if resolution is not None and resolution not in db.ROLLUP_RESOLUTIONS:
+        raise HTTPException(status_code=400, detail=f"resolution must be one of {list(db.ROLLUP_RESOLUTIONS)}")
+    import response_cache
+
+    def compute(start=start):
+        if start is None:
+            start = datetime.datetime.utcnow() - datetime.timedelta(hours=24)
+        series = db.get_rollup_series(start, end, zone or db.TOTAL_ZONE, resolution, camera_id)
+        return {"zone": zone or "total", **series}
+    return response_cache.cached("analytics/chart", (start, end, zone, resolution, camera_id), compute)
+
+@router.get("/zones")
+def get_zone_statistics(
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    camera_id: Optional[int] = None,
+    current_user: auth.User = Depends(auth.get_current_user)
+):
+    """
+    Per-zone samples/avg/min/max over a time range (default: last 24 hours)
+    Aggregated inside SQLite from the zone_counts table
+    Requires authentication
+    """
+    import database as db
+    import response_cache
+    start, end = db.naive_utc(start), db.naive_utc(end)
+
+    def compute(start=start):
+        if start is None:
+            start = datetime.datetime.utcnow() - datetime.timedelta(hours=24)
+        return {
+            "start": start.strftime("%Y-%m-%d %H:%M:%S"),
+            "end": end.strftime("%Y-%m-%d %H:%M:%S") if end else None,
+            "zones": db.get_zone_aggregates(start, end, camera_id)
+        }
+    return response_cache.cached("analytics/zones", (start, end, camera_id), compute)
+
+@router.get("/zones/{zone_name}/series")
+def get_zone_series(
+    zone_name: str,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    camera_id: Optional[int] = None,
+    current_user: auth.User = Depends(auth.get_current_user)
+):
+    """
+    Raw count samples of one zone (default: last hour)
+    Requires authentication
+    """
+    import database as db
+    start, end = db.naive_utc(start), db.naive_utc(end)
+    if start is None:
+        start = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+    series = db.get_zone_series(zone_name, start, end, camera_id)
     return {
-        "total_entries": len(recent_logs),
-        "average_count": sum(total_counts) / len(total_counts) if total_counts else 0,
-        "max_count": max(total_counts) if total_counts else 0,
-        "min_count": min(total_counts) if total_counts else 0,
-        "latest_timestamp": recent_logs[0]["timestamp"] if recent_logs else None
+        "zone": zone_name,
+        "timestamps": [ts.strftime("%Y-%m-%d %H:%M:%S") for ts, _ in series],
+        "counts": [count for _, count in series]
     }
+
+@router.get("/live")
+def get_live_statistics(
+    zone: Optional[str] = None,
+    current_user: auth.User = Depends(auth.get_current_user)
+):
+    """
+    Rolling mean/variance/EWMA/percentiles per zone over 1m/15m/1h windows
+    Computed in memory from the live feed, no history queries
+    Requires authentication
+    """
+    import rolling_stats
+    return {"windows": list(rolling_stats.WINDOWS), **rolling_stats.snapshot(zone)}
+
+@router.get("/alerts")
+def get_alerts(
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+    zone: Optional[str] = None,
+    camera_id: Optional[int] = None,
+    limit: int = 100,
+    current_user: auth.User = Depends(auth.get_current_user)
+):
+    """
+    Stored capacity alert events, newest first
+    Requires authentication
+    """
+    import database as db
+    start, end = db.naive_utc(start), db.naive_utc(end)
+    return {"events": db.get_alert_events(start, end, zone, camera_id, min(limit, 1000))}
+
+@router.get("/alerts/active")
+def get_active_alerts(current_user: auth.User = Depends(auth.get_current_user)):
+    """
+    Zones currently over capacity, per camera
+    Requires authentication
+    """
+    import alerts
+    return {"active": alerts.active_alerts(), "recent": alerts.recent_events(20)}
+
+@router.get("/alerts/stream")
+def stream_alerts(current_user: auth.User = Depends(auth.get_current_user)):
+    """
+    Server-Sent Events stream of alerts as they are raised and cleared
+    Requires authentication
+    """
+    import alerts
+    return StreamingResponse(alerts.stream_events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
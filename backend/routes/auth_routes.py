@@ -43,11 +43,13 @@ def login(login_data: auth.LoginRequest):
     }
 
 @router.post("/logout")
-def logout(current_user: auth.User = Depends(auth.get_current_user)):
+def logout(credentials: HTTPAuthorizationCredentials = Depends(security),
+           current_user: auth.User = Depends(auth.get_current_user)):
     """
     User logout endpoint
-    (Token invalidation handled client-side)
+    Revokes the token until it expires
     """
+    auth.revoke_token(credentials.credentials)
     return {"message": f"User {current_user.username} logged out successfully"}
 
 @router.get("/me")
@@ -68,11 +70,11 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
     """
     try:
         token = credentials.credentials
-        token_data = auth.decode_token(token)
+        user = auth.verify_token(token)
         return {
             "valid": True,
-            "username": token_data.username,
-            "role": token_data.role
+            "username": user.username,
+            "role": user.role
         }
     except HTTPException:
         return {"valid": False}
@@ -3,7 +3,7 @@ Public Routes
 Public endpoints that don't require authentication
 """
 
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Request, Response
 from fastapi.responses import StreamingResponse
 import sys
 import os
@@ -62,3 +62,24 @@ def video_feed():
         generate(),
         media_type="multipart/x-mixed-replace; boundary=frame"
     )
+
+@router.get("/snapshot/{camera_id}")
+def snapshot(camera_id: int, request: Request, variant: str = "annotated"):
+    """
+    Latest still image of a camera
+    Served from the JPEG cache with ETag / Last-Modified validators
+    """
+    import frame_cache
+
+    if variant not in frame_cache.VARIANTS:
+        raise HTTPException(status_code=400, detail=f"variant must be one of {list(frame_cache.VARIANTS)}")
+
+    snap = frame_cache.get_snapshot(camera_id, variant)
+    if snap is None:
+        raise HTTPException(status_code=404, detail="No frame available yet")
+
+    headers = frame_cache.snapshot_headers(snap)
+    if frame_cache.is_not_modified(snap, request.headers.get("if-none-match"),
+                                   request.headers.get("if-modified-since")):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snap["jpeg"], media_type="image/jpeg", headers=headers)
@@ -0,0 +1,460 @@
+"""
+CrowdCount Runner
+One entry point for every way of running CrowdCount, all on the same
+pipeline runtime (services/pipeline.py):
+
+    python run.py                          # headless: video pipeline + API
+    python run.py --mode window            # pipeline + API + local window with zone editing
+    python run.py --mode api-only          # API only, no camera
+    python run.py --detect-process         # YOLO detection in its own process
+    python run.py --workers 4              # pipeline + 4 API worker processes sharing live state
+    python run.py --record                 # also record tracked detections (shared/detections/)
+    python run.py --replay det.ccdl        # analytics from a recorded log: no camera, no YOLO
+                                           # (into a scratch database unless --replay-db is given)
+    python run.py --vacuum-db              # one-time offline switch to incremental vacuum, then exit
+
+main.py, unified_server.py and start_api_server.py are kept as shortcuts.
+"""
+
+import argparse
+import getpass
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+# Setup paths
+backend_dir = os.path.dirname(os.path.abspath(__file__))
+for sub in ('_archive', 'auth', 'models', 'services'):
+    path = os.path.join(backend_dir, sub)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+if backend_dir not in sys.path:
+    sys.path.insert(0, backend_dir)
+
+MODES = ("headless", "window", "api-only")
+
+def print_banner(lines):
+    print("=" * 60)
+    for line in lines:
+        print(line)
+    print("=" * 60)
+
+# ==================== LIVE STATE ====================
+
+class ApiServerState:
+    """Publishes pipeline output into the API module's globals (same process only)"""
+
+    def __init__(self, api_server):
+        self.api = api_server
+
+    def publish_counts(self, counts):
+        self.api.live_count.update(counts)
+        # Per-frame history for CSV export (bounded buffer, spills to disk)
+        self.api.history_log.record(counts["total_people"], counts["zones"])
+
+def shared_live_state():
+    """
+    Live state for API workers in other processes: counts, history and frames
+    go to shared memory, which the workers find through the environment.
+    """
+    import live_state
+    import frame_cache
+    from history_buffer import HistoryBuffer
+    store = live_state.create()
+    frame_cache.use_store(store)
+    publisher = live_state.LivePublisher(store, HistoryBuffer(buffer=store.history_buffer))
+    print(f"✅ Live state shared in memory ({store.name})")
+    return publisher
+
+# ==================== API ====================
+
+def run_api(app, host, port, log_level="info", background=False, workers=1):
+    import uvicorn
+    if workers > 1:
+        # Workers import the app themselves, so it has to be given by name
+        uvicorn.run("api_server_old:app", host=host, port=port, log_level=log_level, workers=workers)
+        return None
+    if not background:
+        uvicorn.run(app, host=host, port=port, log_level=log_level)
+        return None
+    thread = threading.Thread(target=uvicorn.run, args=(app,),
+                              kwargs={"host": host, "port": port, "log_level": log_level},
+                              name="api-server", daemon=True)
+    thread.start()
+    return thread
+
+# ==================== PIPELINE ====================
+
+def open_camera(source):
+    """Open the video source; without one the API keeps serving history, reports and administration"""
+    import camera_feed as cam
+    try:
+        cam.start_camera(source)
+        return True
+    except Exception as e:
+        print(f"❌ Camera error: {e}")
+        print("⚠️ Running the API without a live pipeline")
+        return False
+
+def start_pipeline(args, live, display=False):
+    """The replay or camera pipeline plus the storage workers; None when the camera cannot be opened"""
+    import zones as zn
+    import pipeline as pl
+    import retention
+    import archive
+
+    zn.load_zones()
+    print("✅ Zones loaded")
+    if args.replay:
+        runtime = pl.build_replay_pipeline(args.replay, live=live, speed=args.replay_speed,
+                                           loop=args.replay_loop, display=display)
+        runtime.start()
+        print(f"✅ Replaying {args.replay} (no camera, no detection)")
+    elif open_camera(args.source):
+        runtime = pl.build_crowd_pipeline(
+            live=live,
+            detect_mode="process" if args.detect_process else "thread",
+            display=display,
+            target_fps=args.fps or None,
+            record=args.record,
+            trajectories=not args.no_trajectories
+        )
+        runtime.start()
+        print(f"✅ Pipeline started (detection in a {'separate process' if args.detect_process else 'thread'})")
+        if runtime.recorder is not None:
+            print(f"⏺️ Recording detections to {runtime.recorder.path}")
+    else:
+        runtime = None
+
+    retention.start_retention_worker()
+    archive.start_archive_worker()
+    return runtime
+
+def stop_pipeline(runtime):
+    import camera_feed as cam
+    import database as db
+    if runtime is None:
+        db.flush_logs()
+        return
+    runtime.stop()
+    cam.stop_camera()
+    if runtime.recorder is not None:
+        runtime.recorder.close()
+    if runtime.trajectories is not None:
+        runtime.trajectories.close()
+    db.flush_logs()
+
+def parse_source(source):
+    """Webcam index, stream URL or video file path"""
+    return int(source) if source.isdigit() else source
+
+# ==================== REPLAY DATABASE ====================
+
+def use_replay_database(path=None):
+    """
+    Point database.py (and the archive next to it) at another file before
+    anything imports it, so a replay never adds counts or alert events to the
+    live history. The live thresholds are copied into a new file so replayed
+    alerts fire as they would have; they only reach this server's clients.
+    """
+    live_path = os.environ.get("CROWDCOUNT_DB_PATH",
+                               os.path.join(os.path.dirname(backend_dir), "shared", "crowd_history.db"))
+    path = path or os.path.join(tempfile.mkdtemp(prefix="crowdcount_replay_"), "crowd_history.db")
+    fresh = not os.path.exists(path)
+    os.environ["CROWDCOUNT_DB_PATH"] = path   # inherited by API worker processes
+    import database as db
+    if fresh and os.path.abspath(path) != os.path.abspath(live_path) and os.path.exists(live_path):
+        try:
+            with sqlite3.connect(f"file:{live_path}?mode=ro", uri=True) as conn:
+                rows = conn.execute("SELECT zone_name, max_capacity, alert_enabled FROM thresholds").fetchall()
+        except sqlite3.Error as e:
+            print(f"⚠️ Could not copy thresholds from {live_path}: {e}")
+            rows = []
+        if rows:
+            with db.ENGINE.begin() as conn:
+                conn.execute(db.Threshold.__table__.insert(),
+                             [{"zone_name": name, "max_capacity": capacity, "alert_enabled": enabled}
+                              for name, capacity, enabled in rows])
+            db.invalidate_thresholds()
+    print(f"✅ Replay database: {path}")
+    return path
+
+# ==================== WINDOW MODE: ZONE EDITING ====================
+
+ADMIN_PASSWORD = "admin123"  # Should match web admin password
+
+def check_admin_access():
+    """Check if user has admin access for zone management"""
+    print("\n" + "="*60)
+    print("🔒 CROWDCOUNT - ZONE MANAGEMENT ACCESS CONTROL")
+    print("="*60)
+    print("\n📋 Zone management requires ADMIN privileges")
+    print("   - Create zones (keyboard: 'n')")
+    print("   - Edit zones (keyboard: 'e')")
+    print("   - Delete zones (keyboard: 'd')")
+    print("   - Save zones (keyboard: 's')")
+    print("\n💡 Options:")
+    print("   1. Press ENTER to skip (VIEW-ONLY mode)")
+    print("   2. Enter admin password for FULL ACCESS")
+    print("\n" + "-"*60)
+
+    try:
+        password = getpass.getpass("Admin Password (or press Enter): ")
+    except:
+        # Fallback if getpass doesn't work
+        password = input("Admin Password (or press Enter): ")
+
+    print("-"*60)
+
+    if password == "":
+        print("\n✅ Running in VIEW-ONLY mode")
+        print("   ❌ Zone controls DISABLED")
+        print("   ✅ Dashboard access: http://localhost:8000")
+        print("   ✅ Video monitoring active")
+        allowed = False
+    elif password == ADMIN_PASSWORD:
+        print("\n✅ ADMIN ACCESS GRANTED!")
+        print("   ✅ Zone controls ENABLED (n, e, d, s)")
+        print("   ✅ Dashboard access: http://localhost:8000")
+        print("   ✅ Full system access")
+        allowed = True
+    else:
+        print("\n❌ Invalid password!")
+        print("   ❌ Zone controls DISABLED")
+        print("   ✅ Running in VIEW-ONLY mode")
+        print("   ✅ Dashboard access: http://localhost:8000")
+        allowed = False
+
+    print("="*60 + "\n")
+    time.sleep(2)
+    return allowed
+
+class ZoneEditor:
+    """Mouse-driven rectangle zone editing in the local window"""
+
+    def __init__(self, zn):
+        self.zn = zn
+        self.drawing = False
+        self.start_x = self.start_y = self.curr_x = self.curr_y = None
+        self.mode = None
+        self.selected_zone_id = None
+        self.new_zone_name = None
+
+    def mouse_event(self, event, x, y, flags, param):
+        import cv2
+        zn = self.zn
+        if event == cv2.EVENT_LBUTTONDOWN:
+            if self.mode in ["edit", "delete"]:
+                for z in zn.zones:
+                    if zn.is_point_inside_zone(x, y, z):
+                        self.selected_zone_id = z["id"]
+                        if self.mode == "delete":
+                            zn.delete_zone_by_id(self.selected_zone_id)
+                            zn.save_zones()
+                            print(f"Deleted zone {z['name']}")
+                            self.mode = None
+                            return
+                        else:
+                            self.drawing = True
+                            self.start_x, self.start_y = x, y
+                            return
+
+            if self.mode == "new":
+                self.drawing = True
+                self.start_x, self.start_y = x, y
+
+        elif event == cv2.EVENT_MOUSEMOVE and self.drawing:
+            self.curr_x, self.curr_y = x, y
+
+        elif event == cv2.EVENT_LBUTTONUP and self.drawing:
+            self.drawing = False
+            self.curr_x, self.curr_y = x, y
+
+            x1, y1 = min(self.start_x, self.curr_x), min(self.start_y, self.curr_y)
+            x2, y2 = max(self.start_x, self.curr_x), max(self.start_y, self.curr_y)
+            pts = [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]
+
+            if self.mode == "new":
+                zn.add_zone(self.new_zone_name, pts)
+                zn.save_zones()
+                print(f"Created zone: {self.new_zone_name}")
+                self.mode = None
+
+            elif self.mode == "edit":
+                zn.update_zone(self.selected_zone_id, pts)
+                zn.save_zones()
+                print("Zone updated")
+                self.mode = None
+
+    def overlay(self, frame):
+        """Frame with the rectangle being drawn (copied: published frames are read-only)"""
+        import cv2
+        if not self.drawing or self.curr_x is None:
+            return frame
+        frame = frame.copy()
+        cv2.rectangle(frame, (self.start_x, self.start_y), (self.curr_x, self.curr_y), (255, 255, 255), 2)
+        return frame
+
+def run_window(runtime, allow_zone_management):
+    import cv2
+    import queue
+    import zones as zn
+
+    editor = ZoneEditor(zn)
+    cv2.namedWindow("Crowd Monitor")
+    cv2.setMouseCallback("Crowd Monitor", editor.mouse_event)
+
+    if allow_zone_management:
+        print("🔓 Zone Controls: n=new zone, e=edit, d=delete, s=save, p=pause, q=quit")
+    else:
+        print("🔒 Zone Controls: DISABLED (admin access required)")
+        print("   Available: p=pause, q=quit")
+
+    frame = None
+    while True:
+        try:
+            frame = runtime.display.get(timeout=0.03)
+        except queue.Empty:
+            pass
+        if frame is not None:
+            cv2.imshow("Crowd Monitor", editor.overlay(frame))
+
+        key = cv2.waitKey(1)
+        if key == ord('q'):
+            break
+        elif key == ord('p'):
+            if runtime.paused.is_set():
+                runtime.paused.clear()
+            else:
+                runtime.paused.set()
+        elif key in (ord('n'), ord('e'), ord('d'), ord('s')) and not allow_zone_management:
+            action = {ord('n'): "creation", ord('e'): "editing", ord('d'): "deletion", ord('s'): "saving"}[key]
+            print(f"❌ Zone {action} requires ADMIN access")
+        elif key == ord('n'):
+            editor.new_zone_name = input("Zone name: ")
+            editor.mode = "new"
+        elif key == ord('e'):
+            editor.mode = "edit"
+        elif key == ord('d'):
+            editor.mode = "delete"
+        elif key == ord('s'):
+            zn.save_zones()
+            print("✅ Zones saved successfully")
+
+    cv2.destroyAllWindows()
+
+# ==================== MAINTENANCE ====================
+
+def vacuum_db():
+    """Offline: the full VACUUM the retention worker never runs on a live database"""
+    import retention
+    print_banner(["🧹 Converting crowd_history.db to incremental vacuum (full VACUUM)..."])
+    result = retention.convert_to_incremental_vacuum()
+    if result is None:
+        print("✅ Already using incremental vacuum; nothing to do")
+    else:
+        print(f"✅ Converted: {result['before']['file_bytes']} -> {result['after']['file_bytes']} bytes")
+
+# ==================== ENTRY POINT ====================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=MODES, default="headless")
+    parser.add_argument("--source", default="0", help="webcam index, stream URL or video file")
+    parser.add_argument("--detect-process", action="store_true", help="run YOLO detection in a separate process")
+    parser.add_argument("--fps", type=float, default=0, help="pace video files at this rate (default: the file's own)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--workers", type=int, default=1, help="API worker processes (headless and api-only)")
+    parser.add_argument("--record", metavar="PATH", nargs="?", const="",
+                        help="also write every tracked frame to a detection log (default: shared/detections/)")
+    parser.add_argument("--no-trajectories", action="store_true", help="do not keep track paths (shared/trajectories/)")
+    parser.add_argument("--replay", metavar="PATH", help="feed a detection log to the analytics instead of the camera")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="replay speed factor (0: as fast as possible)")
+    parser.add_argument("--replay-loop", action="store_true", help="start the log over when it ends")
+    parser.add_argument("--replay-db", metavar="PATH",
+                        help="database for replayed counts and alerts (default: a new scratch file; "
+                             "give shared/crowd_history.db to write into the live history)")
+    parser.add_argument("--vacuum-db", action="store_true",
+                        help="convert crowd_history.db to incremental vacuum (full VACUUM; stop the server first)")
+    args = parser.parse_args(argv)
+    args.source = parse_source(args.source)
+    if args.workers > 1 and args.mode == "window":
+        parser.error("--workers needs the API in the main thread: use headless mode")
+    if args.record is not None and args.replay:
+        parser.error("--record and --replay cannot be combined")
+    if args.replay_db and not args.replay:
+        parser.error("--replay-db needs --replay")
+    if args.vacuum_db:
+        vacuum_db()
+        return
+    if args.replay and args.mode != "api-only":
+        use_replay_database(args.replay_db)
+
+    if args.workers > 1:
+        # The API runs in worker processes; this one only needs the pipeline
+        api_server = None
+        live = shared_live_state() if args.mode != "api-only" else None
+    else:
+        print_banner(["🔧 Loading modules..."])
+        import api_server_old as api_server
+        print("✅ Modules loaded successfully")
+        live = ApiServerState(api_server)
+    app = api_server.app if api_server is not None else None
+
+    if args.mode == "api-only":
+        print_banner([
+            "🚀 Starting CrowdCount API Server...",
+            f"📊 Dashboard: http://localhost:{args.port}/static/login.html",
+            f"📖 API Docs: http://localhost:{args.port}/docs",
+        ])
+        run_api(app, args.host, args.port, args.log_level, workers=args.workers)
+        return
+
+    if args.mode == "window":
+        allow_zone_management = check_admin_access()
+        runtime = start_pipeline(args, live, display=True)
+        api_server.pipeline = runtime
+        if runtime is None:
+            # Nothing to show in a window; serve the API in the foreground instead
+            try:
+                run_api(app, args.host, args.port, args.log_level)
+            finally:
+                stop_pipeline(runtime)
+            return
+        run_api(app, args.host, args.port, "error", background=True)
+        print(f"🚀 API live at http://localhost:{args.port}")
+        try:
+            run_window(runtime, allow_zone_management)
+        finally:
+            stop_pipeline(runtime)
+        return
+
+    runtime = start_pipeline(args, live)
+    if api_server is not None:
+        api_server.pipeline = runtime
+    else:
+        live.pipeline = runtime
+        live.start()
+    print_banner([
+        "🌐 Starting API server...",
+        f"📊 Dashboard: http://localhost:{args.port}/static/login.html",
+        f"📖 API Docs: http://localhost:{args.port}/docs",
+        "🔐 Login: admin / admin123",
+    ])
+    try:
+        run_api(app, args.host, args.port, args.log_level, workers=args.workers)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("\n👋 Shutting down...")
+        if api_server is None:
+            live.stop()
+        stop_pipeline(runtime)
+
+if __name__ == "__main__":
+    main()
@@ -7,9 +7,39 @@ Core business services including AI tracking, camera, and zone management
 from . import tracking
 from . import camera_feed
 from . import zones
+from . import frame_cache
+from . import reports
+from . import history_buffer
+from . import alerts
+from . import response_cache
+from . import rolling_stats
+from . import pipeline
+from . import live_state
+from . import pacing
+from . import metrics
+from . import profiler
+from . import detection_log
+from . import reanalysis
+from . import trajectory_store
+from . import crowd_sim
 
 __all__ = [
     'tracking',
     'camera_feed',
-    'zones'
+    'zones',
+    'frame_cache',
+    'reports',
+    'history_buffer',
+    'alerts',
+    'response_cache',
+    'rolling_stats',
+    'pipeline',
+    'live_state',
+    'pacing',
+    'metrics',
+    'profiler',
+    'detection_log',
+    'reanalysis',
+    'trajectory_store',
+    'crowd_sim'
 ]
@@ -0,0 +1,250 @@
+"""
+Capacity Alerts
+Checks every zone against its threshold on each frame and turns crossings
+into "raised" / "cleared" events, which are stored in the alert_events table
+and pushed to live subscribers.
+
+Thresholds come from the in-memory cache in database.py, so evaluating a frame
+never touches the database; events are written by a background thread.
+"""
+
+import itertools
+import json
+import math
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import database as db
+
+RAISE_AFTER = 1.0          # seconds a zone must stay over capacity before alerting
+CLEAR_AFTER = 3.0          # seconds it must stay under the clear level before clearing
+HYSTERESIS = 0.1           # clear level = capacity minus this fraction (at least 1 person)
+LIMITS_RETRY = 1.0         # seconds before re-reading thresholds after a failed read
+SUBSCRIBER_QUEUE_SIZE = 100
+RECENT_EVENTS = 200        # events kept in memory for recent_events()
+
+_events = queue.Queue()
+_dispatcher_thread = None
+_dispatcher_lock = threading.Lock()
+_subscribers = set()
+_subscribers_lock = threading.Lock()
+_recent = deque(maxlen=RECENT_EVENTS)
+_engines = {}   # {camera_id: AlertEngine}
+_event_ids = itertools.count(1)   # orders events for clients that poll instead of subscribing
+
+class _ZoneState:
+    __slots__ = ("active", "since", "peak")
+
+    def __init__(self):
+        self.active = False
+        self.since = None   # when the zone started moving towards the other state
+        self.peak = 0
+
+class AlertEngine:
+    """
+    Per-camera alert state. evaluate() is O(zones) and does no I/O: the threshold
+    table is only re-read from the cache when its version number changes.
+    """
+
+    def __init__(self, camera_id=db.DEFAULT_CAMERA_ID, raise_after=RAISE_AFTER,
+                 clear_after=CLEAR_AFTER, hysteresis=HYSTERESIS):
+        self.camera_id = camera_id
+        self.raise_after = raise_after
+        self.clear_after = clear_after
+        self.hysteresis = hysteresis
+        self._states = {}
+        self._limits = {}          # {zone_name: (capacity, clear_level, enabled)}
+        self._limits_version = None
+        self._limits_retry_at = None   # set while the thresholds could not be read
+
+    def _limits_for(self, zone_name):
+        limits = self._limits.get(zone_name)
+        if limits is None:
+            limits = self._compile(db.DEFAULT_MAX_CAPACITY, True)
+            self._limits[zone_name] = limits
+        return limits
+
+    def _compile(self, capacity, enabled):
+        margin = max(1, math.ceil(capacity * self.hysteresis))
+        return capacity, capacity - margin, enabled
+
+    def _refresh_limits(self, now):
+        version = db.get_threshold_version()
+        if version == self._limits_version:
+            return
+        if self._limits_retry_at is not None and now < self._limits_retry_at:
+            return
+        try:
+            thresholds = db.get_all_thresholds(raise_errors=True)
+        except Exception as e:
+            # Keep the limits we have (database locked, ...) and read again shortly
+            if self._limits_retry_at is None:
+                print(f"Alert thresholds read error, retrying: {e}")
+            self._limits_retry_at = now + LIMITS_RETRY
+            return
+        self._limits = {name: self._compile(t["max_capacity"], t["alert_enabled"])
+                        for name, t in thresholds.items()}
+        self._limits_version = version
+        self._limits_retry_at = None
+
+    def evaluate(self, zone_counts, now=None):
+        """Feed one frame of {zone_name: count}; returns the events it produced"""
+        now = time.monotonic() if now is None else now
+        self._refresh_limits(now)
+        events = []
+
+        for zone_name, count in zone_counts.items():
+            state = self._states.get(zone_name)
+            if state is None:
+                state = self._states[zone_name] = _ZoneState()
+            capacity, clear_level, enabled = self._limits_for(zone_name)
+
+            if not state.active:
+                if enabled and count > capacity:
+                    if state.since is None:
+                        state.since = now
+                    if now - state.since >= self.raise_after:
+                        state.active, state.since, state.peak = True, None, count
+                        events.append(self._event(zone_name, "raised", count, capacity))
+                else:
+                    state.since = None
+            else:
+                state.peak = max(state.peak, count)
+                if not enabled:
+                    state.active, state.since = False, None
+                    events.append(self._event(zone_name, "cleared", count, capacity))
+                elif count <= clear_level:
+                    if state.since is None:
+                        state.since = now
+                    if now - state.since >= self.clear_after:
+                        state.active, state.since = False, None
+                        events.append(self._event(zone_name, "cleared", count, capacity, state.peak))
+                else:
+                    state.since = None
+
+        if len(self._states) > len(zone_counts):
+            # Zones deleted since the last frame: close their open alerts
+            for zone_name in [z for z in self._states if z not in zone_counts]:
+                if self._states.pop(zone_name).active:
+                    events.append(self._event(zone_name, "cleared", 0, self._limits_for(zone_name)[0]))
+
+        if events:
+            _publish(events)
+        return events
+
+    def _event(self, zone_name, kind, count, capacity, peak=None):
+        event = {
+            "id": next(_event_ids),
+            "timestamp": datetime.utcnow(),
+            "camera_id": self.camera_id,
+            "zone": zone_name,
+            "event": kind,
+            "count": count,
+            "max_capacity": capacity
+        }
+        if peak is not None:
+            event["peak"] = peak
+        return event
+
+    def active_zones(self):
+        return sorted(name for name, state in self._states.items() if state.active)
+
+# ---------- module-level API used by the video loops ----------
+
+def get_engine(camera_id=db.DEFAULT_CAMERA_ID):
+    engine = _engines.get(camera_id)
+    if engine is None:
+        engine = _engines.setdefault(camera_id, AlertEngine(camera_id))
+    return engine
+
+def check_zones(zone_counts, camera_id=db.DEFAULT_CAMERA_ID):
+    """Evaluate one frame of zone counts for a camera (called from the video loop)"""
+    return get_engine(camera_id).evaluate(zone_counts)
+
+def active_alerts():
+    """{camera_id: [zone names currently over capacity]}"""
+    return {camera_id: engine.active_zones() for camera_id, engine in list(_engines.items())}
+
+def recent_events(limit=50):
+    """Newest events seen by this process, oldest first"""
+    events = list(_recent)[-limit:]
+    return [_serialize(e) for e in events]
+
+# ---------- persistence and push ----------
+
+def _serialize(event):
+    event = dict(event)
+    event["timestamp"] = event["timestamp"].strftime("%Y-%m-%d %H:%M:%S")
+    return event
+
+def _publish(events):
+    _ensure_dispatcher()
+    _events.put(events)
+
+def _dispatch_loop():
+    while True:
+        events = _events.get()
+        # Merge whatever else is already waiting into one insert
+        while True:
+            try:
+                events = events + _events.get_nowait()
+            except queue.Empty:
+                break
+        db.log_alert_events(events)
+
+        payload = [_serialize(e) for e in events]
+        _recent.extend(events)
+        with _subscribers_lock:
+            subscribers = list(_subscribers)
+        for subscriber in subscribers:
+            for event in payload:
+                try:
+                    subscriber.put_nowait(event)
+                except queue.Full:
+                    # Slow client: drop its oldest event rather than block the others
+                    try:
+                        subscriber.get_nowait()
+                        subscriber.put_nowait(event)
+                    except (queue.Empty, queue.Full):
+                        pass
+
+def _ensure_dispatcher():
+    global _dispatcher_thread
+    if _dispatcher_thread is not None and _dispatcher_thread.is_alive():
+        return
+    with _dispatcher_lock:
+        if _dispatcher_thread is None or not _dispatcher_thread.is_alive():
+            _dispatcher_thread = threading.Thread(target=_dispatch_loop, name="alert-dispatch", daemon=True)
+            _dispatcher_thread.start()
+
+def subscribe():
+    """Queue that receives every future event as a dict; pass it to unsubscribe() when done"""
+    subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    with _subscribers_lock:
+        _subscribers.add(subscriber)
+    return subscriber
+
+def unsubscribe(subscriber):
+    with _subscribers_lock:
+        _subscribers.discard(subscriber)
+
+def stream_events(keepalive=15.0):
+    """
+    Server-Sent Events generator for a StreamingResponse.
+    Starts with the currently active alerts, then yields every new event.
+    """
+    subscriber = subscribe()
+    try:
+        yield f"event: active\ndata: {json.dumps(active_alerts())}\n\n"
+        while True:
+            try:
+                event = subscriber.get(timeout=keepalive)
+            except queue.Empty:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        unsubscribe(subscriber)
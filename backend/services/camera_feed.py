@@ -2,6 +2,7 @@ import cv2
 import os
 
 cap = None
+DEFAULT_FPS = 30.0
 
 def start_camera(source=0):
     """
@@ -32,6 +33,25 @@ def get_camera_frame():
         return None
     return frame
 
+def get_source_fps():
+    """Frame rate reported by the source (a video file's own rate), DEFAULT_FPS if unknown"""
+    if cap is None:
+        return DEFAULT_FPS
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    return fps if 0 < fps <= 240 else DEFAULT_FPS
+
+def is_live_source():
+    """Webcams and streams deliver frames at their own pace; video files have a frame count"""
+    return cap is None or cap.get(cv2.CAP_PROP_FRAME_COUNT) <= 0
+
+def skip_frames(count):
+    """Advance past frames without decoding them"""
+    if cap is None:
+        return
+    for _ in range(count):
+        if not cap.grab():
+            break
+
 def stop_camera():
     global cap
     if cap:
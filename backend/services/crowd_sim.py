@@ -0,0 +1,250 @@
+"""
+Crowd Simulator
+Synthetic tracked people for scale testing without video or YOLO: agents
+move through the frame and come out as update_tracks() dicts, so zone
+counting, heatmaps, database logging and streaming can be driven at crowd
+sizes, zone counts and camera counts the sample videos never reach.
+
+Agent models:
+
+    random_walk   every agent keeps a heading that drifts a little each
+                  step; some stand still (queues, people chatting)
+    flow          agents follow a smooth, seeded flow field across the
+                  frame (a concourse with eddies) plus some wandering
+
+Boxes shrink towards the top of the frame like in a camera looking down a
+hall, and jitter a few pixels per frame like detections do. Agents that
+walk out of the frame or reach the end of their visit are replaced by new
+ones with new track ids, so tracks start and end as in real footage.
+Everything comes from one seed: the same settings give the same crowd.
+"""
+
+import collections
+
+import numpy as np
+
+MODELS = ("random_walk", "flow")
+FRAME_SIZE = (1280, 720)
+
+WALK_SPEED = 70.0          # mean walking speed, pixels per second
+STANDING = 0.2             # share of random-walk agents that stand still
+TURN_RATE = 1.2            # random-walk heading drift, radians per sqrt(second)
+MEAN_VISIT = 60.0          # seconds an agent stays before it is replaced
+BOX_HEIGHT = (70, 190)     # box height at the top and at the bottom of the frame
+BOX_ASPECT = 0.42          # width / height
+JITTER = 2.0               # detection noise, pixels
+FLOW_WAVES = 4             # sine terms in the flow field's stream function
+
+class CrowdSimulation:
+    """
+    `people` agents on a frame_size canvas; step(dt) moves them and
+    people() returns the current frame's tracked people. Track ids start
+    after id_offset, so several simulated cameras never share an id.
+    """
+
+    def __init__(self, people=100, frame_size=FRAME_SIZE, model="random_walk", seed=0,
+                 id_offset=0, speed=WALK_SPEED, mean_visit=MEAN_VISIT):
+        if model not in MODELS:
+            raise ValueError(f"model must be one of {', '.join(MODELS)}")
+        self.size = people
+        self.frame_size = frame_size
+        self.model = model
+        self.speed = speed
+        self.mean_visit = mean_visit
+        self.time = 0.0
+        self.steps = 0
+        self.tracks_started = 0
+        self._rng = np.random.default_rng(seed)
+        self._next_id = id_offset + 1
+        self._ids = np.zeros(people, dtype=np.int64)
+        self._pos = np.zeros((people, 2))
+        self._heading = np.zeros(people)
+        self._speed = np.zeros(people)
+        self._leaves_at = np.zeros(people)
+        if model == "flow":
+            self._init_flow()
+        self._spawn(np.arange(people), anywhere=True)
+
+    # ---------- agents ----------
+
+    def _spawn(self, index, anywhere=False):
+        """New agents in the given slots: anywhere in the frame, or entering from an edge"""
+        n = len(index)
+        if not n:
+            return
+        rng = self._rng
+        w, h = self.frame_size
+        self._ids[index] = np.arange(self._next_id, self._next_id + n)
+        self._next_id += n
+        self.tracks_started += n
+        if anywhere:
+            pos = rng.uniform((0, 0), (w, h), (n, 2))
+        elif self.model == "flow":
+            # Upstream edge of the mean flow, so newcomers walk into the frame
+            pos = np.column_stack([np.full(n, -10.0) if self._drift[0] > 0 else np.full(n, w + 10.0),
+                                   rng.uniform(0, h, n)])
+        else:
+            edge = rng.integers(0, 4, n)
+            along = rng.uniform(0, 1, n)
+            pos = np.column_stack([
+                np.select([edge == 0, edge == 1], [0.0, w - 1.0], along * w),
+                np.select([edge == 2, edge == 3], [0.0, h - 1.0], along * h)])
+        self._pos[index] = pos
+        self._heading[index] = rng.uniform(-np.pi, np.pi, n)
+        speed = np.maximum(rng.normal(self.speed, self.speed * 0.25, n), 0.0)
+        if self.model == "random_walk":
+            speed[rng.random(n) < STANDING] = 0.0
+        self._speed[index] = speed
+        self._leaves_at[index] = self.time + rng.exponential(self.mean_visit, n)
+
+    def _init_flow(self):
+        rng = self._rng
+        w, h = self.frame_size
+        # Stream function psi = sum a sin(kx x + p) sin(ky y + q): its curl is a smooth,
+        # divergence-free field, so agents swirl around without piling up in sinks
+        self._waves = np.column_stack([
+            rng.uniform(0.5, 1.5, FLOW_WAVES),                       # amplitude
+            rng.integers(1, 4, FLOW_WAVES) * np.pi / w,              # kx
+            rng.integers(1, 3, FLOW_WAVES) * np.pi / h,              # ky
+            rng.uniform(0, 2 * np.pi, FLOW_WAVES),                   # phase x
+            rng.uniform(0, 2 * np.pi, FLOW_WAVES)])                  # phase y
+        self._drift = np.array([rng.choice([-1.0, 1.0]) * 0.8, rng.uniform(-0.2, 0.2)])
+
+    def _flow(self, pos):
+        """Unit-scale flow direction at each position: mean drift plus the curl of psi"""
+        x, y = pos[:, :1], pos[:, 1:]
+        a, kx, ky, px, py = (self._waves[:, i] for i in range(5))
+        sx, cx = np.sin(kx * x + px), np.cos(kx * x + px)
+        sy, cy = np.sin(ky * y + py), np.cos(ky * y + py)
+        # v = (d psi / dy, -d psi / dx), each term scaled to amplitude a
+        vx = (a * sx * cy).sum(axis=1)
+        vy = -(a * cx * sy * (kx / ky)).sum(axis=1)
+        flow = np.column_stack([vx, vy]) / FLOW_WAVES + self._drift
+        norm = np.linalg.norm(flow, axis=1, keepdims=True)
+        return flow / np.maximum(norm, 1e-6)
+
+    def step(self, dt):
+        """Advance the crowd by dt seconds"""
+        rng = self._rng
+        w, h = self.frame_size
+        n = self.size
+        self.time += dt
+        self.steps += 1
+        if not n:
+            return
+        self._heading += rng.normal(0.0, TURN_RATE * np.sqrt(dt), n)
+        wander = np.column_stack([np.cos(self._heading), np.sin(self._heading)])
+        if self.model == "flow":
+            direction = 0.8 * self._flow(self._pos) + 0.2 * wander
+        else:
+            direction = wander
+        self._pos += direction * (self._speed * dt)[:, None]
+
+        if self.model == "random_walk":
+            # Walls turn walkers around; only the end of a visit takes them out of view
+            low, high = self._pos < 0, self._pos > (w - 1, h - 1)
+            self._pos = np.clip(self._pos, 0, (w - 1, h - 1))
+            bounced = (low | high).any(axis=1)
+            self._heading[bounced] += np.pi
+            gone = self._leaves_at <= self.time
+        else:
+            outside = ((self._pos < -20) | (self._pos > (w + 20, h + 20))).any(axis=1)
+            gone = outside | (self._leaves_at <= self.time)
+        self._spawn(np.flatnonzero(gone))
+
+    # ---------- output ----------
+
+    def boxes(self):
+        """(ids, x1, y1, x2, y2) int arrays of the people in view, with detection jitter"""
+        w, h = self.frame_size
+        pos = self._pos + self._rng.normal(0.0, JITTER, self._pos.shape)
+        depth = np.clip(pos[:, 1] / h, 0.0, 1.0)
+        box_h = BOX_HEIGHT[0] + (BOX_HEIGHT[1] - BOX_HEIGHT[0]) * depth
+        box_w = box_h * BOX_ASPECT
+        # The agent's position is its feet; the box grows upwards from there
+        x1 = np.clip(pos[:, 0] - box_w / 2, 0, w - 1).astype(np.int32)
+        x2 = np.clip(pos[:, 0] + box_w / 2, 0, w - 1).astype(np.int32)
+        y1 = np.clip(pos[:, 1] - box_h, 0, h - 1).astype(np.int32)
+        y2 = np.clip(pos[:, 1], 0, h - 1).astype(np.int32)
+        visible = (x2 - x1 >= 4) & (y2 - y1 >= 8)
+        return self._ids[visible], x1[visible], y1[visible], x2[visible], y2[visible]
+
+    def people(self):
+        """The people in view as update_tracks() returns them"""
+        ids, x1, y1, x2, y2 = (a.tolist() for a in self.boxes())
+        return [{"id": tid, "bbox": (a, b, c, d), "centroid": ((a + c) // 2, (b + d) // 2)}
+                for tid, a, b, c, d in zip(ids, x1, y1, x2, y2)]
+
+    def stats(self):
+        return {"model": self.model, "people": self.size, "simulated_s": round(self.time, 3),
+                "steps": self.steps, "tracks_started": self.tracks_started}
+
+def background(frame_size=FRAME_SIZE, seed=0):
+    """Smooth gradient plus noise: JPEG-encodes about as slowly as camera footage, unlike a blank frame"""
+    rng = np.random.default_rng(seed)
+    w, h = frame_size
+    x = np.linspace(0, 255, w, dtype=np.float32)
+    y = np.linspace(0, 255, h, dtype=np.float32)[:, None]
+    base = np.stack([(x + y) / 2, np.broadcast_to(x, (h, w)), np.broadcast_to(y, (h, w))], axis=-1)
+    noise = rng.normal(0, 12, size=(h, w, 3))
+    return np.clip(base + noise, 0, 255).astype(np.uint8)
+
+def grid_zones(count, frame_size=FRAME_SIZE):
+    """count rectangular zones tiling the frame (near-square grid), as zones.json stores them"""
+    w, h = frame_size
+    cols = max(1, int(round(count ** 0.5)))
+    rows = (count + cols - 1) // cols
+    zones = []
+    for i in range(count):
+        r, c = divmod(i, cols)
+        x1, y1 = c * w // cols, r * h // rows
+        x2, y2 = (c + 1) * w // cols - 1, (r + 1) * h // rows - 1
+        zones.append({"id": i + 1, "name": f"Zone {i + 1}", "points": [[x1, y1], [x2, y1], [x2, y2], [x1, y2]]})
+    return zones
+
+# ==================== PIPELINE SOURCE ====================
+
+class SimulatedSource:
+    """
+    Pipeline source for a CrowdSimulation, in place of the camera and YOLO:
+
+        capture()       copy of the background frame; the crowd moves one frame on
+        skip(count)     frames the pipeline could not take still move the crowd
+        people(item)    "simulate" stage: the people of that frame
+
+    Like DetectionReplay the simulate stage's queue must block. Frames are
+    1/fps simulated seconds apart whatever the pacing. frames=N ends the
+    run after N captured frames (capture() then returns None).
+    """
+
+    def __init__(self, simulation, fps=15.0, frames=None, seed=0):
+        self.simulation = simulation
+        self.dt = 1.0 / fps if fps and fps > 0 else 1.0 / 15.0
+        self.frames = frames
+        self.finished = False
+        self.frames_captured = 0
+        self.people_emitted = 0
+        self._background = background(simulation.frame_size, seed)
+        self._pending = collections.deque()
+
+    def capture(self):
+        if self.frames is not None and self.frames_captured >= self.frames:
+            self.finished = True
+            return None
+        self.simulation.step(self.dt)
+        people = self.simulation.people()
+        self._pending.append(people)
+        self.frames_captured += 1
+        self.people_emitted += len(people)
+        return self._background.copy()
+
+    def skip(self, count):
+        for _ in range(count):
+            self.simulation.step(self.dt)
+
+    def people(self, item):
+        return self._pending.popleft()
+
+    def stats(self):
+        return {**self.simulation.stats(), "frames_captured": self.frames_captured,
+                "people_emitted": self.people_emitted, "finished": self.finished}
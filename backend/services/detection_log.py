@@ -0,0 +1,318 @@
+"""
+Detection Log
+Records the tracker's output (frame time, track id, box) to a compact
+append-only binary file and plays it back into the zone/heatmap/analytics
+stages without YOLO or video decoding, to benchmark and debug them offline
+at thousands of frames per second or to reproduce a field issue.
+
+File layout (little-endian):
+
+    header   magic "CCDL", version u16, camera id u16, width u16, height u16,
+             recording start (unix time) f64
+    frames   t f64 (seconds since the start), frame seq u32, people u32,
+             then per person: track id i32, x1 y1 x2 y2 i16
+
+A frame is written in one piece and the reader stops at a truncated tail, so
+a log cut short by a crash is still readable up to its last whole frame.
+"""
+
+import collections
+import glob
+import os
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b"CCDL"
+VERSION = 1
+HEADER = struct.Struct("<4sHHHHd")
+FRAME = struct.Struct("<dII")
+PERSON = np.dtype([("id", "<i4"), ("x1", "<i2"), ("y1", "<i2"), ("x2", "<i2"), ("y2", "<i2")])
+
+backend_dir = os.path.dirname(os.path.dirname(__file__))
+LOG_DIR = os.path.join(os.path.dirname(backend_dir), "shared", "detections")
+LOG_SUFFIX = ".ccdl"
+
+FLUSH_INTERVAL = 1.0     # seconds of recording a crash can lose
+MAX_GAP = 1.0            # longest pause replayed in real time; longer ones are cut short
+
+def people_to_array(people):
+    """Tracked people (update_tracks() dicts) as a PERSON array"""
+    records = np.empty(len(people), dtype=PERSON)
+    for i, p in enumerate(people):
+        records[i] = (p["id"], *p["bbox"])
+    return records
+
+def array_to_people(records):
+    """PERSON array back to the dicts update_tracks() returns"""
+    people = []
+    for tid, x1, y1, x2, y2 in records.tolist():
+        people.append({
+            "id": tid,
+            "bbox": (x1, y1, x2, y2),
+            "centroid": ((x1 + x2) // 2, (y1 + y2) // 2)
+        })
+    return people
+
+def default_path(camera_id=1):
+    """New log file in LOG_DIR, named after the camera and the start time"""
+    name = time.strftime(f"camera{camera_id}-%Y%m%d-%H%M%S{LOG_SUFFIX}")
+    return os.path.join(LOG_DIR, name)
+
+def find_logs(start=None, end=None, camera_id=None, directory=None):
+    """
+    DetectionLogs in directory (default LOG_DIR) recorded by camera_id that
+    overlap [start, end) (unix times), oldest first
+    """
+    found = []
+    for path in glob.glob(os.path.join(directory or LOG_DIR, f"*{LOG_SUFFIX}")):
+        try:
+            log = DetectionLog(path)
+        except (OSError, ValueError):
+            continue
+        if camera_id is not None and log.camera_id != camera_id:
+            continue
+        if end is not None and log.started_at >= end:
+            continue
+        if start is not None and log.started_at + log.info()["duration_s"] < start:
+            continue
+        found.append(log)
+    return sorted(found, key=lambda log: log.started_at)
+
+# ==================== RECORDING ====================
+
+class DetectionRecorder:
+    """Appends every tracked frame to a new log file; used as the pipeline's record stage"""
+
+    def __init__(self, path, camera_id=1, frame_size=(1280, 720), flush_interval=FLUSH_INTERVAL):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.flush_interval = flush_interval
+        self.frames = 0
+        self.people = 0
+        self.error = None   # the write error that stopped recording
+        self._file = open(path, "wb", buffering=1 << 16)
+        self._file.write(HEADER.pack(MAGIC, VERSION, camera_id, frame_size[0], frame_size[1], time.time()))
+        self._file.flush()
+        self._t0 = time.monotonic()
+        self._next_flush = self._t0 + flush_interval
+
+    def record(self, seq, captured_at, people):
+        """
+        One frame's tracked people; captured_at is on the monotonic clock.
+        A write error (disk full) ends the recording, never the frame: the log
+        keeps what was written up to its last whole frame.
+        """
+        if self._file.closed:
+            return
+        records = people_to_array(people)
+        try:
+            self._file.write(FRAME.pack(captured_at - self._t0, seq, len(records)) + records.tobytes())
+            now = time.monotonic()
+            if now >= self._next_flush:
+                self._file.flush()
+                self._next_flush = now + self.flush_interval
+        except OSError as e:
+            self.error = str(e)
+            print(f"Detection log write error, recording stopped ({self.path}): {e}")
+            self.close()
+            return
+        self.frames += 1
+        self.people += len(records)
+
+    def record_item(self, item):
+        """Stage function: reads the FrameItem's seq, capture time and people"""
+        self.record(item.seq, item.captured_at, item.people)
+
+    def close(self):
+        if not self._file.closed:
+            try:
+                self._file.close()
+            except OSError as e:
+                # The buffered tail could not be written; the file ends at an earlier frame
+                self.error = self.error or str(e)
+
+    def stats(self):
+        return {"path": self.path, "frames": self.frames, "people": self.people, "error": self.error}
+
+# ==================== READING ====================
+
+class DetectionLog:
+    """A recorded log: header fields plus iteration over its frames"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f"{path} is not a detection log (too short)")
+        magic, version, camera_id, width, height, started_at = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a detection log")
+        if version != VERSION:
+            raise ValueError(f"{path} has detection log version {version}, expected {VERSION}")
+        self.camera_id = camera_id
+        self.frame_size = (width, height)
+        self.started_at = started_at
+
+    def frames(self, as_arrays=False):
+        """Yields (t, seq, people); people are PERSON arrays with as_arrays=True, else dicts"""
+        with open(self.path, "rb") as f:
+            f.seek(HEADER.size)
+            while True:
+                head = f.read(FRAME.size)
+                if len(head) < FRAME.size:
+                    return
+                t, seq, count = FRAME.unpack(head)
+                payload = f.read(count * PERSON.itemsize)
+                if len(payload) < count * PERSON.itemsize:
+                    return
+                records = np.frombuffer(payload, dtype=PERSON)
+                yield t, seq, records if as_arrays else array_to_people(records)
+
+    def __iter__(self):
+        return self.frames()
+
+    def info(self):
+        """Frame and person counts and the recorded duration (reads frame headers only)"""
+        frames = people = 0
+        duration = 0.0
+        with open(self.path, "rb") as f:
+            f.seek(HEADER.size)
+            size = os.fstat(f.fileno()).st_size
+            while True:
+                head = f.read(FRAME.size)
+                if len(head) < FRAME.size:
+                    break
+                t, _, count = FRAME.unpack(head)
+                end = f.tell() + count * PERSON.itemsize
+                if end > size:
+                    break
+                f.seek(end)
+                frames += 1
+                people += count
+                duration = t
+        return {
+            "path": self.path,
+            "camera_id": self.camera_id,
+            "frame_size": list(self.frame_size),
+            "started_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.started_at)),
+            "frames": frames,
+            "people": people,
+            "duration_s": round(duration, 3),
+        }
+
+# ==================== REPLAY ====================
+
+class DetectionReplay:
+    """
+    Pipeline source for a recorded log, in place of the camera and YOLO:
+
+        capture()       blank frame of the recorded size, on the recorded schedule
+        people(item)    "replay" stage: the tracked people recorded for that frame
+
+    The replay stage's queue must block, so every captured frame reaches it in
+    order. speed scales the recorded timing (2.0 = twice as fast); 0 replays
+    as fast as the stages allow. loop=True starts over at the end of the log.
+    """
+
+    def __init__(self, path, speed=1.0, loop=False):
+        self.log = DetectionLog(path)
+        self.speed = speed
+        self.loop = loop
+        self.finished = False
+        self.frames_replayed = 0
+        self._pending = collections.deque()
+        self._frames = None
+        self._clock = None
+
+    def _next(self):
+        if self._frames is None:
+            self._frames = self.log.frames()
+            self._clock = None
+        for record in self._frames:
+            return record
+        self._frames = None
+        if not self.loop:
+            self.finished = True
+            return None
+        return self._next() if self.frames_replayed else None
+
+    def _wait(self, t):
+        if not self.speed:
+            return
+        now = time.monotonic()
+        if self._clock is None:
+            self._clock = (now, t)
+            return
+        started, first_t = self._clock
+        delay = started + (t - first_t) / self.speed - now
+        if delay > MAX_GAP:
+            # The recording was paused: carry on from here instead of idling through the gap
+            self._clock = (now, t)
+        elif delay > 0:
+            time.sleep(delay)
+
+    def capture(self):
+        if self.finished:
+            return None
+        record = self._next()
+        if record is None:
+            return None
+        t, _, people = record
+        self._wait(t)
+        self._pending.append(people)
+        self.frames_replayed += 1
+        width, height = self.log.frame_size
+        return np.zeros((height, width, 3), dtype=np.uint8)
+
+    def skip(self, count):
+        for _ in range(count):
+            if self._next() is None:
+                break
+
+    def people(self, item):
+        return self._pending.popleft()
+
+    def stats(self):
+        return {"path": self.log.path, "speed": self.speed, "loop": self.loop,
+                "frames_replayed": self.frames_replayed, "finished": self.finished}
+
+def replay(path, crowd, limit=None, render=False):
+    """
+    Feed a log straight through a CrowdStages' zones and persist stages (and
+    render when asked) in the calling thread, as fast as they run. Returns
+    throughput and per-stage timings; nothing is dropped or reordered.
+    """
+    from pipeline import FrameItem
+    log = DetectionLog(path)
+    width, height = log.frame_size
+    blank = np.zeros((height, width, 3), dtype=np.uint8)
+    steps = [("zones", crowd.analyze_zones), ("persist", crowd.persist)]
+    if render:
+        steps.append(("render", crowd.render))
+    timings = {name: 0.0 for name, _ in steps}
+    frames = people = 0
+    started = time.perf_counter()
+    for t, seq, tracked in log.frames():
+        if limit is not None and frames >= limit:
+            break
+        item = FrameItem(seq, blank.copy() if render else blank)
+        item.people = tracked
+        for name, fn in steps:
+            t0 = time.perf_counter()
+            fn(item)
+            timings[name] += time.perf_counter() - t0
+        frames += 1
+        people += len(tracked)
+    elapsed = time.perf_counter() - started
+    return {
+        "frames": frames,
+        "people": people,
+        "seconds": round(elapsed, 3),
+        "fps": round(frames / elapsed, 1) if elapsed > 0 else 0.0,
+        "stage_mean_us": {name: round(total / frames * 1e6, 2) if frames else 0.0
+                          for name, total in timings.items()},
+    }
@@ -0,0 +1,144 @@
+"""
+Snapshot Cache
+Keeps the latest frame of every camera and serves it as a cached JPEG.
+With a live_state store attached (use_store) the default camera's frames are
+shared with API worker processes: the pipeline process writes them through,
+workers read them from the store.
+"""
+
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+
+import cv2
+
+import metrics
+
+JPEG_QUALITY = 85
+DEFAULT_CAMERA_ID = 1
+VARIANTS = ("raw", "annotated")
+
+# Distinguishes ETags across restarts, since frame sequence numbers start over
+_BOOT_TAG = format(int(time.time()), "x")
+
+_lock = threading.Lock()
+_encode_lock = threading.Lock()
+_frames = {}    # {(camera_id, variant): {"frame", "seq", "updated_at"}}
+_encoded = {}   # {(camera_id, variant): snapshot dict of the last encoded frame}
+_store = None   # live_state.LiveStateStore shared with other processes
+
+def use_store(store):
+    """Share frames through a live_state store (writable in the pipeline process, read-only in workers)"""
+    global _store
+    _store = store
+
+def _from_store(camera_id):
+    return _store is not None and not _store.writable and camera_id == DEFAULT_CAMERA_ID
+
+def publish_frame(frame, variant="annotated", camera_id=DEFAULT_CAMERA_ID):
+    """
+    Store the newest frame for a camera (called from the video loop).
+    The caller hands over ownership: the array must not be drawn on afterwards.
+    Encoding is deferred until somebody actually asks for a snapshot.
+    """
+    key = (camera_id, variant)
+    with _lock:
+        slot = _frames.get(key)
+        seq = slot["seq"] + 1 if slot else 1
+        updated_at = time.time()
+        _frames[key] = {"frame": frame, "seq": seq, "updated_at": updated_at}
+    if _store is not None and _store.writable and camera_id == DEFAULT_CAMERA_ID:
+        _store.write_frame(variant, frame, seq, updated_at)
+
+def get_frame(camera_id=DEFAULT_CAMERA_ID, variant="annotated"):
+    """Newest frame as an array (read-only: copy before drawing on it), or None"""
+    if _from_store(camera_id):
+        shared = _store.read_frame(variant)
+        return shared[0] if shared else None
+    with _lock:
+        slot = _frames.get((camera_id, variant))
+    return slot["frame"] if slot else None
+
+def get_snapshot(camera_id=DEFAULT_CAMERA_ID, variant="annotated"):
+    """
+    Get the JPEG of the newest frame as a dict with jpeg, etag and last_modified.
+    Each frame is encoded at most once no matter how many clients poll it.
+    Returns None when the camera has not produced a frame yet.
+    """
+    key = (camera_id, variant)
+    shared = _from_store(camera_id)
+    if shared:
+        # Only the sequence number is read here; pixels are copied on a miss
+        version = _store.frame_version(variant)
+        slot = {"seq": version[0], "updated_at": version[1]} if version else None
+        boot_tag = _store.boot_tag
+    else:
+        with _lock:
+            slot = _frames.get(key)
+        boot_tag = _BOOT_TAG
+    with _lock:
+        cached = _encoded.get(key)
+    if slot is None:
+        return None
+    if cached and cached["seq"] == slot["seq"]:
+        return cached
+
+    with _encode_lock:
+        # Another request may have encoded this frame while we waited
+        cached = _encoded.get(key)
+        if cached and cached["seq"] == slot["seq"]:
+            return cached
+
+        if shared:
+            frame = _store.read_frame(variant)
+            if frame is None:
+                return cached
+            slot = {"frame": frame[0], "seq": frame[1], "updated_at": frame[2]}
+
+        with metrics.JPEG_ENCODE_SECONDS.time(endpoint="snapshot"):
+            ret, buffer = cv2.imencode('.jpg', slot["frame"], [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        if not ret:
+            return cached
+
+        snapshot = {
+            "seq": slot["seq"],
+            "jpeg": buffer.tobytes(),
+            # Workers share the store's boot tag so a frame has one ETag across all of them
+            "etag": f'"{boot_tag}-{camera_id}-{variant}-{slot["seq"]}"',
+            "last_modified": formatdate(slot["updated_at"], usegmt=True),
+            "updated_at": slot["updated_at"]
+        }
+        with _lock:
+            _encoded[key] = snapshot
+        return snapshot
+
+def is_not_modified(snapshot, if_none_match=None, if_modified_since=None):
+    """Evaluate conditional GET headers against a snapshot (If-None-Match wins)"""
+    if if_none_match:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or snapshot["etag"] in tags or f'W/{snapshot["etag"]}' in tags
+
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have one-second resolution
+        return int(snapshot["updated_at"]) <= since
+
+    return False
+
+def snapshot_headers(snapshot):
+    """Validator headers sent with both 200 and 304 responses"""
+    return {
+        "ETag": snapshot["etag"],
+        "Last-Modified": snapshot["last_modified"],
+        "Cache-Control": "no-cache"
+    }
+
+def clear(camera_id=None):
+    """Forget cached frames (all cameras, or a single one)"""
+    with _lock:
+        for store in (_frames, _encoded):
+            for key in [k for k in store if camera_id is None or k[0] == camera_id]:
+                del store[key]
@@ -0,0 +1,363 @@
+"""
+History Buffer
+Fixed-capacity, array-backed window of per-frame counts. When it fills up
+the oldest chunk is spilled to append-only gzip files in the shared folder,
+and readers see the spilled and in-memory parts as one history. The window
+can live in shared memory, read by other processes without locks.
+"""
+
+import datetime
+import gzip
+import io
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+backend_dir = os.path.dirname(os.path.dirname(__file__))
+SPILL_DIR = os.path.join(os.path.dirname(backend_dir), "shared", "history")
+
+DEFAULT_CAPACITY = 18000       # ~10 minutes at 30 FPS
+MAX_ZONES = 64
+SPILL_RETENTION_DAYS = 7
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+ZONE_NAME_BYTES = 64           # UTF-8 bytes kept per zone name
+SNAPSHOT_RETRIES = 1000
+SPILL_RETRY_DELAY = 5.0        # seconds before a failed spill is tried again
+
+# Buffer header: int64 fields
+_MAGIC = 0x48495354            # "HIST"
+_H_MAGIC, _H_CAPACITY, _H_MAX_ZONES, _H_GEN, _H_HEAD, _H_TAIL, _H_ZONE_COUNT = range(7)
+_HEADER_FIELDS = 8
+
+def _align(offset, to=64):
+    return (offset + to - 1) // to * to
+
+def _layout(capacity, max_zones):
+    """Offsets of the timestamp, total, zone and name arrays, and the total size"""
+    ts_at = _align(_HEADER_FIELDS * 8)
+    total_at = _align(ts_at + capacity * 8)
+    zones_at = _align(total_at + capacity * 4)
+    names_at = _align(zones_at + capacity * max_zones * 4)
+    return ts_at, total_at, zones_at, names_at, _align(names_at + max_zones * ZONE_NAME_BYTES)
+
+class HistoryBuffer:
+    """
+    Drop-in replacement for the old unbounded `history_log` list:
+    append() takes the same entry dicts, memory use is fixed at construction.
+
+    All state lives in one flat buffer (a bytearray, or shared memory handed
+    in by live_state) so API worker processes can attach() to it read-only.
+    Rows are addressed by absolute index, [head, tail); the writer only moves
+    head (spilling or dropping rows) inside a generation count that is odd
+    while it works, and readers retry when the generation changed under them.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, max_zones=MAX_ZONES, spill_dir=SPILL_DIR, spill_chunk=None,
+                 buffer=None):
+        self.spill_dir = spill_dir
+        self.spill_chunk = min(spill_chunk or max(1, capacity // 4), capacity)
+        self.readonly = False
+        if buffer is None:
+            buffer = bytearray(self.buffer_size(capacity, max_zones))
+        self._bind(buffer, capacity, max_zones)
+        self._hdr[:] = 0
+        self._hdr[_H_CAPACITY] = capacity
+        self._hdr[_H_MAX_ZONES] = max_zones
+        self._zones.fill(-1)   # -1 = zone not present
+        self._hdr[_H_MAGIC] = _MAGIC
+
+        self._zone_index = {}
+        self._lock = threading.Lock()
+        self._spilling = False   # a chunk is with the spill thread but not yet on disk
+        self._spill = None       # its future
+        self._writing = False    # the spill thread is appending, inside an odd generation
+        self._retry_at = 0.0     # monotonic time before which a failed spill is not retried
+        self._spiller = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-spill")
+        self._warned_zones = False
+        self._warned_full = False
+
+    @classmethod
+    def attach(cls, buffer, spill_dir=SPILL_DIR):
+        """Read-only view of a buffer another process writes to"""
+        hdr = np.ndarray(_HEADER_FIELDS, dtype=np.int64, buffer=buffer)
+        if hdr[_H_MAGIC] != _MAGIC:
+            raise ValueError("Buffer does not hold a history buffer")
+        self = cls.__new__(cls)
+        self.spill_dir = spill_dir
+        self.readonly = True
+        self._bind(buffer, int(hdr[_H_CAPACITY]), int(hdr[_H_MAX_ZONES]))
+        return self
+
+    @staticmethod
+    def buffer_size(capacity=DEFAULT_CAPACITY, max_zones=MAX_ZONES):
+        return _layout(capacity, max_zones)[-1]
+
+    def _bind(self, buffer, capacity, max_zones):
+        self.capacity = capacity
+        self.max_zones = max_zones
+        ts_at, total_at, zones_at, names_at, _ = _layout(capacity, max_zones)
+        self._hdr = np.ndarray(_HEADER_FIELDS, dtype=np.int64, buffer=buffer)
+        self._ts = np.ndarray(capacity, dtype=np.float64, buffer=buffer, offset=ts_at)
+        self._total = np.ndarray(capacity, dtype=np.int32, buffer=buffer, offset=total_at)
+        self._zones = np.ndarray((capacity, max_zones), dtype=np.int32, buffer=buffer, offset=zones_at)
+        self._names = np.ndarray((max_zones, ZONE_NAME_BYTES), dtype=np.uint8, buffer=buffer, offset=names_at)
+        self._name_cache = []
+
+    # ---------- writing ----------
+
+    def record(self, total_people, zones, timestamp=None):
+        """Add one sample ({zone_name: count}); timestamp is epoch seconds"""
+        if self.readonly:
+            raise RuntimeError("History buffer is attached read-only")
+        ts = datetime.datetime.now().timestamp() if timestamp is None else timestamp
+        spill = self._spill
+        if spill is not None and len(self) >= self.capacity:
+            # Window full while a chunk is still being written: wait for it rather than lose rows
+            spill.result()
+        with self._lock:
+            head, tail = int(self._hdr[_H_HEAD]), int(self._hdr[_H_TAIL])
+            if tail - head == self.capacity:
+                # Only reachable with several writers racing: lose the oldest row
+                if not self._warned_full:
+                    print("History buffer: spilling fell behind, dropping oldest entries")
+                    self._warned_full = True
+                head += 1
+                self._move_head(head)
+            slot = tail % self.capacity
+            self._ts[slot] = ts
+            self._total[slot] = total_people
+            row = self._zones[slot]
+            row.fill(-1)
+            for name, count in zones.items():
+                col = self._zone_column(name)
+                if col is not None:
+                    row[col] = count
+            tail += 1
+            self._hdr[_H_TAIL] = tail
+            if (not self._spilling and tail - head >= max(self.capacity - self.spill_chunk, self.spill_chunk)
+                    and time.monotonic() >= self._retry_at):
+                self._spill_oldest(head)
+
+    def append(self, entry):
+        """Compatibility with list.append of {"timestamp", "total_people", zone: count} dicts"""
+        entry = dict(entry)
+        ts = entry.pop("timestamp", None)
+        if isinstance(ts, str):
+            ts = datetime.datetime.strptime(ts, TIMESTAMP_FORMAT).timestamp()
+        total = entry.pop("total_people", 0)
+        self.record(total, entry, ts)
+
+    def _zone_column(self, name):
+        col = self._zone_index.get(name)
+        if col is None:
+            col = len(self._zone_index)
+            if col >= self.max_zones:
+                if not self._warned_zones:
+                    print(f"History buffer: more than {self.max_zones} zones, extra zones are not recorded")
+                    self._warned_zones = True
+                return None
+            encoded = name.encode("utf-8")[:ZONE_NAME_BYTES]
+            self._names[col].fill(0)
+            self._names[col, :len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+            self._zone_index[name] = col
+            # Publish the name only once it is written
+            self._hdr[_H_ZONE_COUNT] = col + 1
+        return col
+
+    def _move_head(self, head):
+        """Advance the oldest row (caller holds the lock); readers retry across this"""
+        if self._writing:
+            # Already inside the spill thread's odd generation
+            self._hdr[_H_HEAD] = head
+            return
+        self._hdr[_H_GEN] += 1
+        self._hdr[_H_HEAD] = head
+        self._hdr[_H_GEN] += 1
+
+    def _take(self, head, count):
+        """Copy out `count` rows starting at absolute row `head`"""
+        idx = (head + np.arange(count)) % self.capacity
+        chunk = (self._ts[idx], self._total[idx], self._zones[idx])
+        return chunk + (self.zone_names(),)
+
+    def _spill_oldest(self, head):
+        # The rows stay readable in memory until they are on disk
+        chunk = self._take(head, self.spill_chunk)
+        self._spilling = True
+        self._spill = self._spiller.submit(self._write_chunk, chunk, head)
+
+    # ---------- spill files ----------
+
+    def _spill_path(self, day):
+        return os.path.join(self.spill_dir, f"history-{day}.jsonl.gz")
+
+    def _write_chunk(self, chunk, head):
+        members = []
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            lines_by_day = {}
+            for entry in _chunk_entries(chunk):
+                day = entry["timestamp"][:10].replace("-", "")
+                lines_by_day.setdefault(day, []).append(json.dumps(entry))
+            # Each write is a complete gzip member; gzip readers concatenate members
+            members = [(day, gzip.compress(("\n".join(lines) + "\n").encode("utf-8")), len(lines))
+                       for day, lines in lines_by_day.items()]
+        except Exception as e:
+            print(f"History spill error: {e}")
+
+        # Readers retry while the generation is odd, so they never see the rows both
+        # on disk and in memory; record() only needs the lock, not the disk
+        with self._lock:
+            self._hdr[_H_GEN] += 1
+            self._writing = True
+        written = 0
+        try:
+            # Rows are in time order, so the days on disk are always a prefix of the chunk
+            for day, data, rows in members:
+                with open(self._spill_path(day), "ab") as f:
+                    f.write(data)
+                written += rows
+        except OSError as e:
+            print(f"History spill error: {e}")
+        with self._lock:
+            # Rows that did not reach the disk stay in memory for the next spill
+            self._hdr[_H_HEAD] = max(int(self._hdr[_H_HEAD]), head + written)
+            self._writing = False
+            self._hdr[_H_GEN] += 1
+            self._spilling = False
+            if written < self.spill_chunk:
+                self._retry_at = time.monotonic() + SPILL_RETRY_DELAY
+        try:
+            self._purge_old_files()
+        except OSError as e:
+            print(f"History spill purge error: {e}")
+
+    def _purge_old_files(self):
+        cutoff = (datetime.datetime.now() - datetime.timedelta(days=SPILL_RETENTION_DAYS)).strftime("%Y%m%d")
+        for name in os.listdir(self.spill_dir):
+            if name.startswith("history-") and name[8:16] < cutoff:
+                os.remove(os.path.join(self.spill_dir, name))
+
+    def _spill_sizes(self, start=None, end=None):
+        """{path: bytes} of the spill files overlapping [start, end)"""
+        if not os.path.isdir(self.spill_dir):
+            return {}
+        first_day = start.strftime("%Y%m%d") if start else None
+        last_day = end.strftime("%Y%m%d") if end else None
+        sizes = {}
+        for name in sorted(os.listdir(self.spill_dir)):
+            if not (name.startswith("history-") and name.endswith(".jsonl.gz")):
+                continue
+            day = name[8:16]
+            if (first_day and day < first_day) or (last_day and day > last_day):
+                continue
+            path = os.path.join(self.spill_dir, name)
+            sizes[path] = os.path.getsize(path)
+        return sizes
+
+    def _iter_spilled(self, sizes):
+        for path, size in sizes.items():
+            try:
+                with open(path, "rb") as raw:
+                    # Only read what was on disk at snapshot time
+                    with gzip.GzipFile(fileobj=_Prefix(raw, size)) as gz:
+                        for line in io.TextIOWrapper(gz, encoding="utf-8"):
+                            yield json.loads(line)
+            except (OSError, EOFError, ValueError) as e:
+                # A member cut short by a crash ends that file, not the export
+                print(f"History spill read error in {os.path.basename(path)}: {e}")
+
+    # ---------- reading ----------
+
+    def _snapshot(self, newest=None, files=None):
+        """
+        (spill file sizes, in-memory rows) as of one generation of the buffer.
+        newest limits the rows to the last N; files=(start, end) also lists spill files.
+        """
+        for _ in range(SNAPSHOT_RETRIES):
+            gen = int(self._hdr[_H_GEN])
+            if gen & 1:
+                time.sleep(0.001)
+                continue
+            head, tail = int(self._hdr[_H_HEAD]), int(self._hdr[_H_TAIL])
+            if newest is not None:
+                head = max(head, tail - newest)
+            sizes = self._spill_sizes(*files) if files is not None else {}
+            chunk = self._take(head, tail - head)
+            if int(self._hdr[_H_GEN]) == gen:
+                return sizes, chunk
+        raise RuntimeError("History buffer kept changing while being read")
+
+    def __len__(self):
+        return int(self._hdr[_H_TAIL] - self._hdr[_H_HEAD])
+
+    def __bool__(self):
+        if len(self):
+            return True
+        return os.path.isdir(self.spill_dir) and bool(os.listdir(self.spill_dir))
+
+    def recent(self, count):
+        """Newest `count` in-memory entries as dicts, oldest first"""
+        _, chunk = self._snapshot(newest=count)
+        return list(_chunk_entries(chunk))
+
+    def zone_names(self):
+        count = int(self._hdr[_H_ZONE_COUNT])
+        names = self._name_cache
+        if len(names) < count:
+            # Names never change once published, so only new ones are decoded
+            names = names + [self._names[col].tobytes().rstrip(b"\0").decode("utf-8", "ignore")
+                             for col in range(len(names), count)]
+            self._name_cache = names
+        return names[:count]
+
+    def iter_entries(self, start=None, end=None):
+        """
+        Every entry in [start, end) oldest first: spill files, then the
+        in-memory window. Memory stays bounded by one window.
+        """
+        spilled, memory = self._snapshot(files=(start, end))
+        start_s = start.strftime(TIMESTAMP_FORMAT) if start else None
+        end_s = end.strftime(TIMESTAMP_FORMAT) if end else None
+
+        def in_range(entry):
+            return (start_s is None or entry["timestamp"] >= start_s) and (end_s is None or entry["timestamp"] < end_s)
+
+        for source in (self._iter_spilled(spilled), _chunk_entries(memory)):
+            for entry in source:
+                if in_range(entry):
+                    yield entry
+
+    def __iter__(self):
+        return self.iter_entries()
+
+class _Prefix:
+    """Read-only view of the first `limit` bytes of a file"""
+
+    def __init__(self, f, limit):
+        self._f = f
+        self._left = limit
+
+    def read(self, size=-1):
+        if size is None or size < 0 or size > self._left:
+            size = self._left
+        data = self._f.read(size)
+        self._left -= len(data)
+        return data
+
+def _chunk_entries(chunk):
+    """Turn (timestamps, totals, zone matrix, zone names) arrays back into entry dicts"""
+    timestamps, totals, zones, names = chunk
+    for ts, total, row in zip(timestamps.tolist(), totals.tolist(), zones.tolist()):
+        entry = {
+            "timestamp": datetime.datetime.fromtimestamp(ts).strftime(TIMESTAMP_FORMAT),
+            "total_people": total
+        }
+        for col, name in enumerate(names):
+            if row[col] >= 0:
+                entry[name] = row[col]
+        yield entry
@@ -0,0 +1,378 @@
+"""
+Shared Live State
+Cross-process store for what the video pipeline produces, so the API can run
+as several uvicorn worker processes (run.py --workers N) and every worker
+sees the same counts, frames, history, alerts and statistics.
+
+Everything lives in one shared memory segment with a single writer, the
+pipeline process. Each slot carries a sequence counter that is odd while the
+writer is inside it: readers copy the slot and retry if the counter was odd
+or moved, so neither side ever waits on a lock.
+
+Worker processes find the segment through the CROWDCOUNT_LIVE_STATE
+environment variable set by create().
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from history_buffer import HistoryBuffer, DEFAULT_CAPACITY, MAX_ZONES
+
+ENV_VAR = "CROWDCOUNT_LIVE_STATE"
+
+# JSON documents and their capacity in bytes
+JSON_SLOTS = {
+    "counts": 64 * 1024,      # get_counts_for_api() of the newest frame
+    "alerts": 256 * 1024,     # active alerts and recent events
+    "stats": 512 * 1024,      # rolling_stats snapshot
+    "pipeline": 64 * 1024,    # Pipeline.get_stats()
+    "metrics": 256 * 1024,    # metrics.render() of the pipeline process
+}
+FRAME_SLOTS = ("raw", "annotated")   # frame_cache variants of the default camera
+MAX_FRAME_BYTES = 1920 * 1080 * 3
+COUNTERS = ("data_version", "threshold_version", "revocation_version")
+PUBLISH_INTERVAL = 1.0    # seconds between alerts/stats/pipeline publishes
+READ_RETRIES = 1000
+
+_MAGIC = 0x4C495645       # "LIVE"
+_HEADER = ("magic", "max_frame_bytes", "history_capacity", "history_max_zones", "created_at")
+_JSON_HEADER = 16         # seq, length
+_FRAME_HEADER = 64        # seq, frame_seq, height, width, channels, updated_at
+
+def _align(offset, to=64):
+    return (offset + to - 1) // to * to
+
+def _layout(max_frame_bytes, history_capacity, history_max_zones):
+    """{slot: offset} for every region, plus the total size"""
+    offsets = {}
+    at = _align(len(_HEADER) * 8)
+    offsets["counters"] = at
+    at = _align(at + len(COUNTERS) * 8)
+    for name, capacity in JSON_SLOTS.items():
+        offsets[name] = at
+        at = _align(at + _JSON_HEADER + capacity)
+    for name in FRAME_SLOTS:
+        offsets[name] = at
+        at = _align(at + _FRAME_HEADER + max_frame_bytes)
+    offsets["history"] = at
+    at = _align(at + HistoryBuffer.buffer_size(history_capacity, history_max_zones))
+    return offsets, at
+
+class _Segment(shared_memory.SharedMemory):
+    def __del__(self):
+        try:
+            self.close()
+        except BufferError:
+            # Array views into the segment live until interpreter exit; the OS unmaps it then
+            pass
+
+def _open_segment(name):
+    """Attach to an existing segment without adopting it into a resource tracker"""
+    try:
+        return _Segment(name=name, track=False)   # Python 3.13+
+    except TypeError:
+        pass
+    # Older versions register attached segments too, and the tracker unlinks
+    # them when this process exits; spawned children share the parent's tracker,
+    # so unregistering afterwards would drop the writer's own registration
+    from multiprocessing import resource_tracker
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return _Segment(name=name)
+    finally:
+        resource_tracker.register = register
+
+class LiveStateStore:
+    """One shared segment; create() in the pipeline process, attach() everywhere else"""
+
+    def __init__(self, shm, writable):
+        self.shm = shm
+        self.name = shm.name
+        self.writable = writable
+        buf = shm.buf
+        header = np.ndarray(len(_HEADER), dtype=np.int64, buffer=buf)
+        if header[0] != _MAGIC:
+            raise ValueError(f"Shared memory {shm.name} does not hold live state")
+        self.max_frame_bytes = int(header[1])
+        self.boot_tag = format(int(header[4]), "x")
+        offsets, _ = _layout(self.max_frame_bytes, int(header[2]), int(header[3]))
+
+        self._counters = np.ndarray(len(COUNTERS), dtype=np.uint64, buffer=buf, offset=offsets["counters"])
+        self._json = {}
+        for name, capacity in JSON_SLOTS.items():
+            at = offsets[name]
+            self._json[name] = (np.ndarray(2, dtype=np.uint64, buffer=buf, offset=at),
+                                buf[at + _JSON_HEADER:at + _JSON_HEADER + capacity])
+        self._frames = {}
+        for name in FRAME_SLOTS:
+            at = offsets[name]
+            self._frames[name] = (np.ndarray(5, dtype=np.uint64, buffer=buf, offset=at),
+                                  np.ndarray(1, dtype=np.float64, buffer=buf, offset=at + 40),
+                                  np.ndarray(self.max_frame_bytes, dtype=np.uint8, buffer=buf,
+                                             offset=at + _FRAME_HEADER))
+        history_at = offsets["history"]
+        self.history_buffer = buf[history_at:history_at + HistoryBuffer.buffer_size(int(header[2]), int(header[3]))]
+        self._warned = set()
+
+    @classmethod
+    def create(cls, name=None, max_frame_bytes=MAX_FRAME_BYTES,
+               history_capacity=DEFAULT_CAPACITY, history_max_zones=MAX_ZONES):
+        _, size = _layout(max_frame_bytes, history_capacity, history_max_zones)
+        shm = _Segment(name=name, create=True, size=size)
+        header = np.ndarray(len(_HEADER), dtype=np.int64, buffer=shm.buf)
+        header[1:] = (max_frame_bytes, history_capacity, history_max_zones, int(time.time()))
+        header[0] = _MAGIC
+        return cls(shm, writable=True)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(_open_segment(name), writable=False)
+
+    def _warn_once(self, key, message):
+        if key not in self._warned:
+            self._warned.add(key)
+            print(message)
+
+    # ---------- JSON documents ----------
+
+    def write_json(self, slot, value):
+        header, data = self._json[slot]
+        payload = json.dumps(value, default=str).encode("utf-8")
+        if len(payload) > len(data):
+            self._warn_once(slot, f"Live state: {slot} document is {len(payload)} bytes, "
+                                  f"over its {len(data)} byte slot; not shared")
+            return
+        header[0] += 1
+        data[:len(payload)] = payload
+        header[1] = len(payload)
+        header[0] += 1
+
+    def read_json(self, slot):
+        """Last document written to a slot, or None before the first write"""
+        header, data = self._json[slot]
+        for _ in range(READ_RETRIES):
+            seq = int(header[0])
+            if seq & 1:
+                time.sleep(0)
+                continue
+            length = min(int(header[1]), len(data))
+            payload = bytes(data[:length])
+            if int(header[0]) == seq:
+                return json.loads(payload) if seq else None
+        return None
+
+    # ---------- frames ----------
+
+    def write_frame(self, slot, frame, frame_seq, updated_at):
+        meta, stamp, pixels = self._frames[slot]
+        if frame.dtype != np.uint8 or frame.nbytes > len(pixels):
+            self._warn_once(slot, f"Live state: {slot} frame {frame.shape} {frame.dtype} does not fit; not shared")
+            return
+        shape = frame.shape + (1,) * (3 - frame.ndim)
+        meta[0] += 1
+        pixels[:frame.nbytes] = frame.reshape(-1)
+        meta[1:] = (frame_seq,) + shape
+        stamp[0] = updated_at
+        meta[0] += 1
+
+    def frame_version(self, slot):
+        """(frame_seq, updated_at) of the newest frame without copying it, or None"""
+        meta, stamp, _ = self._frames[slot]
+        for _ in range(READ_RETRIES):
+            seq = int(meta[0])
+            if seq & 1:
+                time.sleep(0)
+                continue
+            version = (int(meta[1]), float(stamp[0]))
+            if int(meta[0]) == seq:
+                return version if seq else None
+        return None
+
+    def read_frame(self, slot):
+        """(frame copy, frame_seq, updated_at) of the newest frame, or None"""
+        meta, stamp, pixels = self._frames[slot]
+        for _ in range(READ_RETRIES):
+            seq = int(meta[0])
+            if seq & 1:
+                time.sleep(0)
+                continue
+            frame_seq, height, width, channels = (int(v) for v in meta[1:])
+            updated_at = float(stamp[0])
+            frame = pixels[:height * width * channels].copy()
+            if int(meta[0]) == seq:
+                if not seq:
+                    return None
+                shape = (height, width) if channels == 1 else (height, width, channels)
+                return frame.reshape(shape), frame_seq, updated_at
+        return None
+
+    # ---------- counters ----------
+
+    def counter(self, name):
+        return int(self._counters[COUNTERS.index(name)])
+
+    def set_counter(self, name, value):
+        self._counters[COUNTERS.index(name)] = value
+
+    def bump(self, name):
+        """Mark something changed; any process may call this (only "changed" is guaranteed, not the count)"""
+        self._counters[COUNTERS.index(name)] += 1
+
+    # ---------- lifetime ----------
+
+    def close(self):
+        # Views handed out (history, frames) may still pin the buffer; the OS
+        # releases the mapping at exit either way
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+
+    def unlink(self):
+        if self.writable:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+# ==================== PROCESS-WIDE STORE ====================
+
+_store = None
+_store_lock = threading.Lock()
+
+def create(name=None, **sizes):
+    """Create the segment in the pipeline process and advertise it to child processes"""
+    global _store
+    with _store_lock:
+        _store = LiveStateStore.create(name, **sizes)
+        os.environ[ENV_VAR] = _store.name
+        atexit.register(_store.unlink)
+    return _store
+
+def from_env():
+    """The store this process writes, or the one advertised by the parent; None when not sharing"""
+    global _store
+    if _store is not None:
+        return _store
+    name = os.environ.get(ENV_VAR)
+    if not name:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = LiveStateStore.attach(name)
+    return _store
+
+# ==================== PUBLISHING (pipeline process) ====================
+
+class LivePublisher:
+    """
+    `live` target for the crowd pipeline in multi-worker mode: counts and
+    history are written per frame, alerts, statistics and pipeline stats once
+    per PUBLISH_INTERVAL. Frames reach the store through frame_cache.use_store().
+    """
+
+    def __init__(self, store, history, interval=PUBLISH_INTERVAL):
+        self.store = store
+        self.history = history
+        self.interval = interval
+        self.pipeline = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._threshold_version = store.counter("threshold_version")
+
+    def publish_counts(self, counts):
+        self.store.write_json("counts", counts)
+        # Per-frame history for CSV export (bounded buffer, spills to disk)
+        self.history.record(counts["total_people"], counts["zones"])
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name="live-state-publisher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 2)
+
+    def _loop(self):
+        import alerts
+        import metrics
+        import rolling_stats
+        import database as db
+        while not self._stop.wait(self.interval):
+            try:
+                self.store.write_json("alerts", {"active": alerts.active_alerts(),
+                                                 "recent": alerts.recent_events(alerts.RECENT_EVENTS)})
+                self.store.write_json("stats", rolling_stats.snapshot())
+                if self.pipeline is not None:
+                    self.store.write_json("pipeline", self.pipeline.get_stats())
+                self.store.write_json("metrics", metrics.render())
+                self.store.set_counter("data_version", db.get_data_version())
+                # A worker changed a threshold: the alert engine must reload them
+                version = self.store.counter("threshold_version")
+                if version != self._threshold_version:
+                    self._threshold_version = version
+                    db.invalidate_thresholds()
+            except Exception as e:
+                print(f"Live state publish error: {e}")
+
+# ==================== READING (API workers) ====================
+
+def start_worker_sync(store, interval=PUBLISH_INTERVAL):
+    """
+    Keep a worker's process-local caches in step with the others: thresholds
+    set through any worker are announced on the shared counter, and every
+    worker drops its cached copy when the counter moves. Token revocations
+    are announced the same way (wired up by the API, see
+    auth_service.share_revocations).
+    """
+    import database as db
+
+    db.add_threshold_listener(lambda: store.bump("threshold_version"))
+
+    def loop():
+        seen = store.counter("threshold_version")
+        while True:
+            time.sleep(interval)
+            version = store.counter("threshold_version")
+            if version != seen:
+                seen = version
+                db.invalidate_thresholds()
+
+    threading.Thread(target=loop, name="live-state-sync", daemon=True).start()
+
+def shared_version(store):
+    """Response cache version for a worker: data changes come from the pipeline process"""
+    import database as db
+    return lambda: (store.counter("data_version"), db.get_threshold_version())
+
+def stream_alert_events(store, keepalive=15.0, poll=0.5):
+    """
+    alerts.stream_events() for a worker process: the same SSE messages, fed by
+    polling the shared alerts document for events newer than the last one sent.
+    """
+    state = store.read_json("alerts") or {"active": {}, "recent": []}
+    yield f"event: active\ndata: {json.dumps(state['active'])}\n\n"
+    last_id = max((e.get("id", 0) for e in state["recent"]), default=0)
+    idle = 0.0
+    while True:
+        time.sleep(poll)
+        state = store.read_json("alerts") or state
+        new = [e for e in state["recent"] if e.get("id", 0) > last_id]
+        for event in new:
+            yield f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+        if new:
+            last_id = new[-1]["id"]
+            idle = 0.0
+        else:
+            idle += poll
+            if idle >= keepalive:
+                idle = 0.0
+                yield ": keepalive\n\n"
@@ -0,0 +1,277 @@
+"""
+Metrics
+Process-wide counters, gauges and histograms rendered in the Prometheus text
+format for GET /metrics. Recording is a bisect and three additions under a
+lock (about a microsecond), so it stays on in production. Values that already
+live elsewhere (queue depths, dropped frames) are read by collectors at
+scrape time instead of being recorded per frame.
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_text(names, values, extra=None):
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        """Mirror a count kept elsewhere (collectors)"""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self, extra=None):
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_label_text(self.labelnames, key, extra)} {_number(v)}" for key, v in values]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track(self, **labels):
+        """Count something in progress (e.g. connected stream clients)"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}   # {label values: [bucket counts..., +Inf count, sum]}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self, extra=None):
+        with self._lock:
+            series = [(key, list(values)) for key, values in self._series.items()]
+        lines = []
+        for key, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), values):
+                cumulative += count
+                labels = _label_text(self.labelnames + ("le",), key + (_number(float(bound)),), extra)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _label_text(self.labelnames, key, extra)
+            lines.append(f"{self.name}_sum{labels} {_number(values[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def add_collector(self, collect):
+        """collect() is called on every scrape, to set gauges from state that lives elsewhere"""
+        with self._lock:
+            self._collectors.append(collect)
+
+    def remove_collector(self, collect):
+        with self._lock:
+            if collect in self._collectors:
+                self._collectors.remove(collect)
+
+    def render(self, extra_labels=None, only=None):
+        """Prometheus text exposition; metrics without samples (or not named in only) are left out"""
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = [m for m in self._metrics if only is None or m.name in only]
+        for collect in collectors:
+            try:
+                collect()
+            except Exception as e:
+                print(f"Metrics collector error: {e}")
+        lines = []
+        for metric in metrics:
+            samples = metric.samples(extra_labels)
+            if samples:
+                lines.extend(metric.header())
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+# ---------- metrics recorded across the backend ----------
+
+STAGE_SECONDS = registry.histogram(
+    "crowdcount_stage_seconds", "Time spent in one pipeline stage per frame", ("pipeline", "stage"))
+FRAME_LATENCY_SECONDS = registry.histogram(
+    "crowdcount_frame_latency_seconds", "Capture to end of the last stage per frame", ("pipeline",))
+JPEG_ENCODE_SECONDS = registry.histogram(
+    "crowdcount_jpeg_encode_seconds", "JPEG encoding time", ("endpoint",))
+DB_WRITE_SECONDS = registry.histogram(
+    "crowdcount_db_write_seconds", "Duration of one batched log commit")
+DB_BATCH_ROWS = registry.histogram(
+    "crowdcount_db_batch_rows", "Log rows per batched commit", buckets=SIZE_BUCKETS)
+DB_QUEUE_DEPTH = registry.gauge(
+    "crowdcount_db_queue_depth", "Log rows waiting for the batched writer")
+DB_DROPPED = registry.counter(
+    "crowdcount_db_dropped_total", "Log rows dropped because the writer queue was full")
+DB_FAILED_COMMITS = registry.counter(
+    "crowdcount_db_failed_commits_total", "Batched log commits that failed and were retried")
+DB_RETRYING = registry.gauge(
+    "crowdcount_db_retrying_rows", "Log rows of failed commits waiting to be written again")
+DB_LOST = registry.counter(
+    "crowdcount_db_lost_total", "Log rows given up after failed commits")
+STREAM_CLIENTS = registry.gauge(
+    "crowdcount_stream_clients", "Connected streaming clients", ("stream",))
+
+QUEUE_DEPTH = registry.gauge(
+    "crowdcount_queue_depth", "Frames waiting in front of a pipeline stage", ("pipeline", "queue"))
+QUEUE_SIZE = registry.gauge(
+    "crowdcount_queue_size", "Capacity of a pipeline stage queue", ("pipeline", "queue"))
+FRAMES_DROPPED = registry.counter(
+    "crowdcount_frames_dropped_total", "Frames dropped by a full stage queue", ("pipeline", "queue"))
+FRAMES = registry.counter(
+    "crowdcount_frames_total", "Frames by outcome (captured, skipped, completed)", ("pipeline", "outcome"))
+FPS = registry.gauge(
+    "crowdcount_fps", "Frame rates: target, capture (achieved) and completed", ("pipeline", "kind"))
+STAGE_ERRORS = registry.counter(
+    "crowdcount_stage_errors_total", "Frames a stage failed on", ("pipeline", "stage"))
+
+# Recorded by API processes themselves; the rest come from the process running the pipeline
+WORKER_METRICS = ("crowdcount_jpeg_encode_seconds", "crowdcount_stream_clients")
+
+_database_watched = False
+_watch_lock = threading.Lock()
+
+def watch_database():
+    """Record batch sizes and commit times of the log writer in this process (idempotent)"""
+    global _database_watched
+    import database as db
+    with _watch_lock:
+        if _database_watched:
+            return
+        _database_watched = True
+
+    def collect():
+        stats = db.get_log_queue_stats()
+        DB_QUEUE_DEPTH.set(stats["queued"])
+        DB_DROPPED.set(stats["dropped"])
+        DB_FAILED_COMMITS.set(stats["failed_commits"])
+        DB_RETRYING.set(stats["retrying"])
+        DB_LOST.set(stats["lost"])
+
+    def record_batch(rows, seconds):
+        DB_WRITE_SECONDS.observe(seconds)
+        DB_BATCH_ROWS.observe(rows)
+
+    db.add_batch_listener(record_batch)
+    registry.add_collector(collect)
+
+def watch_pipeline(pipeline):
+    """Report a pipeline's queues, drops and frame rates on every scrape"""
+    name = pipeline.name
+
+    def collect():
+        for stage in pipeline.stages:
+            QUEUE_DEPTH.set(stage.queue.qsize(), pipeline=name, queue=stage.name)
+            QUEUE_SIZE.set(stage.queue.maxsize, pipeline=name, queue=stage.name)
+            FRAMES_DROPPED.set(stage.queue.dropped, pipeline=name, queue=stage.name)
+            STAGE_ERRORS.set(stage.stats.errors, pipeline=name, stage=stage.name)
+        FRAMES.set(pipeline.frames_captured, pipeline=name, outcome="captured")
+        FRAMES.set(pipeline.frames_skipped, pipeline=name, outcome="skipped")
+        FRAMES.set(pipeline.frames_completed, pipeline=name, outcome="completed")
+        FPS.set(pipeline.pacer.target_fps, pipeline=name, kind="target")
+        FPS.set(pipeline.pacer.achieved_fps, pipeline=name, kind="capture")
+        FPS.set(pipeline.fps, pipeline=name, kind="completed")
+
+    registry.add_collector(collect)
+    return collect
+
+def track_stream(chunks, stream):
+    """Wrap a streaming response body so its client is counted while connected"""
+    with STREAM_CLIENTS.track(stream=stream):
+        yield from chunks
+
+def render(extra_labels=None, only=None):
+    return registry.render(extra_labels, only)
@@ -0,0 +1,108 @@
+"""
+Frame Pacing
+Deadline-based pacing for the capture loop. Frames are taken on a fixed
+schedule at the source's frame rate instead of "process, then sleep", so
+slow frames do not push every later frame back. When the loop falls behind
+schedule the missed frames are skipped, not processed late; when the source
+has nothing to give, the loop backs off instead of spinning.
+"""
+
+import time
+
+DEFAULT_FPS = 30.0
+MAX_LAG = 1.0          # seconds behind schedule before starting a new schedule instead of skipping
+IDLE_MIN = 0.001       # first back-off when the source has no frame
+IDLE_MAX = 0.05        # longest back-off
+FPS_SMOOTHING = 0.1    # EWMA weight of the newest frame interval
+
+class FramePacer:
+    """
+    Schedule for one capture loop:
+
+        missed = pacer.wait(stop_event)   # sleeps until the next frame is due
+        ... skip `missed` frames, read one ...
+        pacer.tick()                      # or pacer.idle(stop_event) when there was none
+
+    paced=False (live cameras, which deliver frames at their own rate) never
+    sleeps or skips; it only measures the achieved rate.
+    """
+
+    def __init__(self, target_fps=DEFAULT_FPS, paced=True, max_lag=MAX_LAG):
+        self.target_fps = float(target_fps) if target_fps and target_fps > 0 else DEFAULT_FPS
+        self.period = 1.0 / self.target_fps
+        self.paced = paced
+        self.max_lag = max_lag
+        self.achieved_fps = 0.0
+        self.frames = 0
+        self.skipped = 0
+        self.resyncs = 0
+        self.idle_waits = 0
+        self._deadline = None
+        self._last_tick = None
+        self._idle_delay = IDLE_MIN
+
+    def wait(self, stop_event=None):
+        """Sleep until the next frame is due; returns how many frames are overdue and should be skipped"""
+        if not self.paced or self._deadline is None:
+            return 0
+        now = time.monotonic()
+        delay = self._deadline - now
+        if delay > 0:
+            if stop_event is not None:
+                stop_event.wait(delay)
+            else:
+                time.sleep(delay)
+            return 0
+        missed = int(-delay / self.period)
+        if -delay > self.max_lag:
+            # Paused or stalled: start over from now rather than skip a burst
+            self._deadline = now
+            self.resyncs += 1
+            return 0
+        self._deadline += missed * self.period
+        self.skipped += missed
+        return missed
+
+    def skip(self, count=1):
+        """Count frames dropped for reasons other than lateness (e.g. downstream still busy)"""
+        self.skipped += count
+        if self._deadline is not None:
+            self._deadline += count * self.period
+
+    def tick(self):
+        """A frame was taken: schedule the next one and update the achieved rate"""
+        now = time.monotonic()
+        self.frames += 1
+        self._idle_delay = IDLE_MIN
+        self._deadline = (now if self._deadline is None else self._deadline) + self.period
+        if self._last_tick is not None:
+            interval = now - self._last_tick
+            if interval > 0:
+                instant = 1.0 / interval
+                if self.achieved_fps == 0.0:
+                    self.achieved_fps = instant
+                else:
+                    self.achieved_fps += FPS_SMOOTHING * (instant - self.achieved_fps)
+        self._last_tick = now
+
+    def idle(self, stop_event=None):
+        """The source had no frame: back off (exponentially, up to IDLE_MAX) and restart the schedule"""
+        self.idle_waits += 1
+        self._deadline = None
+        self._last_tick = None
+        if stop_event is not None:
+            stop_event.wait(self._idle_delay)
+        else:
+            time.sleep(self._idle_delay)
+        self._idle_delay = min(self._idle_delay * 2, IDLE_MAX)
+
+    def stats(self):
+        return {
+            "target_fps": round(self.target_fps, 2),
+            "achieved_fps": round(self.achieved_fps, 2),
+            "paced": self.paced,
+            "frames": self.frames,
+            "skipped": self.skipped,
+            "resyncs": self.resyncs,
+            "idle_waits": self.idle_waits,
+        }
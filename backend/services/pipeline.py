@@ -0,0 +1,629 @@
+"""
+Pipeline Runtime
+Runs the video pipeline as explicit stages connected by bounded queues:
+
+    capture -> detect -> track -> zones -> persist -> render
+
+Every stage has its own worker thread. A stage whose function is given as a
+"module:function" path can run in a separate process instead (e.g. detect, to
+keep YOLO inference on its own cores). Each queue declares what happens when
+it is full: block the producer, drop the oldest queued frame, or drop the new one.
+After track, paths go to the trajectory store (trajectory_store.py) and can
+be recorded to a detection log (detection_log.py), which can be replayed in
+place of capture -> detect -> track, as can a simulated crowd (crowd_sim.py).
+"""
+
+import collections
+import importlib
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+
+import metrics
+import profiler
+from pacing import FramePacer
+
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+DROP_POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST)
+
+POLL_INTERVAL = 0.1       # seconds between stop checks while waiting on a queue
+DB_LOG_INTERVAL = 5.0     # seconds between database samples
+FPS_SMOOTHING = 0.1       # EWMA weight of the newest frame interval
+RECENT_SAMPLES = 1024     # latest timings kept per stage for percentiles
+
+class FrameItem:
+    """One captured frame and everything the stages derive from it"""
+    __slots__ = ("seq", "captured_at", "frame", "detections", "people", "counts", "timings")
+
+    def __init__(self, seq, frame):
+        self.seq = seq
+        self.captured_at = time.monotonic()
+        self.frame = frame
+        self.detections = None
+        self.people = None
+        self.counts = None
+        self.timings = {}
+
+class StageQueue:
+    """Bounded hand-off between two stages with a declared overflow policy"""
+
+    def __init__(self, name, maxsize=2, policy=DROP_OLDEST):
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"policy must be one of {list(DROP_POLICIES)}")
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self._q = queue.Queue(maxsize)
+
+    def put(self, item, stop_event=None):
+        """Hand an item over; returns False if it was dropped (or the pipeline stopped)"""
+        if self.policy == BLOCK:
+            while True:
+                try:
+                    self._q.put(item, timeout=POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    if stop_event is not None and stop_event.is_set():
+                        return False
+        try:
+            self._q.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.policy == DROP_NEWEST:
+                return False
+        # DROP_OLDEST: the consumer always gets the freshest frames
+        while True:
+            try:
+                self._q.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self._q.put_nowait(item)
+                return True
+            except queue.Full:
+                continue
+
+    def get(self, timeout=POLL_INTERVAL):
+        """Next item; raises queue.Empty after timeout"""
+        return self._q.get(timeout=timeout)
+
+    def qsize(self):
+        return self._q.qsize()
+
+    def full(self):
+        return self._q.full()
+
+class StageStats:
+    def __init__(self):
+        self.processed = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.last_seconds = 0.0
+        self.max_seconds = 0.0
+        self.recent = collections.deque(maxlen=RECENT_SAMPLES)
+
+    def record(self, seconds):
+        self.recent.append(seconds)
+        self.processed += 1
+        self.total_seconds += seconds
+        self.last_seconds = seconds
+        if seconds > self.max_seconds:
+            self.max_seconds = seconds
+
+    def as_dict(self):
+        mean = self.total_seconds / self.processed if self.processed else 0.0
+        recent = sorted(self.recent)
+        p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0
+        return {
+            "processed": self.processed,
+            "errors": self.errors,
+            "mean_ms": round(mean * 1000, 2),
+            "p95_ms": round(p95 * 1000, 2),
+            "last_ms": round(self.last_seconds * 1000, 2),
+            "max_ms": round(self.max_seconds * 1000, 2)
+        }
+
+def resolve(target):
+    """Callable from a callable or a "module:function" path"""
+    if callable(target):
+        return target
+    module_name, _, attr = target.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+class Stage:
+    """
+    One pipeline step. fn gets getattr(item, read) (the whole item when read is None)
+    and its result is stored as item.<write> when write is set.
+    mode="process" needs fn as a "module:function" path and read set, since only
+    that attribute is sent to the worker process and only the result comes back.
+    """
+
+    def __init__(self, name, fn, read=None, write=None, mode="thread", queue_size=2, drop=DROP_OLDEST):
+        if mode not in ("thread", "process"):
+            raise ValueError("mode must be 'thread' or 'process'")
+        if mode == "process" and (callable(fn) or read is None):
+            raise ValueError(f"process stage '{name}' needs fn as 'module:function' and a read attribute")
+        self.name = name
+        self.target = fn
+        self.read = read
+        self.write = write
+        self.mode = mode
+        self.queue = StageQueue(name, queue_size, drop)
+        self.stats = StageStats()
+        self._fn = None
+
+    def run(self, item):
+        if self._fn is None:
+            self._fn = resolve(self.target)
+        result = self._fn(item if self.read is None else getattr(item, self.read))
+        if self.write is not None:
+            setattr(item, self.write, result)
+
+def _process_main(target, sys_path, in_q, out_q):
+    """Body of a process stage: apply fn to whatever arrives until told to stop"""
+    for path in reversed(sys_path):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    try:
+        fn = resolve(target)
+        out_q.put(("ready", None, None))
+        while True:
+            message = in_q.get()
+            if message is None:
+                break
+            seq, arg = message
+            try:
+                out_q.put((seq, fn(arg), None))
+            except Exception as e:
+                out_q.put((seq, None, repr(e)))
+    except KeyboardInterrupt:
+        pass
+
+class Pipeline:
+    """
+    Capture thread plus one worker per stage. source() returns the next frame
+    (or None when there is none yet); sinks only see frames that made it through
+    every stage. pacer (pacing.FramePacer) sets the capture schedule; skip(n),
+    when given, discards n source frames without decoding them.
+    """
+
+    def __init__(self, source, stages, name="pipeline", pacer=None, skip=None):
+        self.name = name
+        self.source = source
+        self.skip = skip
+        self.pacer = pacer or FramePacer(paced=False)
+        self.stages = list(stages)
+        self.paused = threading.Event()
+        self.fps = 0.0
+        self.frames_captured = 0
+        self.frames_completed = 0
+        self.frames_skipped = 0
+        self.capture_stats = StageStats()
+        self.latency_stats = StageStats()   # capture -> end of the last stage
+        self._stop = threading.Event()
+        self._threads = []
+        self._processes = {}
+        self._last_completed = None
+        self._metrics_collector = None
+
+    # ---------- lifecycle ----------
+
+    def start(self):
+        self._stop.clear()
+        if self._metrics_collector is None:
+            self._metrics_collector = metrics.watch_pipeline(self)
+        for index, stage in enumerate(self.stages):
+            target = self._process_worker if stage.mode == "process" else self._thread_worker
+            self._spawn(target, f"{self.name}-{stage.name}", index)
+        self._spawn(self._capture_loop, f"{self.name}-capture")
+        return self
+
+    def _spawn(self, target, thread_name, *args):
+        thread = threading.Thread(target=target, args=args, name=thread_name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        for process, in_q, _ in self._processes.values():
+            try:
+                in_q.put_nowait(None)
+            except queue.Full:
+                pass
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._threads = []
+        self._processes = {}
+        if self._metrics_collector is not None:
+            metrics.registry.remove_collector(self._metrics_collector)
+            self._metrics_collector = None
+
+    @property
+    def running(self):
+        return not self._stop.is_set() and any(t.is_alive() for t in self._threads)
+
+    # ---------- workers ----------
+
+    def _capture_loop(self):
+        first = self.stages[0].queue if self.stages else None
+        pacer = self.pacer
+        seq = 0
+        while not self._stop.is_set():
+            if self.paused.is_set():
+                time.sleep(POLL_INTERVAL)
+                continue
+            missed = pacer.wait(self._stop)
+            if self._stop.is_set():
+                break
+            # The first stage has not taken the previous frame yet: don't decode one it would drop
+            busy = first is not None and first.policy != BLOCK and first.full()
+            if missed or busy:
+                self._discard(missed + (1 if busy else 0))
+            if busy:
+                pacer.skip()
+                continue
+
+            started = time.perf_counter()
+            try:
+                frame = self.source()
+            except Exception as e:
+                self.capture_stats.errors += 1
+                print(f"⚠️ Capture error: {e}")
+                time.sleep(1)
+                continue
+            if frame is None:
+                pacer.idle(self._stop)
+                continue
+            pacer.tick()
+            seq += 1
+            self.frames_captured += 1
+            item = FrameItem(seq, frame)
+            elapsed = time.perf_counter() - started
+            item.timings["capture"] = elapsed
+            self.capture_stats.record(elapsed)
+            metrics.STAGE_SECONDS.observe(elapsed, pipeline=self.name, stage="capture")
+            trace = profiler.session
+            if trace is not None:
+                trace.span("capture", started, elapsed, seq)
+            if first is None:
+                self._complete(item)
+            else:
+                first.put(item, self._stop)
+
+    def _discard(self, count):
+        """Drop frames that are due but would only be processed late"""
+        self.frames_skipped += count
+        try:
+            if self.skip is not None:
+                self.skip(count)
+            else:
+                for _ in range(count):
+                    self.source()
+        except Exception as e:
+            self.capture_stats.errors += 1
+            print(f"⚠️ Capture skip error: {e}")
+
+    def _forward(self, index, item):
+        if index + 1 < len(self.stages):
+            self.stages[index + 1].queue.put(item, self._stop)
+        else:
+            self._complete(item)
+
+    def _thread_worker(self, index):
+        stage = self.stages[index]
+        while not self._stop.is_set():
+            try:
+                item = stage.queue.get()
+            except queue.Empty:
+                continue
+            started = time.perf_counter()
+            try:
+                stage.run(item)
+            except Exception as e:
+                self._stage_error(stage, e)
+                continue
+            elapsed = time.perf_counter() - started
+            item.timings[stage.name] = elapsed
+            stage.stats.record(elapsed)
+            metrics.STAGE_SECONDS.observe(elapsed, pipeline=self.name, stage=stage.name)
+            trace = profiler.session
+            if trace is not None:
+                trace.span(stage.name, started, elapsed, item.seq)
+            self._forward(index, item)
+
+    def _start_process(self, stage):
+        ctx = multiprocessing.get_context("spawn")   # no fork with model/CUDA state or running threads
+        in_q, out_q = ctx.Queue(1), ctx.Queue(1)
+        process = ctx.Process(target=_process_main, args=(stage.target, list(sys.path), in_q, out_q),
+                              name=f"{self.name}-{stage.name}", daemon=True)
+        process.start()
+        self._processes[stage.name] = (process, in_q, out_q)
+        return process, in_q, out_q
+
+    def _process_worker(self, index):
+        stage = self.stages[index]
+        process, in_q, out_q = self._start_process(stage)
+        ready = False
+        lost_frame = False   # the process died with a frame in flight, already counted
+        while not self._stop.is_set():
+            if not process.is_alive():
+                if not lost_frame:
+                    stage.stats.errors += 1
+                lost_frame = False
+                print(f"⚠️ Stage '{stage.name}' process exited (code {process.exitcode}), restarting")
+                process, in_q, out_q = self._start_process(stage)
+                ready = False
+            if not ready:
+                # Model loading happens here, before frames are taken off the queue
+                try:
+                    ready = out_q.get(timeout=POLL_INTERVAL)[0] == "ready"
+                except queue.Empty:
+                    pass
+                continue
+            try:
+                item = stage.queue.get()
+            except queue.Empty:
+                continue
+
+            started = time.perf_counter()
+            in_q.put((item.seq, getattr(item, stage.read)))
+            result = None
+            while not self._stop.is_set() and process.is_alive():
+                try:
+                    result = out_q.get(timeout=POLL_INTERVAL)
+                    break
+                except queue.Empty:
+                    continue
+            if result is None:
+                if not self._stop.is_set():
+                    # The process died mid-frame: the frame is lost like on a stage error
+                    self._stage_error(stage, f"process exited during frame {item.seq}")
+                    lost_frame = True
+                continue
+            _, value, error = result
+            if error is not None:
+                self._stage_error(stage, error)
+                continue
+            if stage.write is not None:
+                setattr(item, stage.write, value)
+            elapsed = time.perf_counter() - started
+            item.timings[stage.name] = elapsed
+            stage.stats.record(elapsed)
+            metrics.STAGE_SECONDS.observe(elapsed, pipeline=self.name, stage=stage.name)
+            trace = profiler.session
+            if trace is not None:
+                trace.span(stage.name, started, elapsed, item.seq)
+            self._forward(index, item)
+
+    def _stage_error(self, stage, error):
+        stage.stats.errors += 1
+        if stage.stats.errors % 100 == 1:
+            print(f"⚠️ Stage '{stage.name}' error ({stage.stats.errors} so far): {error}")
+
+    def _complete(self, item):
+        now = time.monotonic()
+        self.frames_completed += 1
+        self.latency_stats.record(now - item.captured_at)
+        metrics.FRAME_LATENCY_SECONDS.observe(now - item.captured_at, pipeline=self.name)
+        trace = profiler.session
+        if trace is not None:
+            trace.frame(item.seq, item.captured_at, now)
+        if self._last_completed is not None:
+            interval = now - self._last_completed
+            if interval > 0:
+                instant = 1.0 / interval
+                self.fps = instant if self.fps == 0.0 else self.fps + FPS_SMOOTHING * (instant - self.fps)
+        self._last_completed = now
+
+    # ---------- monitoring ----------
+
+    def get_stats(self):
+        return {
+            "fps": round(self.fps, 2),
+            "frames_captured": self.frames_captured,
+            "frames_completed": self.frames_completed,
+            "frames_skipped": self.frames_skipped,
+            "paused": self.paused.is_set(),
+            "pacing": self.pacer.stats(),
+            "capture": self.capture_stats.as_dict(),
+            "latency": self.latency_stats.as_dict(),
+            "stages": {
+                stage.name: {
+                    "mode": stage.mode,
+                    "queue_depth": stage.queue.qsize(),
+                    "queue_size": stage.queue.maxsize,
+                    "drop_policy": stage.queue.policy,
+                    "dropped": stage.queue.dropped,
+                    **stage.stats.as_dict()
+                } for stage in self.stages
+            }
+        }
+
+# ==================== CROWD PIPELINE ====================
+# The default stages. Module imports happen here rather than at the top so the
+# runtime itself can be imported (and tested) without loading YOLO.
+
+class CrowdStages:
+    """State shared by the default stage functions of one camera"""
+
+    def __init__(self, live=None, camera_id=1, display=None, db_log_interval=DB_LOG_INTERVAL):
+        import cv2
+        import zones as zn
+        import frame_cache
+        import alerts
+        import rolling_stats
+        import database as db
+        self.cv2, self.zn, self.frame_cache = cv2, zn, frame_cache
+        self.alerts, self.rolling_stats, self.db = alerts, rolling_stats, db
+        self.live = live
+        self.camera_id = camera_id
+        self.display = display
+        self.db_log_interval = db_log_interval
+        self.pipeline = None
+        self.name = f"camera{camera_id}"
+        self._next_db_log = time.monotonic()
+        metrics.watch_database()
+
+    def capture(self):
+        import camera_feed as cam
+        frame = cam.get_camera_frame()
+        if frame is None:
+            return None
+        frame = self.cv2.resize(frame, (1280, 720))
+        self.frame_cache.publish_frame(frame.copy(), "raw", self.camera_id)
+        return frame
+
+    def skip(self, count):
+        import camera_feed as cam
+        cam.skip_frames(count)
+
+    def analyze_zones(self, item):
+        zn = self.zn
+        # Sub-steps of the zones stage, timed on their own to see which one costs
+        with metrics.STAGE_SECONDS.time(pipeline=self.name, stage="heatmap"):
+            zn.update_heatmap(item.people, item.frame.shape)
+        with metrics.STAGE_SECONDS.time(pipeline=self.name, stage="zone_count"):
+            zn.count_people_in_zones(item.people)
+            counts = zn.get_counts_for_api()
+        item.counts = counts
+        self.alerts.check_zones(counts["zones"], self.camera_id)
+        self.rolling_stats.observe(counts)
+        if self.live is not None:
+            self.live.publish_counts(counts)
+
+    def persist(self, item):
+        # Sampled on the monotonic clock, not per frame; log_entry only queues
+        now = time.monotonic()
+        if now >= self._next_db_log:
+            self._next_db_log += self.db_log_interval
+            if self._next_db_log <= now:
+                # Fell behind (pause, slow frame): resync instead of bursting
+                self._next_db_log = now + self.db_log_interval
+            self.db.log_entry(item.counts["total_people"], item.counts["zones"], camera_id=self.camera_id)
+
+    def render(self, item):
+        cv2, frame = self.cv2, item.frame
+        fps = self.pipeline.fps if self.pipeline is not None else 0.0
+        cv2.putText(frame, f"FPS: {int(fps)}", (20, 40),
+                    cv2.FONT_HERSHEY_DUPLEX, 1, (0, 255, 255), 2)
+        self.zn.draw_all_zones(frame)
+        self.zn.draw_zone_count_display(frame)
+        for p in item.people:
+            x1, y1, x2, y2 = p["bbox"]
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.putText(frame, f"ID:{p['id']}", (x1, y1 - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+
+        # The frame is handed over from here on: readers must copy before drawing
+        self.frame_cache.publish_frame(frame, "annotated", self.camera_id)
+        if self.display is not None:
+            self.display.put(frame)
+
+def _analytics_stages(crowd):
+    return [
+        Stage("zones", crowd.analyze_zones, queue_size=4, drop=BLOCK),
+        Stage("persist", crowd.persist, queue_size=4, drop=BLOCK),
+        # Drawing is only for viewers; never hold analytics back for it
+        Stage("render", crowd.render, queue_size=2, drop=DROP_OLDEST),
+    ]
+
+def build_crowd_pipeline(live=None, camera_id=1, detect_mode="thread", display=False, target_fps=None,
+                         record=None, trajectories=True):
+    """
+    The standard capture -> detect -> track -> zones -> persist -> render pipeline.
+    live receives every frame's counts (publish_counts); frames go to frame_cache.
+    display=True adds pipeline.display, a one-frame queue for a local window.
+    detect_mode="process" runs YOLO in its own process.
+    Video files are paced to target_fps (default: the file's own rate); live
+    cameras set their own pace.
+    record=path adds a record stage after track that writes every tracked frame
+    to a detection log ("" for a new file in detection_log.LOG_DIR;
+    pipeline.recorder, close it after stopping).
+    trajectories=True keeps every track's path in the camera's trajectory store
+    (pipeline.trajectories; close it after stopping to write what is in memory).
+    """
+    import camera_feed as cam
+    display_queue = StageQueue("display", 1, DROP_OLDEST) if display else None
+    crowd = CrowdStages(live, camera_id, display_queue)
+    stages = [
+        # Inference is the slow step: only ever work on the newest frame
+        Stage("detect", "tracking:detect_people", read="frame", write="detections",
+              mode=detect_mode, queue_size=1, drop=DROP_OLDEST),
+        # Tracking and counting must see every detected frame, in order
+        Stage("track", "tracking:update_tracks", read="detections", write="people", queue_size=4, drop=BLOCK),
+    ]
+    recorder = None
+    if record is not None:
+        import detection_log
+        recorder = detection_log.DetectionRecorder(record or detection_log.default_path(camera_id), camera_id)
+        stages.append(Stage("record", recorder.record_item, queue_size=4, drop=BLOCK))
+    store = None
+    if trajectories:
+        import trajectory_store
+        store = trajectory_store.open_store(camera_id)
+        stages.append(Stage("trajectories", store.record_item, queue_size=4, drop=BLOCK))
+    stages.extend(_analytics_stages(crowd))
+    pacer = FramePacer(target_fps or cam.get_source_fps(), paced=not cam.is_live_source())
+    pipeline = Pipeline(crowd.capture, stages, name=crowd.name, pacer=pacer, skip=crowd.skip)
+    pipeline.display = display_queue
+    pipeline.recorder = recorder
+    pipeline.trajectories = store
+    crowd.pipeline = pipeline
+    return pipeline
+
+def build_replay_pipeline(path, live=None, speed=1.0, loop=False, display=False):
+    """
+    The analytics half of the crowd pipeline fed from a detection log instead
+    of the camera and YOLO: capture -> replay -> zones -> persist -> render.
+    The camera id is the recorded one. pipeline.replay is the DetectionReplay.
+    """
+    from detection_log import DetectionReplay
+    replay = DetectionReplay(path, speed, loop)
+    display_queue = StageQueue("display", 1, DROP_OLDEST) if display else None
+    crowd = CrowdStages(live, replay.log.camera_id, display_queue)
+    # Blocking, so every replayed frame is matched with its recorded people
+    stages = [Stage("replay", replay.people, write="people", queue_size=4, drop=BLOCK)]
+    stages.extend(_analytics_stages(crowd))
+    # The replay source keeps the recorded schedule itself
+    pipeline = Pipeline(replay.capture, stages, name=crowd.name, skip=replay.skip)
+    pipeline.display = display_queue
+    pipeline.recorder = None
+    pipeline.trajectories = None
+    pipeline.replay = replay
+    crowd.pipeline = pipeline
+    return pipeline
+
+def build_sim_pipeline(people=100, camera_id=1, model="random_walk", fps=15.0, frames=None, seed=0,
+                       live=None, display=False, db_log_interval=DB_LOG_INTERVAL):
+    """
+    The analytics half of the crowd pipeline fed by a simulated crowd:
+    capture -> simulate -> zones -> persist -> render. fps paces capture
+    like a camera (frames the stages cannot keep up with are skipped);
+    fps=0 runs as fast as the stages allow. Track ids of camera N start at
+    N * 1,000,000. pipeline.simulation is the crowd_sim.SimulatedSource.
+    """
+    import crowd_sim
+    simulation = crowd_sim.CrowdSimulation(people, model=model, seed=seed, id_offset=camera_id * 1000000)
+    source = crowd_sim.SimulatedSource(simulation, fps, frames, seed)
+    display_queue = StageQueue("display", 1, DROP_OLDEST) if display else None
+    crowd = CrowdStages(live, camera_id, display_queue, db_log_interval)
+    # Blocking, so every simulated frame is matched with its people
+    stages = [Stage("simulate", source.people, write="people", queue_size=4, drop=BLOCK)]
+    stages.extend(_analytics_stages(crowd))
+    pacer = FramePacer(fps, paced=bool(fps))
+    pipeline = Pipeline(source.capture, stages, name=crowd.name, pacer=pacer, skip=source.skip)
+    pipeline.display = display_queue
+    pipeline.recorder = None
+    pipeline.trajectories = None
+    pipeline.simulation = source
+    crowd.pipeline = pipeline
+    return pipeline
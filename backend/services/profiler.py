@@ -0,0 +1,262 @@
+"""
+On-demand Profiling
+Records what the pipeline does for a bounded window without restarting the
+service: every stage of every frame as a span in Chrome trace-event JSON
+(open in chrome://tracing or https://ui.perfetto.dev) and, optionally, stack
+samples of the pipeline threads in folded format (flamegraph.pl, speedscope).
+
+While no session runs the pipeline only checks `profiler.session is None`.
+Artifacts are written to shared/profiles/<session id>/.
+"""
+
+import datetime
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import Counter
+
+backend_dir = os.path.dirname(os.path.dirname(__file__))
+PROFILE_DIR = os.path.join(os.path.dirname(backend_dir), "shared", "profiles")
+
+DEFAULT_DURATION = 10.0     # seconds
+MAX_DURATION = 300.0
+MAX_EVENTS = 500000         # spans kept per session; later ones are counted, not stored
+SAMPLE_INTERVAL = 0.005     # seconds between stack samples
+MIN_SAMPLE_INTERVAL = 0.001
+KEEP_SESSIONS = 20          # older artifact folders are deleted
+ARTIFACTS = ("trace.json", "stacks.folded", "summary.json")
+
+session = None   # the running ProfileSession, read by the pipeline on every span
+_lock = threading.Lock()
+
+class ProfileSession:
+    def __init__(self, duration=DEFAULT_DURATION, sample=False, interval=SAMPLE_INTERVAL, thread_prefix=None):
+        self.id = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.duration = duration
+        self.sample = sample
+        self.interval = interval
+        self.thread_prefix = thread_prefix
+        self.started_at = time.time()
+        self.events = []        # (name, start, duration, thread id, frame seq)
+        self.frames = []        # (seq, captured, completed) on the monotonic clock
+        self.dropped = 0
+        self.stacks = Counter()
+        self.samples = 0
+        self._t0 = time.perf_counter()
+        # Frames are stamped with time.monotonic(), spans with perf_counter()
+        self._monotonic_offset = self._t0 - time.monotonic()
+        self._thread_names = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---------- recording (pipeline threads) ----------
+
+    def span(self, name, start, duration, seq=None):
+        """A stage run that began at perf_counter() time `start`"""
+        if len(self.events) >= MAX_EVENTS:
+            self.dropped += 1
+            return
+        self.events.append((name, start, duration, threading.get_ident(), seq))
+
+    def frame(self, seq, captured_at, completed_at):
+        """A frame's whole trip through the pipeline (monotonic times)"""
+        if len(self.frames) < MAX_EVENTS:
+            self.frames.append((seq, captured_at, completed_at))
+
+    # ---------- sampling ----------
+
+    def _targets(self):
+        me = threading.get_ident()
+        targets = {}
+        for thread in threading.enumerate():
+            if thread.ident == me:
+                continue
+            if self.thread_prefix and not thread.name.startswith(self.thread_prefix):
+                continue
+            targets[thread.ident] = thread.name
+        self._thread_names.update(targets)
+        return targets
+
+    def _sample_once(self, targets):
+        frames = sys._current_frames()
+        for ident, thread_name in targets.items():
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(thread_name)
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        deadline = time.monotonic() + self.duration
+        targets = self._targets()
+        refreshed = time.monotonic()
+        while not self._stop.is_set():
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if not self.sample:
+                self._stop.wait(deadline - now)
+                continue
+            if now - refreshed >= 1.0:
+                # Pipeline threads can be restarted during a session
+                targets = self._targets()
+                refreshed = now
+            self._sample_once(targets)
+            self._stop.wait(self.interval)
+        _finish(self)
+
+    # ---------- artifacts ----------
+
+    def _micros(self, perf_time):
+        return round((perf_time - self._t0) * 1e6, 1)
+
+    def trace_events(self):
+        pid = os.getpid()
+        names = dict(self._thread_names)
+        names.update({t.ident: t.name for t in threading.enumerate()})
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "crowdcount"}}]
+        for ident in sorted({e[3] for e in self.events}):
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": ident,
+                           "args": {"name": names.get(ident, str(ident))}})
+        for name, start, duration, ident, seq in self.events:
+            events.append({"name": name, "cat": "stage", "ph": "X", "pid": pid, "tid": ident,
+                           "ts": self._micros(start), "dur": round(duration * 1e6, 1),
+                           "args": {"frame": seq}})
+        for seq, captured, completed in self.frames:
+            # Async slices: overlapping frames each get their own row
+            common = {"name": "frame", "cat": "frame", "id": seq, "pid": pid}
+            events.append({**common, "ph": "b", "ts": self._micros(captured + self._monotonic_offset)})
+            events.append({**common, "ph": "e", "ts": self._micros(completed + self._monotonic_offset)})
+        return events
+
+    def summary(self):
+        by_stage = {}
+        for name, _, duration, _, _ in self.events:
+            by_stage.setdefault(name, []).append(duration)
+        stages = {}
+        for name, durations in by_stage.items():
+            durations.sort()
+            n = len(durations)
+            stages[name] = {
+                "count": n,
+                "mean_ms": round(sum(durations) / n * 1000, 3),
+                "p50_ms": round(durations[n // 2] * 1000, 3),
+                "p95_ms": round(durations[min(n - 1, int(n * 0.95))] * 1000, 3),
+                "max_ms": round(durations[-1] * 1000, 3),
+            }
+        latencies = sorted(completed - captured for _, captured, completed in self.frames)
+        return {
+            "id": self.id,
+            "started_at": datetime.datetime.fromtimestamp(self.started_at).strftime("%Y-%m-%d %H:%M:%S"),
+            "duration_s": round(time.time() - self.started_at, 3),
+            "frames": len(self.frames),
+            "spans": len(self.events),
+            "spans_dropped": self.dropped,
+            "samples": self.samples,
+            "stages": stages,
+            "frame_latency_p50_ms": round(latencies[len(latencies) // 2] * 1000, 3) if latencies else None,
+        }
+
+    def write(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        summary = self.summary()
+        with open(os.path.join(directory, "trace.json"), "w") as f:
+            json.dump({"traceEvents": self.trace_events(), "displayTimeUnit": "ms",
+                       "otherData": {"session": self.id}}, f)
+        if self.sample:
+            with open(os.path.join(directory, "stacks.folded"), "w") as f:
+                for stack, count in self.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        with open(os.path.join(directory, "summary.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+        return summary
+
+# ==================== MODULE API ====================
+
+_last_summary = None
+
+def start(duration=DEFAULT_DURATION, sample=False, interval=SAMPLE_INTERVAL, thread_prefix=None):
+    """Begin a session that ends by itself after `duration` seconds; raises RuntimeError if one runs"""
+    global session
+    if not 0 < duration <= MAX_DURATION:
+        raise ValueError(f"duration must be between 0 and {MAX_DURATION:g} seconds")
+    interval = max(interval, MIN_SAMPLE_INTERVAL)
+    with _lock:
+        if session is not None:
+            raise RuntimeError(f"Profiling session {session.id} is already running")
+        new = ProfileSession(duration, sample, interval, thread_prefix)
+        if os.path.isdir(os.path.join(PROFILE_DIR, new.id)):
+            raise RuntimeError("A profiling session was started less than a second ago")
+        new._thread = threading.Thread(target=new._run, name="profiler", daemon=True)
+        session = new
+    new._thread.start()
+    return status()
+
+def stop(timeout=10.0):
+    """End the running session early and wait for its artifacts; returns its summary"""
+    current = session
+    if current is None:
+        return _last_summary
+    current._stop.set()
+    current._thread.join(timeout)
+    return _last_summary
+
+def _finish(finished):
+    global session, _last_summary
+    with _lock:
+        if session is finished:
+            session = None
+    try:
+        _last_summary = finished.write(os.path.join(PROFILE_DIR, finished.id))
+    except Exception as e:
+        print(f"Profiler write error: {e}")
+        _last_summary = {"id": finished.id, "error": str(e)}
+    _purge_old_sessions()
+
+def _purge_old_sessions():
+    if not os.path.isdir(PROFILE_DIR):
+        return
+    for name in sorted(os.listdir(PROFILE_DIR))[:-KEEP_SESSIONS]:
+        shutil.rmtree(os.path.join(PROFILE_DIR, name), ignore_errors=True)
+
+def status():
+    current = session
+    if current is None:
+        return {"active": False, "last": _last_summary}
+    return {
+        "active": True,
+        "id": current.id,
+        "sample": current.sample,
+        "elapsed_s": round(time.time() - current.started_at, 3),
+        "duration_s": current.duration,
+        "spans": len(current.events),
+        "samples": current.samples,
+    }
+
+def list_sessions():
+    """Finished sessions on disk, newest first, with their artifact names"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    sessions = []
+    for name in sorted(os.listdir(PROFILE_DIR), reverse=True):
+        directory = os.path.join(PROFILE_DIR, name)
+        if os.path.isdir(directory):
+            sessions.append({"id": name, "artifacts": [a for a in ARTIFACTS
+                                                       if os.path.exists(os.path.join(directory, a))]})
+    return sessions
+
+def artifact_path(session_id, artifact):
+    """Path of a stored artifact, or None (names are checked, never joined blindly)"""
+    if artifact not in ARTIFACTS or session_id not in {s["id"] for s in list_sessions()}:
+        return None
+    path = os.path.join(PROFILE_DIR, session_id, artifact)
+    return path if os.path.exists(path) else None
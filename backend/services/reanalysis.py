@@ -0,0 +1,350 @@
+"""
+Zone Reanalysis
+Recomputes past per-zone occupancy, entries and dwell from stored
+trajectories (the trajectory store, resampled to frames, or recorded
+detection logs) under a different zone set, so zone edits can be applied
+retroactively without reprocessing video. Results are a separate series
+(database reanalysis_runs / reanalysis_counts), next to the logged counts.
+
+The time range is cut into chunks on a fixed grid; every chunk carries
+MAX_GAP seconds of lead-in so tracks already inside a zone are not counted
+as entering it, and chunks are analyzed in worker processes. Zone membership
+is a lookup in a rasterized mask of each zone, so a chunk costs a few numpy
+passes per zone however many people it holds.
+
+    occupancy   people inside per frame (average and peak per bucket)
+    entries     tracks appearing inside a zone they were not in on their
+                previous appearance (or after a gap of more than MAX_GAP)
+    dwell       person-seconds spent inside (each appearance lasts until
+                the next frame, at most MAX_GAP)
+"""
+
+import datetime
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import cv2
+import numpy as np
+
+DEFAULT_BUCKET = 60          # seconds; 60 lines up with the minute rollups
+CHUNK_SECONDS = 600          # work unit of a worker (a multiple of the bucket)
+MAX_GAP = 2.0                # seconds a track can vanish and still be the same visit
+MAX_RANGE = datetime.timedelta(days=31)
+WORKERS = max(1, min(4, (os.cpu_count() or 1) - 1))
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reanalysis")
+_lock = threading.Lock()
+_running = {}         # {run_id: progress dict} for runs in this process
+
+# ==================== ZONE MASKS ====================
+
+def zone_masks(zone_list):
+    """
+    (name, x0, y0, mask) per zone: the polygon rasterized over its bounding box.
+    Pixels along the outline are decided by cv2.pointPolygonTest, as live
+    counting does (zones.is_point_inside_zone), since fillPoly rounds them differently.
+    """
+    masks = []
+    for zone in zone_list:
+        pts = np.array(zone["points"], np.int32).reshape(-1, 2)
+        x0, y0 = np.maximum(pts.min(axis=0), 0)
+        x1, y1 = pts.max(axis=0)
+        shape = (max(y1 - y0 + 1, 1), max(x1 - x0 + 1, 1))
+        local = (pts - (x0, y0)).reshape(-1, 1, 2)
+        mask = np.zeros(shape, dtype=np.uint8)
+        cv2.fillPoly(mask, [local], 1)
+        outline = np.zeros(shape, dtype=np.uint8)
+        cv2.polylines(outline, [local], True, 1, thickness=3)
+        contour = local.astype(np.float32)
+        for y, x in zip(*np.nonzero(outline)):
+            mask[y, x] = cv2.pointPolygonTest(contour, (float(x), float(y)), False) >= 0
+        masks.append((zone["name"], int(x0), int(y0), mask.astype(bool)))
+    return masks
+
+def _inside(mask_entry, cx, cy):
+    _, x0, y0, mask = mask_entry
+    h, w = mask.shape
+    x, y = cx - x0, cy - y0
+    valid = (x >= 0) & (x < w) & (y >= 0) & (y < h)
+    inside = np.zeros(len(cx), dtype=bool)
+    inside[valid] = mask[y[valid], x[valid]]
+    return inside
+
+# ==================== CHUNKS ====================
+
+def _pack(frames, lead_in, next_t):
+    """Arrays for one chunk: frames[:lead_in] are context only"""
+    frame_t = np.array([t for t, _ in frames], dtype=np.float64)
+    sizes = np.array([len(records) for _, records in frames], dtype=np.int64)
+    records = np.concatenate([records for _, records in frames])
+    x1, y1 = records["x1"].astype(np.int32), records["y1"].astype(np.int32)
+    x2, y2 = records["x2"].astype(np.int32), records["y2"].astype(np.int32)
+    return {
+        "frame_t": frame_t,
+        "next_t": next_t,
+        "lead_in": lead_in,
+        "det_frame": np.repeat(np.arange(len(frames)), sizes),
+        "tid": records["id"].astype(np.int64),
+        "cx": (x1 + x2) // 2,
+        "cy": (y1 + y2) // 2,
+    }
+
+def iter_chunks(frames, start, end, chunk_seconds=CHUNK_SECONDS):
+    """
+    Group (unix time, PERSON array) frames, in time order, into chunks on the
+    chunk_seconds grid, each led in by the frames of the MAX_GAP seconds before it
+    """
+    chunk_end = None
+    context, current = [], []
+    next_t = None
+    for t, records in frames:
+        if t < start - MAX_GAP:
+            continue
+        if t >= end:
+            next_t = t
+            break
+        if t >= start and chunk_end is not None and t >= chunk_end:
+            yield _pack(context + current, len(context), t)
+            context = [f for f in context + current if f[0] >= t - MAX_GAP]
+            current = []
+            chunk_end = None
+        if t < start:
+            context.append((t, records))
+            continue
+        if chunk_end is None:
+            chunk_end = (t // chunk_seconds + 1) * chunk_seconds
+        current.append((t, records))
+    if current:
+        yield _pack(context + current, len(context), next_t)
+
+# ==================== ANALYSIS ====================
+
+# Worker processes get the masks once and never import the database module
+_masks = None
+_total_zone = None
+
+def _init_worker(sys_path, masks, total_zone):
+    global _masks, _total_zone
+    for path in reversed(sys_path):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    _masks, _total_zone = masks, total_zone
+
+def analyze_chunk(chunk, bucket=DEFAULT_BUCKET, masks=None, total_zone=None):
+    """
+    Per-bucket rows (bucket start unix time, zone, samples, sum, max, entries, dwell)
+    for the counted frames of a chunk; total_zone sums all zones like the live total
+    """
+    masks = masks if masks is not None else _masks
+    total_zone = total_zone or _total_zone
+    frame_t, lead_in = chunk["frame_t"], chunk["lead_in"]
+    det_frame, tid, cx, cy = chunk["det_frame"], chunk["tid"], chunk["cx"], chunk["cy"]
+    n_frames = len(frame_t)
+
+    next_t = np.append(frame_t[1:], chunk["next_t"] if chunk["next_t"] is not None else frame_t[-1])
+    frame_dt = np.minimum(next_t - frame_t, MAX_GAP)
+
+    # Buckets of the counted frames; lead-in frames get -1
+    bucket_index = np.full(n_frames, -1, dtype=np.int64)
+    counted = np.arange(n_frames) >= lead_in
+    bucket_starts, bucket_index[counted] = np.unique(frame_t[counted] // bucket, return_inverse=True)
+    n_buckets = len(bucket_starts)
+    samples = np.bincount(bucket_index[counted], minlength=n_buckets)
+
+    # Each detection's previous appearance of the same track (if within MAX_GAP)
+    det_t = frame_t[det_frame]
+    order = np.lexsort((det_t, tid))
+    s_tid, s_t = tid[order], det_t[order]
+    continued = np.zeros(len(order), dtype=bool)
+    continued[1:] = (s_tid[1:] == s_tid[:-1]) & (s_t[1:] - s_t[:-1] <= MAX_GAP)
+
+    det_bucket = bucket_index[det_frame]
+    det_counted = det_bucket >= 0
+    det_dwell = frame_dt[det_frame]
+
+    rows = []
+    total_occupancy = np.zeros(n_frames, dtype=np.int64)
+    total_entries = np.zeros(n_buckets, dtype=np.int64)
+    total_dwell = np.zeros(n_buckets, dtype=np.float64)
+    for entry in masks:
+        inside = _inside(entry, cx, cy)
+        s_inside = inside[order]
+        entered_sorted = s_inside.copy()
+        entered_sorted[1:] &= ~(continued[1:] & s_inside[:-1])
+        entered = np.empty_like(inside)
+        entered[order] = entered_sorted
+
+        here = inside & det_counted
+        occupancy = np.bincount(det_frame[here], minlength=n_frames)
+        total_occupancy += occupancy
+        sums = np.bincount(bucket_index[counted], weights=occupancy[counted], minlength=n_buckets)
+        peaks = np.zeros(n_buckets, dtype=np.int64)
+        np.maximum.at(peaks, bucket_index[counted], occupancy[counted])
+        entries = np.bincount(det_bucket[entered & det_counted], minlength=n_buckets)
+        dwell = np.bincount(det_bucket[here], weights=det_dwell[here], minlength=n_buckets)
+        total_entries += entries
+        total_dwell += dwell
+        rows.extend(_rows(bucket_starts, bucket, entry[0], samples, sums, peaks, entries, dwell))
+
+    sums = np.bincount(bucket_index[counted], weights=total_occupancy[counted], minlength=n_buckets)
+    peaks = np.zeros(n_buckets, dtype=np.int64)
+    np.maximum.at(peaks, bucket_index[counted], total_occupancy[counted])
+    rows.extend(_rows(bucket_starts, bucket, total_zone, samples, sums, peaks, total_entries, total_dwell))
+    return rows
+
+def _rows(bucket_starts, bucket, zone_name, samples, sums, peaks, entries, dwell):
+    return [
+        (float(b * bucket), zone_name, int(n), int(s), int(p), int(e), round(float(d), 3))
+        for b, n, s, p, e, d in zip(bucket_starts, samples, sums, peaks, entries, dwell)
+    ]
+
+def log_frames(logs):
+    """(unix time, PERSON array) for every frame of some DetectionLogs, oldest first"""
+    for log in logs:
+        for t, _, records in log.frames(as_arrays=True):
+            yield log.started_at + t, records
+
+def reanalyze(frames, start, end, zone_list, bucket=DEFAULT_BUCKET, workers=WORKERS,
+              on_rows=None, chunk_seconds=CHUNK_SECONDS):
+    """
+    Analyze (unix time, PERSON array) frames in [start, end) (unix times) under
+    zone_list. on_rows(rows) receives every chunk's rows as it finishes (in any
+    order); returns {"frames", "detections", "chunks", "rows", "seconds"}.
+    workers <= 1 analyzes in the calling thread.
+    """
+    import database as db
+    chunk_seconds = max(bucket, chunk_seconds // bucket * bucket)
+    masks = zone_masks(zone_list)
+    summary = {"frames": 0, "detections": 0, "chunks": 0, "rows": 0}
+    started = time.perf_counter()
+
+    def collect(rows):
+        summary["rows"] += len(rows)
+        if on_rows is not None:
+            on_rows(rows)
+
+    chunks = iter_chunks(frames, start, end, chunk_seconds)
+    if workers <= 1:
+        for chunk in chunks:
+            _count(summary, chunk)
+            collect(analyze_chunk(chunk, bucket, masks, db.TOTAL_ZONE))
+    else:
+        # Spawned, not forked: the API process has threads of its own
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(list(sys.path), masks, db.TOTAL_ZONE)) as pool:
+            pending = set()
+            for chunk in chunks:
+                _count(summary, chunk)
+                pending.add(pool.submit(analyze_chunk, chunk, bucket))
+                # Bounded: the source is read only as fast as the workers keep up
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        collect(future.result())
+            for future in pending:
+                collect(future.result())
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    return summary
+
+def _count(summary, chunk):
+    counted = chunk["det_frame"] >= chunk["lead_in"]
+    summary["frames"] += len(chunk["frame_t"]) - chunk["lead_in"]
+    summary["detections"] += int(counted.sum())
+    summary["chunks"] += 1
+
+# ==================== JOBS ====================
+
+def _unix(ts):
+    """UTC datetime (naive as stored in the database, or aware) to unix time"""
+    if ts.tzinfo is not None:
+        return ts.timestamp()
+    return ts.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+def _utc(unix_time):
+    return datetime.datetime.fromtimestamp(unix_time, datetime.timezone.utc).replace(tzinfo=None)
+
+def _source(start, end, camera_id, log_dir):
+    """(name, frames) covering [start, end): the trajectory store, else recorded detection logs"""
+    import detection_log
+    import trajectory_store
+    store = trajectory_store.get_store(camera_id)
+    if store.has_data(start - MAX_GAP, end):
+        return "trajectories", store.frames(start - MAX_GAP, end)
+    logs = detection_log.find_logs(start - MAX_GAP, end, camera_id, log_dir)
+    if logs:
+        return "detection logs", log_frames(logs)
+    raise RuntimeError("No stored trajectories for this camera and time range")
+
+def _run(run_id, start, end, zone_list, camera_id, bucket, workers, log_dir):
+    import database as db
+    progress = _running[run_id]
+
+    def save(rows):
+        db.save_reanalysis_counts(run_id, [(_utc(b), *rest) for b, *rest in rows])
+        progress["rows"] += len(rows)
+
+    try:
+        source, frames = _source(_unix(start), _unix(end), camera_id, log_dir)
+        summary = reanalyze(frames, _unix(start), _unix(end), zone_list, bucket, workers, save)
+        db.finish_reanalysis_run(run_id, "done", summary["frames"], summary["detections"])
+        print(f"🔁 Reanalysis {run_id}: {summary['frames']} frames from {source} in {summary['seconds']} s")
+    except Exception as e:
+        print(f"Reanalysis error: {e}")
+        db.finish_reanalysis_run(run_id, "failed", error=str(e))
+    finally:
+        with _lock:
+            _running.pop(run_id, None)
+
+def submit(start, end, zone_list, camera_id=1, bucket=DEFAULT_BUCKET, workers=WORKERS, log_dir=None):
+    """
+    Queue a reanalysis of [start, end) (naive UTC datetimes) under zone_list
+    ([{"name", "points"}]) and return its run id; runs execute one at a time
+    """
+    import database as db
+    start, end = db.naive_utc(start), db.naive_utc(end)
+    if start >= end:
+        raise ValueError("start must be before end")
+    if end - start > MAX_RANGE:
+        raise ValueError(f"A reanalysis covers at most {MAX_RANGE.days} days")
+    if bucket < 1:
+        raise ValueError("bucket must be at least 1 second")
+    if not zone_list:
+        raise ValueError("At least one zone is needed")
+    for zone in zone_list:
+        if not zone.get("name") or len(zone.get("points") or []) < 3:
+            raise ValueError("Every zone needs a name and at least 3 points")
+    zone_list = [{"name": z["name"], "points": z["points"]} for z in zone_list]
+    run_id = db.create_reanalysis_run(start, end, bucket, zone_list, camera_id)
+    with _lock:
+        _running[run_id] = {"rows": 0, "submitted_at": time.time()}
+    _executor.submit(_run, run_id, start, end, zone_list, camera_id, bucket, workers, log_dir)
+    return run_id
+
+def get_run(run_id):
+    """The stored run, with rows written so far while it is running in this process"""
+    import database as db
+    run = db.get_reanalysis_run(run_id)
+    if run is not None and run_id in _running:
+        run["rows_written"] = _running[run_id]["rows"]
+    return run
+
+def compare(run_id, zone_name=None):
+    """A zone's (default: the total's) reanalyzed series next to the logged minute rollups"""
+    import database as db
+    zone_name = zone_name or db.TOTAL_ZONE
+    run = get_run(run_id)
+    if run is None:
+        return None
+    start = datetime.datetime.strptime(run["start"], "%Y-%m-%d %H:%M:%S")
+    end = datetime.datetime.strptime(run["end"], "%Y-%m-%d %H:%M:%S")
+    return {
+        "run": run,
+        "zone": zone_name,
+        "reanalyzed": db.get_reanalysis_series(run_id, zone_name),
+        "logged": db.get_rollup_series(start, end, zone_name, "minute", run["camera_id"])["points"],
+    }
@@ -0,0 +1,223 @@
+"""
+Report Jobs
+Renders PDF reports on a background worker and caches the results on disk,
+keyed by time range and the version of the data in that range
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from sqlalchemy import func, select
+
+import database as db
+
+REPORTS_DIR = os.path.join(os.path.dirname(db.DB_PATH), "reports")
+REPORT_CACHE_MAX = 50        # cached PDFs kept on disk
+JOB_TTL = 3600               # seconds finished jobs stay queryable
+MAX_WAIT = 60.0              # longest a request may wait for its report to render
+REPORT_WORKERS = 1
+
+os.makedirs(REPORTS_DIR, exist_ok=True)
+
+_executor = ThreadPoolExecutor(max_workers=REPORT_WORKERS, thread_name_prefix="report")
+_lock = threading.Lock()
+_jobs = {}            # {job_id: job dict}
+_pending_by_key = {}  # {cache_key: job_id} for jobs still queued or running
+
+HEADER_STYLE = [
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+]
+
+def data_version(start, end):
+    """
+    Fingerprint of everything the report shows: the log rows in range
+    (count + newest id) and the threshold configuration
+    """
+    logs = db.LogEntry.__table__
+    stmt = select(func.count(logs.c.id), func.max(logs.c.id)).where(
+        logs.c.timestamp >= start, logs.c.timestamp < end)
+    with db.ENGINE.connect() as conn:
+        count, newest = conn.execute(stmt).one()
+    thresholds = json.dumps(db.get_all_thresholds(), sort_keys=True)
+    digest = hashlib.sha1(thresholds.encode()).hexdigest()[:8]
+    return f"{count}-{newest or 0}-{digest}"
+
+def cache_key(start, end):
+    raw = f"{start.isoformat()}|{end.isoformat()}|{data_version(start, end)}"
+    return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+def _cache_path(key):
+    return os.path.join(REPORTS_DIR, f"crowd_report_{key}.pdf")
+
+def build_pdf(file_path, start, end):
+    """
+    Render the analytics report for [start, end) into file_path. Cached
+    PDFs are shared by every requester, so nothing user-specific goes in.
+    """
+    doc = SimpleDocTemplate(file_path, pagesize=letter)
+    elements = []
+    styles = getSampleStyleSheet()
+
+    # Title
+    title = Paragraph("<b>CrowdCount - Infosys</b><br/>Crowd Analytics Report", styles['Title'])
+    elements.append(title)
+    elements.append(Spacer(1, 20))
+
+    # Metadata
+    meta_text = f"<b>Generated:</b> {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}<br/>"
+    meta_text += f"<b>Period (UTC):</b> {start.strftime('%Y-%m-%d %H:%M')} - {end.strftime('%Y-%m-%d %H:%M')}"
+    elements.append(Paragraph(meta_text, styles['Normal']))
+    elements.append(Spacer(1, 20))
+
+    # Zone summary for the period, from the rollup tables
+    stats = db.get_rollup_stats(start, end)
+    thresholds = db.get_all_thresholds()
+    total = stats.pop(db.TOTAL_ZONE, None)
+    if total:
+        summary = (f"<b>Samples:</b> {total['samples']} &nbsp; <b>Average people:</b> {total['average_count']} "
+                   f"&nbsp; <b>Peak:</b> {total['max_count']} &nbsp; <b>Minimum:</b> {total['min_count']}")
+        elements.append(Paragraph(summary, styles['Normal']))
+        elements.append(Spacer(1, 20))
+
+    zone_data = [["Zone Name", "Average", "Peak", "Threshold", "Alert Enabled"]]
+    for zone_name in sorted(set(stats) | set(thresholds)):
+        zone_stats = stats.get(zone_name, {})
+        threshold = thresholds.get(zone_name, {})
+        zone_data.append([
+            zone_name,
+            str(zone_stats.get("average_count", "-")),
+            str(zone_stats.get("max_count", "-")),
+            str(threshold.get("max_capacity", 30)),
+            "Yes" if threshold.get("alert_enabled", True) else "No"
+        ])
+
+    zone_table = Table(zone_data)
+    zone_table.setStyle(TableStyle(HEADER_STYLE))
+    elements.append(Paragraph("<b>Zone Summary</b>", styles['Heading2']))
+    elements.append(Spacer(1, 10))
+    elements.append(zone_table)
+    elements.append(Spacer(1, 20))
+
+    # Latest samples in the period
+    _, recent, _ = db.get_history_page(start, end, limit=10)
+    if recent:
+        elements.append(Paragraph("<b>Recent Activity (Last 10 Entries)</b>", styles['Heading2']))
+        elements.append(Spacer(1, 10))
+
+        log_data = [["Timestamp", "Total People"]]
+        for ts, _camera_id, total_people in recent:
+            log_data.append([ts, str(total_people)])
+
+        log_table = Table(log_data)
+        log_table.setStyle(TableStyle(HEADER_STYLE))
+        elements.append(log_table)
+
+    doc.build(elements)
+
+def _prune_cache():
+    """Keep the newest REPORT_CACHE_MAX PDFs, never one a queryable job still points to"""
+    with _lock:
+        in_use = {job["path"] for job in _jobs.values() if job["path"]}
+    files = [os.path.join(REPORTS_DIR, f) for f in os.listdir(REPORTS_DIR) if f.endswith(".pdf")]
+    files = [path for path in files if path not in in_use]
+    if len(files) <= REPORT_CACHE_MAX:
+        return
+    files.sort(key=os.path.getmtime)
+    for path in files[:len(files) - REPORT_CACHE_MAX]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _prune_jobs():
+    cutoff = time.time() - JOB_TTL
+    for job_id in [j for j, job in _jobs.items() if job["finished_at"] and job["finished_at"] < cutoff]:
+        del _jobs[job_id]
+
+def _run_job(job_id):
+    job = _jobs[job_id]
+    job["status"] = "running"
+    path = _cache_path(job["key"])
+    tmp_path = path + f".{job_id}.tmp"
+    try:
+        build_pdf(tmp_path, job["start"], job["end"])
+        os.replace(tmp_path, path)
+        job["path"] = path
+        job["status"] = "done"
+        _prune_cache()
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+        print(f"Report generation error: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    finally:
+        job["finished_at"] = time.time()
+        with _lock:
+            _pending_by_key.pop(job["key"], None)
+        job["finished"].set()
+
+def submit_report(start, end):
+    """
+    Queue a report for [start, end) and return its job dict.
+    A cached PDF for the same range and data is returned as an already finished job,
+    and an identical job still in progress is shared instead of queued twice.
+    """
+    key = cache_key(start, end)
+    path = _cache_path(key)
+    with _lock:
+        _prune_jobs()
+        if key in _pending_by_key:
+            return _jobs[_pending_by_key[key]]
+
+        job_id = uuid.uuid4().hex[:12]
+        job = {
+            "job_id": job_id, "key": key, "status": "queued", "cached": False,
+            "start": start, "end": end, "path": None, "error": None,
+            "created_at": time.time(), "finished_at": None, "finished": threading.Event()
+        }
+        _jobs[job_id] = job
+        if os.path.exists(path):
+            os.utime(path)  # keep recently served reports in the cache
+            job.update(status="done", cached=True, path=path, finished_at=time.time())
+            job["finished"].set()
+            return job
+        _pending_by_key[key] = job_id
+
+    _executor.submit(_run_job, job_id)
+    return job
+
+def get_job(job_id):
+    return _jobs.get(job_id)
+
+def wait_for_job(job, timeout):
+    """Block until the job is done or failed, at most timeout (capped at MAX_WAIT) seconds"""
+    return job["finished"].wait(min(max(timeout, 0.0), MAX_WAIT))
+
+def job_info(job):
+    """Public view of a job (no filesystem paths)"""
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "cached": job["cached"],
+        "start": job["start"].strftime("%Y-%m-%d %H:%M:%S"),
+        "end": job["end"].strftime("%Y-%m-%d %H:%M:%S"),
+        "error": job["error"]
+    }
@@ -0,0 +1,108 @@
+"""
+Response Cache
+Shared cache for read-only API responses. Entries are keyed by endpoint and
+parameters, evicted least-recently-used, expire after a TTL and are dropped as
+soon as the database writer reports new data (or, in a process without the
+writer, as soon as the database file changes). Concurrent requests for the
+same entry share a single computation.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import database as db
+
+MAX_ENTRIES = 256
+DEFAULT_TTL = 30.0    # seconds; also bounds staleness of "last N hours" windows
+
+class _Flight:
+    """A computation in progress that other requests can wait on"""
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+class ResponseCache:
+    def __init__(self, max_entries=MAX_ENTRIES, ttl=DEFAULT_TTL, version=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._version = version or _current_version
+        self._entries = OrderedDict()   # {key: (version, expires_at, value)}
+        self._inflight = {}             # {(key, version): _Flight}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get_or_compute(self, endpoint, params, compute, ttl=None):
+        """
+        Return the cached value of endpoint(params), calling compute() on a miss.
+        params must be hashable (a tuple of the query parameters).
+        """
+        key = (endpoint, params)
+        version = self._version()
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry_version, expires_at, value = entry
+                if entry_version == version and expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            flight = self._inflight.get((key, version))
+            leader = flight is None
+            if leader:
+                flight = self._inflight[(key, version)] = _Flight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[(key, version)]
+                if flight.error is None:
+                    self._entries[key] = (version, time.monotonic() + (self.ttl if ttl is None else ttl), flight.value)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            flight.done.set()
+        return flight.value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        return {"entries": size, "hits": self.hits, "misses": self.misses, "coalesced": self.coalesced}
+
+def _current_version():
+    if db.has_log_writer():
+        return db.get_data_version(), db.get_threshold_version()
+    # No writer in this process (api-only): the rows come from another process
+    return db.get_file_version(), db.get_threshold_version()
+
+# Shared by every route module in this process
+cache = ResponseCache()
+
+def cached(endpoint, params, compute, ttl=None):
+    return cache.get_or_compute(endpoint, params, compute, ttl)
@@ -0,0 +1,222 @@
+"""
+Rolling Statistics
+Streaming per-zone occupancy statistics over sliding windows (1m / 15m / 1h):
+mean, variance, min/max, EWMA and percentiles, updated from every frame of
+zones.get_counts_for_api() output and read without touching the database.
+
+Samples are folded into one-second buckets. Each window keeps running sums,
+monotonic deques of bucket minima/maxima and a value histogram (occupancy
+counts are small integers, so the histogram is a compact exact quantile
+sketch), so both updates and reads are O(1) amortized in the sample rate.
+"""
+
+import math
+import threading
+import time
+from collections import deque
+
+WINDOWS = {"1m": 60.0, "15m": 900.0, "1h": 3600.0}
+BUCKET_SECONDS = 1.0
+PERCENTILES = (50, 90, 95, 99)
+TOTAL_KEY = "__total__"
+
+class _Bucket:
+    __slots__ = ("start", "n", "total", "total_sq", "lo", "hi", "hist")
+
+    def __init__(self, start):
+        self.start = start
+        self.n = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.lo = math.inf
+        self.hi = -math.inf
+        self.hist = {}
+
+    def add(self, value):
+        self.n += 1
+        self.total += value
+        self.total_sq += value * value
+        if value < self.lo:
+            self.lo = value
+        if value > self.hi:
+            self.hi = value
+        key = round(value)
+        self.hist[key] = self.hist.get(key, 0) + 1
+
+class _Window:
+    """Aggregates of the completed buckets that fall inside one window"""
+
+    def __init__(self, span):
+        self.span = span
+        self.tau = span / 3.0   # EWMA time constant: ~95% of the weight inside the window
+        self.buckets = deque()
+        self.mins = deque()     # bucket minima, increasing
+        self.maxs = deque()     # bucket maxima, decreasing
+        self.n = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.hist = {}
+        self.ewma = None
+        self.ewma_at = None
+
+    def push(self, bucket):
+        self.buckets.append(bucket)
+        self.n += bucket.n
+        self.total += bucket.total
+        self.total_sq += bucket.total_sq
+        for key, freq in bucket.hist.items():
+            self.hist[key] = self.hist.get(key, 0) + freq
+        while self.mins and self.mins[-1].lo >= bucket.lo:
+            self.mins.pop()
+        self.mins.append(bucket)
+        while self.maxs and self.maxs[-1].hi <= bucket.hi:
+            self.maxs.pop()
+        self.maxs.append(bucket)
+
+    def expire(self, now):
+        cutoff = now - self.span
+        while self.buckets and self.buckets[0].start + BUCKET_SECONDS <= cutoff:
+            old = self.buckets.popleft()
+            self.n -= old.n
+            self.total -= old.total
+            self.total_sq -= old.total_sq
+            for key, freq in old.hist.items():
+                left = self.hist[key] - freq
+                if left:
+                    self.hist[key] = left
+                else:
+                    del self.hist[key]
+            if self.mins and self.mins[0] is old:
+                self.mins.popleft()
+            if self.maxs and self.maxs[0] is old:
+                self.maxs.popleft()
+        if not self.buckets:
+            # Drop float rounding error accumulated by add/subtract cycles
+            self.total = self.total_sq = 0.0
+
+    def update_ewma(self, value, now):
+        if self.ewma is None:
+            self.ewma = float(value)
+        else:
+            alpha = 1.0 - math.exp(-(now - self.ewma_at) / self.tau)
+            self.ewma += alpha * (value - self.ewma)
+        self.ewma_at = now
+
+    def summary(self, current):
+        n = self.n + current.n
+        if n == 0:
+            return None
+        total = self.total + current.total
+        mean = total / n
+        variance = max((self.total_sq + current.total_sq) / n - mean * mean, 0.0)
+        lo = min(self.mins[0].lo if self.mins else math.inf, current.lo)
+        hi = max(self.maxs[0].hi if self.maxs else -math.inf, current.hi)
+
+        hist = dict(self.hist)
+        for key, freq in current.hist.items():
+            hist[key] = hist.get(key, 0) + freq
+        result = {
+            "samples": n,
+            "mean": round(mean, 3),
+            "variance": round(variance, 3),
+            "stddev": round(math.sqrt(variance), 3),
+            "min": lo,
+            "max": hi,
+            "ewma": round(self.ewma, 3),
+        }
+        result.update(_percentiles(hist, n))
+        return result
+
+def _percentiles(hist, n):
+    out = {}
+    targets = [(p, math.ceil(p / 100.0 * n)) for p in PERCENTILES]
+    seen = 0
+    i = 0
+    for value in sorted(hist):
+        seen += hist[value]
+        while i < len(targets) and seen >= targets[i][1]:
+            out[f"p{targets[i][0]}"] = value
+            i += 1
+        if i == len(targets):
+            break
+    return out
+
+class _Series:
+    """All windows of one zone"""
+
+    def __init__(self, now):
+        self.windows = {name: _Window(span) for name, span in WINDOWS.items()}
+        self.current = _Bucket(self._bucket_start(now))
+        self.last_seen = now
+
+    @staticmethod
+    def _bucket_start(now):
+        return now - (now % BUCKET_SECONDS)
+
+    def add(self, value, now):
+        if now - self.current.start >= BUCKET_SECONDS:
+            self._roll(now)
+        self.current.add(value)
+        for window in self.windows.values():
+            window.update_ewma(value, now)
+        self.last_seen = now
+
+    def _roll(self, now):
+        if self.current.n:
+            for window in self.windows.values():
+                window.push(self.current)
+        self.current = _Bucket(self._bucket_start(now))
+        for window in self.windows.values():
+            window.expire(now)
+
+    def summary(self, now):
+        if now - self.current.start >= BUCKET_SECONDS:
+            self._roll(now)
+        return {name: window.summary(self.current) for name, window in self.windows.items()}
+
+class RollingStats:
+    """Thread-safe collection of per-zone series; observe() from the video loop, snapshot() from the API"""
+
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+        self._longest = max(WINDOWS.values())
+
+    def observe(self, counts, now=None):
+        """Feed one get_counts_for_api() dict ({"total_people", "zones": {name: count}})"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._add(TOTAL_KEY, counts.get("total_people", 0), now)
+            for zone_name, count in counts.get("zones", {}).items():
+                self._add(zone_name, count, now)
+
+    def _add(self, key, value, now):
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = _Series(now)
+        series.add(value, now)
+
+    def snapshot(self, zone_name=None, now=None):
+        """{"total": {window: stats}, "zones": {name: {window: stats}}}; windows without samples are None"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            # Zones that stopped reporting (deleted) fall out after the longest window
+            for key in [k for k, s in self._series.items() if now - s.last_seen > self._longest]:
+                del self._series[key]
+            if zone_name is not None:
+                series = self._series.get(zone_name)
+                return {"zones": {zone_name: series.summary(now) if series else None}}
+            total = self._series.get(TOTAL_KEY)
+            return {
+                "total": total.summary(now) if total else None,
+                "zones": {name: s.summary(now) for name, s in self._series.items() if name != TOTAL_KEY}
+            }
+
+# Shared instance fed by the video loop
+stats = RollingStats()
+
+def observe(counts, now=None):
+    stats.observe(counts, now)
+
+def snapshot(zone_name=None):
+    return stats.snapshot(zone_name)
@@ -1,17 +1,30 @@
-from ultralytics import YOLO
 import supervision as sv
 import os
+import threading
 
 # Get the correct path to the model
 model_path = os.path.join(os.path.dirname(__file__), "..", "models", "ai_models", "yolov8s.pt")
-model = YOLO(model_path)
+model = None        # loaded by the first detect_people() call, in the process that detects
+_model_lock = threading.Lock()
 tracker = sv.ByteTrack()
 
-def track_people(frame):
-    results = model(frame, imgsz=640, conf=0.5, verbose=False)[0]
+def get_model():
+    """The YOLO model, loaded on first use: with --detect-process only the detect process pays for it"""
+    global model
+    with _model_lock:
+        if model is None:
+            from ultralytics import YOLO
+            model = YOLO(model_path)
+        return model
+
+def detect_people(frame):
+    """Run YOLO on a frame and keep only person detections (stateless, safe to run in another process)"""
+    results = get_model()(frame, imgsz=640, conf=0.5, verbose=False)[0]
     det = sv.Detections.from_ultralytics(results)
-    det = det[det.class_id == 0]  # Only persons
+    return det[det.class_id == 0]  # Only persons
 
+def update_tracks(det):
+    """Feed person detections to the tracker (stateful: call once per frame, in order)"""
     tracked = tracker.update_with_detections(det)
 
     people = []
@@ -23,4 +36,7 @@ def track_people(frame):
             "bbox": (x1, y1, x2, y2),
             "centroid": (cx, cy)
         })
-    return people
\ No newline at end of file
+    return people
+
+def track_people(frame):
+    return update_tracks(detect_people(frame))
@@ -0,0 +1,375 @@
+"""
+Trajectory Store
+Keeps the paths of tracked people instead of dropping them after every frame.
+Each point is (t, track id, cx, cy, w, h); a track keeps at most one point per
+MIN_INTERVAL seconds unless it moved MIN_MOVE pixels, so a person standing
+still costs five points a second, not thirty.
+
+Points are appended to preallocated numpy columns (CHUNK_ROWS rows). A full
+chunk, or one older than FLUSH_INTERVAL, is sorted by track and time and
+written as a compressed segment:
+
+    shared/trajectories/camera<id>/<t_min ms>-<t_max ms>-<id_min>-<id_max>.npz
+
+Segment names are the index: a query opens only the segments whose time (and
+track id) range overlaps it. Memory is one chunk plus the last point of each
+live track; segments older than RETENTION_DAYS are deleted.
+"""
+
+import functools
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from detection_log import PERSON
+
+backend_dir = os.path.dirname(os.path.dirname(__file__))
+TRAJECTORY_DIR = os.path.join(os.path.dirname(backend_dir), "shared", "trajectories")
+
+CHUNK_ROWS = 65536         # points held in memory before a segment is written
+FLUSH_INTERVAL = 60.0      # seconds a point can wait in memory
+MIN_INTERVAL = 0.2         # seconds between kept points of one track
+MIN_MOVE = 25              # pixels of movement that keep a point early
+TRACK_TTL = 30.0           # seconds before a vanished track's last point is forgotten
+HOLD = 1.0                 # seconds a kept point stands for when resampling to frames
+RETENTION_DAYS = 7
+SEGMENT_CACHE = 8          # decoded segments kept for repeated queries
+
+COLUMNS = ("t", "id", "cx", "cy", "w", "h")
+_DTYPES = {"t": np.float64, "id": np.int32, "cx": np.int16, "cy": np.int16, "w": np.int16, "h": np.int16}
+
+_stores = {}   # {camera_id: writable TrajectoryStore} of this process
+_stores_lock = threading.Lock()
+
+def _empty():
+    return {name: np.empty(0, dtype=_DTYPES[name]) for name in COLUMNS}
+
+@functools.lru_cache(maxsize=SEGMENT_CACHE)
+def _load_segment(path):
+    """Columns of a segment, sorted by (id, t); segments never change once written"""
+    with np.load(path) as data:
+        columns = {name: data[name] for name in COLUMNS if name != "t"}
+        columns["t"] = data["t_base"][0] + data["t_ms"].astype(np.float64) / 1000.0
+        return columns
+
+class TrajectoryStore:
+    def __init__(self, camera_id=1, directory=None, writable=True, chunk_rows=CHUNK_ROWS,
+                 min_interval=MIN_INTERVAL, min_move=MIN_MOVE, flush_interval=FLUSH_INTERVAL,
+                 retention_days=RETENTION_DAYS):
+        self.camera_id = camera_id
+        self.directory = os.path.join(directory or TRAJECTORY_DIR, f"camera{camera_id}")
+        self.writable = writable
+        self.chunk_rows = chunk_rows
+        self.min_interval = min_interval
+        self.min_move = min_move
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.points_seen = 0
+        self.points_kept = 0
+        self.segments_written = 0
+        self.segments_failed = 0
+        self.points_dropped = 0
+        self._lock = threading.Lock()            # the in-memory chunk and the pending list
+        self._write_lock = threading.Lock()      # one segment written at a time
+        self._columns = {name: np.empty(chunk_rows, dtype=_DTYPES[name]) for name in COLUMNS} if writable else None
+        self._rows = 0
+        self._chunk_started = None
+        self._last = {}      # {track id: (t, cx, cy)} of the last kept point
+        self._pending = []   # chunks taken out of memory but not yet on disk (still readable)
+        self._warned_write = False
+        self._warned_record = False
+        if writable:
+            os.makedirs(self.directory, exist_ok=True)
+
+    # ---------- writing (pipeline) ----------
+
+    def record(self, t, people):
+        """One frame's tracked people (update_tracks() dicts) seen at unix time t"""
+        if not self.writable:
+            raise RuntimeError("This trajectory store is read-only")
+        self.points_seen += len(people)
+        full = []
+        with self._lock:
+            for p in people:
+                tid = p["id"]
+                x1, y1, x2, y2 = p["bbox"]
+                cx, cy = p["centroid"]
+                last = self._last.get(tid)
+                if (last is not None and t - last[0] < self.min_interval
+                        and abs(cx - last[1]) + abs(cy - last[2]) < self.min_move):
+                    continue
+                self._last[tid] = (t, cx, cy)
+                if self._rows == self.chunk_rows:
+                    full.append(self._take_locked())
+                row = self._rows
+                columns = self._columns
+                columns["t"][row] = t
+                columns["id"][row] = tid
+                columns["cx"][row] = cx
+                columns["cy"][row] = cy
+                columns["w"][row] = x2 - x1
+                columns["h"][row] = y2 - y1
+                self._rows += 1
+                self.points_kept += 1
+                if self._chunk_started is None:
+                    self._chunk_started = t
+            if self._chunk_started is not None and t - self._chunk_started >= self.flush_interval:
+                full.append(self._take_locked())
+        # Compressing a chunk takes a while; readers and the next frame only wait for the copy
+        for chunk in full:
+            self._write(chunk)
+
+    def record_item(self, item):
+        """
+        Stage function: a FrameItem's people, stamped with the wall-clock time of its capture.
+        Never raises: the zones, persist and render stages behind it must keep running.
+        """
+        try:
+            self.record(time.time() - (time.monotonic() - item.captured_at), item.people)
+        except Exception as e:
+            if not self._warned_record:
+                print(f"Trajectory record error (further errors not shown): {e}")
+                self._warned_record = True
+
+    def flush(self):
+        with self._lock:
+            chunk = self._take_locked()
+        self._write(chunk)
+
+    def _take_locked(self):
+        """Move the in-memory chunk to the pending list and start a new one (caller holds the lock)"""
+        if not self._rows:
+            return None
+        n = self._rows
+        chunk = {name: self._columns[name][:n].copy() for name in COLUMNS}
+        self._pending.append(chunk)
+        self._rows = 0
+        self._chunk_started = None
+        cutoff = float(chunk["t"].max()) - TRACK_TTL
+        self._last = {tid: last for tid, last in self._last.items() if last[0] >= cutoff}
+        return chunk
+
+    def _write(self, chunk):
+        """Write a taken chunk as a segment; one that cannot be written is dropped, not retried"""
+        if chunk is None:
+            return
+        with self._write_lock:
+            order = np.lexsort((chunk["t"], chunk["id"]))
+            columns = {name: values[order] for name, values in chunk.items()}
+            t = columns["t"]
+            t_min, t_max = float(t.min()), float(t.max())
+            ids = columns["id"]
+            name = f"{int(t_min * 1000)}-{int(math.ceil(t_max * 1000))}-{ids[0]}-{ids[-1]}.npz"
+            path = os.path.join(self.directory, name)
+            tmp_path = path + ".tmp.npz"
+            written = False
+            try:
+                np.savez_compressed(
+                    tmp_path,
+                    t_base=np.array([t_min]),
+                    t_ms=np.round((t - t_min) * 1000).astype(np.int32),
+                    **{key: columns[key] for key in COLUMNS if key != "t"})
+                with self._lock:
+                    # Renamed and unlisted together, so a reader never sees the points twice
+                    os.replace(tmp_path, path)
+                    self._pending = [c for c in self._pending if c is not chunk]
+                written = True
+            except OSError as e:
+                if not self._warned_write:
+                    print(f"Trajectory segment write error, dropping points until writes succeed: {e}")
+                    self._warned_write = True
+            finally:
+                if not written:
+                    with self._lock:
+                        self._pending = [c for c in self._pending if c is not chunk]
+                    self.segments_failed += 1
+                    self.points_dropped += len(t)
+                try:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                except OSError:
+                    pass
+            if written:
+                self.segments_written += 1
+                if self._warned_write:
+                    print("Trajectory segment writes resumed")
+                    self._warned_write = False
+                self._purge(t_max)
+
+    def _purge(self, now):
+        cutoff = (now - self.retention_days * 86400) * 1000
+        for name, t_min, t_max, _, _ in self._segments():
+            if t_max < cutoff:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
+
+    def close(self):
+        if self.writable:
+            self.flush()
+
+    # ---------- reading ----------
+
+    def _segments(self):
+        """(file name, t_min ms, t_max ms, id_min, id_max) of every segment, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        segments = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".npz") or ".tmp" in name:
+                continue
+            try:
+                t_min, t_max, id_min, id_max = (int(part) for part in name[:-4].split("-"))
+            except ValueError:
+                continue
+            segments.append((name, t_min, t_max, id_min, id_max))
+        return sorted(segments, key=lambda s: s[1])
+
+    def rows(self, start=None, end=None, track_ids=None):
+        """Columns of every point in [start, end) (of track_ids), sorted by track and time"""
+        parts = []
+        lo = -math.inf if start is None else start * 1000
+        hi = math.inf if end is None else end * 1000
+        wanted = None if track_ids is None else np.array(sorted(set(track_ids)), dtype=np.int32)
+        memory = []
+        if self.writable:
+            # Listed together with what is in memory: a chunk is either pending or a segment
+            with self._lock:
+                segments = self._segments()
+                n = self._rows
+                memory = self._pending + [{name: self._columns[name][:n].copy() for name in COLUMNS}]
+        else:
+            segments = self._segments()
+        for name, t_min, t_max, id_min, id_max in segments:
+            if t_max < lo or t_min >= hi:
+                continue
+            if wanted is not None and not np.any((wanted >= id_min) & (wanted <= id_max)):
+                continue
+            try:
+                parts.append(_load_segment(os.path.join(self.directory, name)))
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Trajectory segment read error ({name}): {e}")
+        parts.extend(memory)
+        if not parts:
+            return _empty()
+        columns = {name: np.concatenate([part[name] for part in parts]) for name in COLUMNS}
+        keep = np.ones(len(columns["t"]), dtype=bool)
+        if start is not None:
+            keep &= columns["t"] >= start
+        if end is not None:
+            keep &= columns["t"] < end
+        if wanted is not None:
+            keep &= np.isin(columns["id"], wanted)
+        columns = {name: values[keep] for name, values in columns.items()}
+        order = np.lexsort((columns["t"], columns["id"]))
+        return {name: values[order] for name, values in columns.items()}
+
+    def paths(self, start=None, end=None, track_ids=None, limit=None):
+        """{track id: [(t, cx, cy, w, h), ...]} for a time window, at most `limit` tracks (the earliest)"""
+        columns = self.rows(start, end, track_ids)
+        ids = columns["id"]
+        if not len(ids):
+            return {}
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        bounds = np.r_[starts, len(ids)]
+        tracks = [(ids[s], s, e) for s, e in zip(bounds[:-1], bounds[1:])]
+        if limit is not None:
+            tracks = sorted(tracks, key=lambda track: columns["t"][track[1]])[:limit]
+        points = np.column_stack([columns["t"], columns["cx"], columns["cy"], columns["w"], columns["h"]])
+        return {int(tid): [(round(float(t), 3), int(cx), int(cy), int(w), int(h)) for t, cx, cy, w, h in points[s:e]]
+                for tid, s, e in tracks}
+
+    def has_data(self, start, end):
+        lo, hi = start * 1000, end * 1000
+        if any(t_max >= lo and t_min < hi for _, t_min, t_max, _, _ in self._segments()):
+            return True
+        return self.writable and (self._rows > 0 or bool(self._pending))
+
+    def frames(self, start, end, step=None, window=600.0):
+        """
+        The stored points resampled to a frame every `step` seconds (default
+        min_interval): (t, PERSON array) in time order, empty frames included.
+        A point stands until the track's next point, at most HOLD seconds, so
+        downsampled tracks read back as continuous presence. Works through
+        the range `window` seconds at a time.
+        """
+        step = step or self.min_interval
+        first = math.ceil(start / step)
+        last = math.ceil(end / step)        # exclusive
+        per_window = max(1, int(window / step))
+        for w_first in range(first, last, per_window):
+            w_last = min(w_first + per_window, last)
+            yield from self._resample(w_first, w_last, step)
+
+    def _resample(self, g_first, g_last, step):
+        columns = self.rows(g_first * step - HOLD, g_last * step)
+        t, ids = columns["t"], columns["id"]
+        n_grid = g_last - g_first
+        if len(t):
+            next_t = np.r_[t[1:], np.inf]
+            next_t[np.r_[ids[1:] != ids[:-1], True]] = np.inf
+            lo = np.maximum(np.ceil(t / step - 1e-9).astype(np.int64), g_first)
+            hi = np.minimum(np.ceil(next_t / step - 1e-9), np.floor((t + HOLD) / step + 1e-9) + 1)
+            hi = np.minimum(hi, g_last).astype(np.int64)
+            counts = np.maximum(hi - lo, 0)
+            rows = np.repeat(np.arange(len(t)), counts)
+            offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts) - counts, counts)
+            grid = lo[rows] + offsets - g_first
+            order = np.argsort(grid, kind="stable")
+            rows, grid = rows[order], grid[order]
+            people = np.empty(len(rows), dtype=PERSON)
+            w, h = columns["w"][rows].astype(np.int32), columns["h"][rows].astype(np.int32)
+            x1 = columns["cx"][rows].astype(np.int32) - w // 2
+            y1 = columns["cy"][rows].astype(np.int32) - h // 2
+            people["id"], people["x1"], people["y1"] = ids[rows], x1, y1
+            people["x2"], people["y2"] = x1 + w, y1 + h
+            splits = np.searchsorted(grid, np.arange(n_grid + 1))
+        else:
+            people = np.empty(0, dtype=PERSON)
+            splits = np.zeros(n_grid + 1, dtype=np.int64)
+        for k in range(n_grid):
+            yield (g_first + k) * step, people[splits[k]:splits[k + 1]]
+
+    def stats(self):
+        segments = self._segments()
+        size = 0
+        for name, *_ in segments:
+            try:
+                size += os.path.getsize(os.path.join(self.directory, name))
+            except OSError:
+                pass
+        return {
+            "camera_id": self.camera_id,
+            "segments": len(segments),
+            "bytes_on_disk": size,
+            "points_in_memory": self._rows,
+            "points_seen": self.points_seen,
+            "points_kept": self.points_kept,
+            "live_tracks": len(self._last),
+            "segments_written": self.segments_written,
+            "segments_failed": self.segments_failed,
+            "points_dropped": self.points_dropped,
+        }
+
+# ==================== MODULE API ====================
+
+def open_store(camera_id=1, **options):
+    """The writable store of a camera in this process (created on first use)"""
+    with _stores_lock:
+        store = _stores.get(camera_id)
+        if store is None:
+            store = _stores[camera_id] = TrajectoryStore(camera_id, **options)
+        return store
+
+def get_store(camera_id=1):
+    """This process's writable store of the camera, else a read-only view of its segments"""
+    return _stores.get(camera_id) or TrajectoryStore(camera_id, writable=False)
+
+def close_all():
+    with _stores_lock:
+        for store in _stores.values():
+            store.close()
@@ -3,46 +3,11 @@ Simple API Server for CrowdCount Dashboard
 Run this file to start the web server
 """
 import sys
-import os
-
-# Setup paths
-backend_dir = os.path.dirname(__file__)
-sys.path.insert(0, os.path.join(backend_dir, 'services'))
-sys.path.insert(0, os.path.join(backend_dir, 'models'))
-sys.path.insert(0, os.path.join(backend_dir, 'auth'))
-
-print("=" * 60)
-print("🔧 Loading modules...")
-print("=" * 60)
 
 try:
-    # Import API
-    print("📦 Importing API server...")
-    from _archive.api_server_old import app
-    print("✅ API server imported successfully")
-    
-    print("📦 Importing uvicorn...")
-    import uvicorn
-    print("✅ Uvicorn imported successfully")
-    
-    print("=" * 60)
-    print("🚀 Starting CrowdCount API Server...")
-    print("=" * 60)
-    print("📊 Dashboard: http://localhost:8000/static/login.html")
-    print("📖 API Docs: http://localhost:8000/docs")
-    print("🔐 Login Credentials:")
-    print("   Admin: admin / admin123")
-    print("   User:  user / user123")
-    print("=" * 60)
-    print("")
-    
-    # Start server
-    uvicorn.run(
-        app, 
-        host="0.0.0.0", 
-        port=8000,
-        log_level="info"
-    )
+    # Same API as the other entry points, without the video pipeline
+    from run import main
+    main(["--mode", "api-only"] + sys.argv[1:])
     
 except Exception as e:
     print("=" * 60)
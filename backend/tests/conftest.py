@@ -0,0 +1,17 @@
+"""
+Test setup: backend modules on sys.path (as the servers arrange it) and a
+throw-away database, set before anything imports database.py, so tests never
+touch shared/crowd_history.db.
+"""
+
+import os
+import sys
+import tempfile
+
+backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for sub in ("models", "services", "auth"):
+    path = os.path.join(backend_dir, sub)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+os.environ["CROWDCOUNT_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="crowdcount_test_"), "test.db")
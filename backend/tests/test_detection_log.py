@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+
+import detection_log as dl
+
+def person(tid, x=100, y=100):
+    return {"id": tid, "bbox": (x, y, x + 40, y + 100), "centroid": (x + 20, y + 50)}
+
+def write_log(path, frames):
+    recorder = dl.DetectionRecorder(str(path))
+    for seq, people in enumerate(frames):
+        recorder.record(seq, recorder._t0 + seq * 0.1, people)
+    recorder.close()
+    return recorder
+
+def test_round_trip(tmp_path):
+    frames = [[person(1), person(2, 300)], [], [person(3, 500, 200)]]
+    write_log(tmp_path / "a.ccdl", frames)
+    read = list(dl.DetectionLog(str(tmp_path / "a.ccdl")))
+    assert [seq for _, seq, _ in read] == [0, 1, 2]
+    assert [[p["id"] for p in people] for _, _, people in read] == [[1, 2], [], [3]]
+    assert read[0][2][1]["bbox"] == (300, 100, 340, 200)
+
+def test_truncated_tail_reads_up_to_last_whole_frame(tmp_path):
+    path = tmp_path / "cut.ccdl"
+    write_log(path, [[person(i) for i in range(3)] for _ in range(5)])
+    frame_bytes = dl.FRAME.size + 3 * dl.PERSON.itemsize
+    full = os.path.getsize(path)
+    # Cut inside the last frame's people, then inside the last frame's header
+    for cut in (full - dl.PERSON.itemsize, full - frame_bytes + 3):
+        with open(path, "r+b") as f:
+            f.truncate(cut)
+        log = dl.DetectionLog(str(path))
+        assert [seq for _, seq, _ in log.frames(as_arrays=True)] == [0, 1, 2, 3]
+        assert log.info()["frames"] == 4
+
+def test_write_error_stops_recording_without_raising(tmp_path):
+    recorder = dl.DetectionRecorder(str(tmp_path / "full.ccdl"))
+
+    class FullDisk:
+        closed = False
+
+        def write(self, data):
+            raise OSError(28, "No space left on device")
+
+        def close(self):
+            self.closed = True
+
+    recorder._file.close()
+    recorder._file = FullDisk()
+    recorder.record(0, recorder._t0, [person(1)])
+    recorder.record(1, recorder._t0, [person(1)])
+    assert recorder.frames == 0
+    assert "No space left" in recorder.stats()["error"]
+
+def test_people_arrays_round_trip():
+    people = [person(7, 10, 20), person(8, 30, 40)]
+    records = dl.people_to_array(people)
+    assert records.dtype == dl.PERSON
+    assert dl.array_to_people(records) == people
+    assert len(dl.people_to_array([])) == 0 and isinstance(dl.people_to_array([]), np.ndarray)
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import database as db
+
+CAMERA = 77
+BASE = datetime(2024, 3, 1, 12, 0, 0)
+
+@pytest.fixture(scope="module")
+def logged():
+    """Eleven rows, several sharing a timestamp; the total identifies each row"""
+    offsets = [0, 0, 0, 1, 2, 2, 3, 3, 3, 3, 5]
+    for total, offset in enumerate(offsets):
+        db.log_entry(total, {"Entrance": total * 10}, timestamp=BASE + timedelta(seconds=offset), camera_id=CAMERA)
+    assert db.flush_logs()
+    return offsets
+
+def all_pages(limit, **query):
+    rows, cursor, pages = [], None, 0
+    while True:
+        columns, page, cursor = db.get_history_page(camera_id=CAMERA, cursor=cursor, limit=limit, **query)
+        assert len(page) <= limit
+        rows.extend(page)
+        pages += 1
+        if cursor is None:
+            return columns, rows, pages
+
+@pytest.mark.parametrize("descending", [True, False])
+@pytest.mark.parametrize("limit", [1, 3, 4, 20])
+def test_pages_cover_every_row_once_in_order(logged, descending, limit):
+    columns, rows, pages = all_pages(limit, descending=descending)
+    assert columns == ["timestamp", "camera_id", "total_people"]
+    # Rows were logged in time order, so (timestamp, id) order is total order
+    expected = list(range(len(logged)))
+    assert [row[2] for row in rows] == (expected[::-1] if descending else expected)
+    assert pages >= len(logged) // limit
+
+def test_zone_pages_and_range(logged):
+    columns, rows, _ = all_pages(2, zone_name="Entrance", descending=False,
+                                 start=BASE + timedelta(seconds=1), end=BASE + timedelta(seconds=5))
+    assert columns == ["timestamp", "camera_id", "zone", "count"]
+    assert [row[3] for row in rows] == [total * 10 for total in range(3, 10)]
+
+def test_cursor_round_trip_and_garbage():
+    assert db.decode_cursor(db.encode_cursor(BASE, 42)) == (BASE, 42)
+    for cursor in ("", "not a cursor", db.encode_cursor(BASE, 1)[:-3] + "!!"):
+        with pytest.raises(ValueError):
+            db.decode_cursor(cursor)
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+import trajectory_store as ts
+
+BASE = 1_000_000.0
+
+def person(tid, x, y=100):
+    return {"id": tid, "bbox": (x - 10, y - 20, x + 10, y + 20), "centroid": (x, y)}
+
+@pytest.fixture
+def store(tmp_path):
+    return ts.TrajectoryStore(1, directory=str(tmp_path), min_interval=0)
+
+def frame_ids(store, start, end, step=0.2, **options):
+    return [(round(t - BASE, 3), people["id"].tolist()) for t, people in store.frames(start, end, step, **options)]
+
+def test_resample_holds_a_point_until_the_next_one_or_hold(store):
+    store.record(BASE, [person(1, 50)])
+    store.record(BASE + 0.6, [person(1, 80)])
+    frames = list(store.frames(BASE, BASE + 2.2, 0.2))
+    assert [round(t - BASE, 1) for t, _ in frames] == [round(0.2 * k, 1) for k in range(11)]
+    # The first point stands until the second, which stands for HOLD seconds
+    centres = [(people["x1"] + people["x2"]).tolist() for _, people in frames]
+    assert centres[:3] == [[100]] * 3
+    assert centres[3:9] == [[160]] * 6
+    assert centres[9:] == [[], []]
+
+def test_resample_is_the_same_in_small_windows(store):
+    for k in range(40):
+        store.record(BASE + k * 0.25, [person(1, 50 + k), person(2 + k % 3, 400)])
+    whole = frame_ids(store, BASE, BASE + 12)
+    assert frame_ids(store, BASE, BASE + 12, window=0.6) == whole
+    assert frame_ids(store, BASE, BASE + 12, window=1.0) == whole
+
+def test_segments_read_back_like_memory(store):
+    for k in range(30):
+        store.record(BASE + k * 0.3, [person(1, 10 * k), person(9, 500)])
+    in_memory = frame_ids(store, BASE, BASE + 10)
+    store.flush()
+    assert store.stats()["segments"] == 1 and store.stats()["points_in_memory"] == 0
+    assert frame_ids(store, BASE, BASE + 10) == in_memory
+    columns = store.rows(BASE + 3, BASE + 6, track_ids=[1])
+    assert set(columns["id"].tolist()) == {1}
+    assert np.all(np.diff(columns["t"]) > 0)
+
+def test_failed_segment_write_drops_the_chunk_and_keeps_recording(tmp_path, monkeypatch):
+    store = ts.TrajectoryStore(1, directory=str(tmp_path), chunk_rows=4, min_interval=0)
+
+    def no_space(*args, **kwargs):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(ts.np, "savez_compressed", no_space)
+    for k in range(3):
+        store.record(BASE + k, [person(1, 10 * k), person(2, 300)])
+    stats = store.stats()
+    assert stats["segments_failed"] == 1 and stats["points_dropped"] == 4
+    assert stats["points_in_memory"] == 2
+    monkeypatch.undo()
+    store.flush()
+    assert store.stats()["segments_written"] == 1
+    assert len(store.rows()["t"]) == 2